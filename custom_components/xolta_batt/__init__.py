@@ -6,9 +6,12 @@ from homeassistant.const import CONF_PASSWORD, CONF_USERNAME
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import HomeAssistant
 from homeassistant.exceptions import ConfigEntryNotReady
-from homeassistant.helpers import aiohttp_client
 
+from .backfill import DATA_BACKFILLS
 from .const import DOMAIN
+from .poller import async_get_poller
+from .services import async_setup_services
+from .session import async_close_session, async_get_session
 from .xolta_api import XoltaApi
 
 PLATFORMS = ["sensor"]
@@ -21,6 +24,11 @@ async def async_setup(hass: HomeAssistant, config: dict):
     # instance that has been created in the UI.
     hass.data.setdefault(DOMAIN, {})
 
+    # Refreshes all config entries, staggered over the update interval
+    async_get_poller(hass)
+
+    async_setup_services(hass)
+
     return True
 
 
@@ -28,12 +36,14 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up sems from a config entry."""
     api = XoltaApi(
         hass,
-        aiohttp_client.async_create_clientsession(hass),
+        async_get_session(hass),
         entry.data[CONF_USERNAME],
         entry.data[CONF_PASSWORD],
     )
 
-    await api.refresh_tokens()
+    # A stored token that is still valid is used as is, one about to expire is
+    # renewed in the background
+    await api.async_ensure_token()
 
     hass.data[DOMAIN][entry.entry_id] = api
 
@@ -47,6 +57,13 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
 
     if unload_ok:
-        hass.data[DOMAIN].pop(entry.entry_id)
+        api = hass.data[DOMAIN].pop(entry.entry_id)
+        # A running backfill was cancelled with the entry, its progress is stored
+        hass.data.get(DATA_BACKFILLS, {}).pop(entry.entry_id, None)
+        await api.async_flush()
+
+        if not hass.data[DOMAIN]:
+            # Last entry unloaded, close the connections
+            await async_close_session(hass)
 
     return unload_ok
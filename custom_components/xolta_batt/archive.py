@@ -0,0 +1,383 @@
+"""Append-only archive of the telemetry buckets of Xolta sites, on disk."""
+from __future__ import annotations
+
+from array import array
+import asyncio
+from bisect import bisect_right
+from collections.abc import Iterator
+from contextlib import ExitStack
+import csv
+from datetime import datetime
+import logging
+import mmap
+from operator import itemgetter
+import os
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.util import dt as dt_util, slugify
+
+from .aggregation import FIELD_BATTERY, FIELD_CONSUMPTION, FIELD_GRID, FIELD_PV
+from .const import DOMAIN
+from .decode import TelemetryColumns
+
+_LOGGER = logging.getLogger(__name__)
+
+ARCHIVE_DIR = "archive"
+# Rows between the entries of the time index
+ARCHIVE_INDEX_STRIDE = 256
+# Rows per batch read by range scans
+ARCHIVE_READ_ROWS = 4096
+
+# Bucket end times, as whole seconds since the epoch
+END_COLUMN = "end"
+END_TYPECODE = "q"
+# Average power (kW) per field
+FIELD_COLUMNS = {
+    FIELD_PV: "pv",
+    FIELD_CONSUMPTION: "consumption",
+    FIELD_BATTERY: "battery",
+    FIELD_GRID: "grid",
+}
+FIELD_TYPECODE = "f"
+# End time of every ARCHIVE_INDEX_STRIDE-th row
+INDEX_FILE = "index"
+# Buckets older than the last row when they arrived, as whole rows of the end
+# time and the FIELD_COLUMNS values, sorted by end time
+LATE_FILE = "late"
+LATE_TYPECODE = "d"
+LATE_ROW_WIDTH = 1 + len(FIELD_COLUMNS)
+
+
+class SiteArchive:
+    """Telemetry buckets of a site, one file of fixed-width values per column.
+
+    Rows are appended in time order and never rewritten. The end time column is
+    written last, so its length is the number of complete rows. A small index
+    of every ARCHIVE_INDEX_STRIDE-th end time narrows down the rows to search.
+    Reads memory-map the columns and only copy the rows asked for.
+
+    Buckets that arrive after newer ones, such as repaired ones, are inserted in
+    a small file of late rows, which scans merge in.
+
+    Values are in native byte order, which is little-endian on all platforms
+    Home Assistant runs on. All methods do blocking I/O.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _file(self, column: str) -> str:
+        return os.path.join(self.path, f"{column}.bin")
+
+    def _read_column(self, column: str, typecode: str, start_row=0) -> array:
+        """Read a whole column from start_row on."""
+        values = array(typecode)
+        try:
+            with open(self._file(column), "rb") as file:
+                file.seek(start_row * values.itemsize)
+                data = file.read()
+        except FileNotFoundError:
+            return values
+        # Ignore a partially written value
+        values.frombytes(data[: len(data) - len(data) % values.itemsize])
+        return values
+
+    def rows(self) -> int:
+        """Return the number of complete rows."""
+        try:
+            size = os.path.getsize(self._file(END_COLUMN))
+        except FileNotFoundError:
+            return 0
+        return size // array(END_TYPECODE).itemsize
+
+    def append(self, ends, columns) -> int:
+        """Append the buckets newer than the last one archived.
+
+        ends are bucket end timestamps in time order, columns the values per
+        field of FIELD_COLUMNS. Returns the number of rows appended.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        rows = self.rows()
+        first = 0
+        if rows:
+            last_end = self._read_column(END_COLUMN, END_TYPECODE, rows - 1)[0]
+            first = bisect_right(ends, last_end)
+        if first >= len(ends):
+            return 0
+
+        for field, column in FIELD_COLUMNS.items():
+            values = array(FIELD_TYPECODE, columns[field][first:])
+            with open(self._file(column), "ab") as file:
+                # Drop values of rows a crash left incomplete
+                file.truncate(rows * values.itemsize)
+                values.tofile(file)
+
+        new_ends = array(END_TYPECODE, (int(end) for end in ends[first:]))
+        with open(self._file(END_COLUMN), "ab") as file:
+            file.truncate(rows * new_ends.itemsize)
+            new_ends.tofile(file)
+
+        index = self._read_column(INDEX_FILE, END_TYPECODE)
+        indexed_rows = len(index) * ARCHIVE_INDEX_STRIDE
+        if indexed_rows < rows + len(new_ends):
+            all_ends = None
+            if indexed_rows < rows:
+                # Index entries lost in a crash
+                all_ends = self._read_column(END_COLUMN, END_TYPECODE)
+            entries = array(
+                END_TYPECODE,
+                (
+                    all_ends[row] if row < rows else new_ends[row - rows]
+                    for row in range(
+                        indexed_rows, rows + len(new_ends), ARCHIVE_INDEX_STRIDE
+                    )
+                ),
+            )
+            with open(self._file(INDEX_FILE), "ab") as file:
+                file.truncate(len(index) * entries.itemsize)
+                entries.tofile(file)
+        return len(new_ends)
+
+    def insert(self, ends, columns) -> int:
+        """Add buckets in time order, also ones older than the last one archived.
+
+        Older buckets are added to the late rows, which are written to a new file
+        that replaces the old one, so a crash leaves either. Buckets archived
+        already are skipped. Returns the number of rows added.
+        """
+        rows = self.rows()
+        older = 0
+        if rows:
+            last_end = self._read_column(END_COLUMN, END_TYPECODE, rows - 1)[0]
+            older = bisect_right(ends, last_end)
+        added = self.append(ends, columns) if older < len(ends) else 0
+        if not older:
+            return added
+
+        archived = set(self.read(ends[0] - 1, ends[older - 1]).ends)
+        new_rows = [
+            (end, *(columns[field][row] for field in FIELD_COLUMNS))
+            for row, end in enumerate(ends[:older])
+            if end not in archived
+        ]
+        if not new_rows:
+            return added
+        late_rows = sorted([*self._late_rows(float("-inf"), float("inf")), *new_rows])
+        values = array(LATE_TYPECODE, (value for row in late_rows for value in row))
+        path = self._file(LATE_FILE)
+        with open(f"{path}.tmp", "wb") as file:
+            values.tofile(file)
+        os.replace(f"{path}.tmp", path)
+        return added + len(new_rows)
+
+    def _late_rows(self, start: float, end: float) -> list[tuple[float, ...]]:
+        """Return the late rows ending within start - end, as tuples."""
+        values = self._read_column(LATE_FILE, LATE_TYPECODE)
+        rows = [
+            tuple(values[i : i + LATE_ROW_WIDTH])
+            for i in range(0, len(values) - LATE_ROW_WIDTH + 1, LATE_ROW_WIDTH)
+        ]
+        first = bisect_right(rows, start, key=itemgetter(0))
+        last = bisect_right(rows, end, key=itemgetter(0))
+        return rows[first:last]
+
+    def scan(
+        self, start: float, end: float, batch_rows=ARCHIVE_READ_ROWS
+    ) -> Iterator[TelemetryColumns]:
+        """Yield the buckets ending within start - end (timestamps), in batches."""
+        late_rows = self._late_rows(start, end)
+        for batch in self._scan_rows(start, end, batch_rows):
+            if late_rows and late_rows[0][0] <= batch.ends[-1]:
+                count = bisect_right(late_rows, batch.ends[-1], key=itemgetter(0))
+                batch = _merge(batch, late_rows[:count])
+                del late_rows[:count]
+            yield batch
+        if late_rows:
+            yield _merge(TelemetryColumns(), late_rows)
+
+    def _scan_rows(
+        self, start: float, end: float, batch_rows: int
+    ) -> Iterator[TelemetryColumns]:
+        """Yield the appended rows ending within start - end, in batches."""
+        rows = self.rows()
+        if not rows:
+            return
+        index = self._read_column(INDEX_FILE, END_TYPECODE)
+
+        with ExitStack() as stack:
+            ends = _map(stack, self._file(END_COLUMN), END_TYPECODE, rows)
+            first = _find(ends, index, start)
+            last = _find(ends, index, end)
+            if first >= last:
+                return
+            columns = {
+                field: _map(stack, self._file(column), FIELD_TYPECODE, rows)
+                for field, column in FIELD_COLUMNS.items()
+            }
+            for batch_start in range(first, last, batch_rows):
+                batch_end = min(batch_start + batch_rows, last)
+                telemetry = TelemetryColumns()
+                telemetry.ends.extend(ends[batch_start:batch_end])
+                for field, column in columns.items():
+                    telemetry.columns[field].extend(column[batch_start:batch_end])
+                yield telemetry
+
+    def read(self, start: float, end: float) -> TelemetryColumns:
+        """Return the buckets ending within start - end (timestamps)."""
+        telemetry = TelemetryColumns()
+        for batch in self.scan(start, end):
+            telemetry.ends.extend(batch.ends)
+            for field, column in telemetry.columns.items():
+                column.extend(batch.columns[field])
+        return telemetry
+
+    def export_csv(self, start: float, end: float, path: str) -> int:
+        """Write the buckets ending within start - end to a CSV file. Returns the rows."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        rows = 0
+        with open(path, "w", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            writer.writerow(
+                ["utc_end_time", *(f"{column}_kw" for column in FIELD_COLUMNS.values())]
+            )
+            for batch in self.scan(start, end):
+                columns = [batch.columns[field] for field in FIELD_COLUMNS]
+                writer.writerows(
+                    (
+                        dt_util.utc_from_timestamp(batch_end).isoformat(),
+                        *(round(column[row], 3) for column in columns),
+                    )
+                    for row, batch_end in enumerate(batch.ends)
+                )
+                rows += len(batch)
+        return rows
+
+
+def _map(stack: ExitStack, path: str, typecode: str, rows: int) -> memoryview:
+    """Memory-map the first rows of a column file, unmapped when the stack closes."""
+    file = stack.enter_context(open(path, "rb"))
+    mapped = stack.enter_context(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+    with memoryview(mapped) as view:
+        values = view[: rows * array(typecode).itemsize].cast(typecode)
+    # The map can only be closed once nothing refers to it
+    stack.callback(values.release)
+    return values
+
+
+def _merge(batch: TelemetryColumns, late_rows) -> TelemetryColumns:
+    """Return the buckets of a batch and of late rows, in time order."""
+    columns = [batch.columns[field] for field in FIELD_COLUMNS]
+    merged = TelemetryColumns()
+    for end, *values in sorted([*zip(batch.ends, *columns), *late_rows]):
+        merged.ends.append(end)
+        for field, value in zip(FIELD_COLUMNS, values):
+            merged.columns[field].append(value)
+    return merged
+
+
+def _find(ends: memoryview, index: array, timestamp: float) -> int:
+    """Return the first row ending after timestamp, searching the index first."""
+    block = bisect_right(index, timestamp)
+    low = max(0, (block - 1) * ARCHIVE_INDEX_STRIDE)
+    high = len(ends)
+    if block < len(index):
+        high = min(high, block * ARCHIVE_INDEX_STRIDE)
+    return bisect_right(ends, timestamp, low, max(low, high))
+
+
+class TelemetryArchive:
+    """Archives of the sites of an account.
+
+    Appends are queued on the event loop, and written by a single executor job at
+    a time, so a slow disk never holds up a refresh.
+    """
+
+    def __init__(self, hass: HomeAssistant, key_suffix: str):
+        self._hass = hass
+        self.path = hass.config.path(DOMAIN, ARCHIVE_DIR, key_suffix)
+        # Buckets waiting to be written, as (site, ends, columns, late)
+        self._pending: list[tuple[str, array, dict[str, array], bool]] = []
+        self._writing: asyncio.Future | None = None
+
+    def site(self, site_id: str) -> SiteArchive:
+        """Return the archive of a site."""
+        return SiteArchive(os.path.join(self.path, slugify(site_id)))
+
+    @callback
+    def async_append(
+        self,
+        site_id: str,
+        telemetry: TelemetryColumns,
+        from_utc: datetime,
+        to_utc: datetime,
+        late: bool = False,
+    ):
+        """Queue the buckets ending within from_utc - to_utc for writing.
+
+        With late, also those older than the last one archived, such as repaired
+        buckets.
+        """
+        ends = telemetry.ends
+        first = bisect_right(ends, from_utc.timestamp())
+        last = bisect_right(ends, to_utc.timestamp())
+        if first >= last:
+            return
+        self._pending.append(
+            (
+                site_id,
+                ends[first:last],
+                {field: telemetry.columns[field][first:last] for field in FIELD_COLUMNS},
+                late,
+            )
+        )
+        if self._writing is None:
+            self._write_pending()
+
+    @callback
+    def _write_pending(self):
+        """Start writing the queued buckets."""
+        pending, self._pending = self._pending, []
+        self._writing = self._hass.async_add_executor_job(self._write, pending)
+        self._writing.add_done_callback(self._write_done)
+
+    def _write(self, pending):
+        for site_id, ends, columns, late in pending:
+            archive = self.site(site_id)
+            if late:
+                archive.insert(ends, columns)
+            else:
+                archive.append(ends, columns)
+
+    @callback
+    def _write_done(self, future: asyncio.Future):
+        self._writing = None
+        if not future.cancelled() and (err := future.exception()) is not None:
+            _LOGGER.warning("Unable to archive Xolta telemetry: %s", err)
+        if self._pending:
+            self._write_pending()
+
+    async def async_flush(self):
+        """Wait until the queued buckets are written."""
+        while self._writing is not None:
+            await asyncio.wait([self._writing])
+
+    async def async_read(
+        self, site_id: str, from_utc: datetime, to_utc: datetime
+    ) -> TelemetryColumns:
+        """Return the archived buckets of a site ending within from_utc - to_utc."""
+        await self.async_flush()
+        return await self._hass.async_add_executor_job(
+            self.site(site_id).read, from_utc.timestamp(), to_utc.timestamp()
+        )
+
+    async def async_export_csv(
+        self, site_id: str, from_utc: datetime, to_utc: datetime, path: str
+    ) -> int:
+        """Write the archived buckets of a site ending within from_utc - to_utc to a CSV file."""
+        await self.async_flush()
+        return await self._hass.async_add_executor_job(
+            self.site(site_id).export_csv,
+            from_utc.timestamp(),
+            to_utc.timestamp(),
+            path,
+        )
@@ -0,0 +1,334 @@
+"""Import of historical Xolta telemetry as long-term statistics."""
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from collections.abc import AsyncIterator
+from datetime import date, datetime, timedelta
+import logging
+
+from homeassistant.components.recorder import get_instance
+from homeassistant.components.recorder.models import StatisticData, StatisticMetaData
+from homeassistant.components.recorder.statistics import (
+    async_add_external_statistics,
+    get_last_statistics,
+    statistics_during_period,
+)
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import UnitOfEnergy
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util, slugify
+
+from .aggregation import ENERGY_KEYS, grouped_energy, hour_group
+from .const import DOMAIN, ENERGY_PUBLISH_DELAY_SEC, ENERGY_RESOLUTION_MIN
+from .decode import TelemetryColumns
+from .xolta_api import XoltaApi
+
+_LOGGER = logging.getLogger(__name__)
+
+DATA_BACKFILLS = "xolta_batt_backfills"
+
+BACKFILL_STORAGE_KEY_PREFIX = "xolta_batt_backfill_"
+BACKFILL_STORAGE_VERSION = 1
+# Days of telemetry per GetDataSummary request
+BACKFILL_CHUNK_DAYS = 7
+# Chunks of a backfill requested ahead of the one being imported
+BACKFILL_MAX_IN_FLIGHT = 2
+# Periods before and after a range searched for the statistics next to it, the
+# last one unbounded
+BACKFILL_LOOKAROUND = (timedelta(days=1), timedelta(days=31), None)
+
+STATISTIC_NAMES = {
+    "pv": "PV energy",
+    "consumption": "Energy consumption",
+    "battery_charged": "Battery energy charged",
+    "battery_discharged": "Battery energy discharged",
+    "grid_exported": "Grid energy exported",
+    "grid_imported": "Grid energy imported",
+}
+
+
+def statistic_id(site_id: str, key: str) -> str:
+    """Return the id of the external statistic of an energy key of a site."""
+    return f"{DOMAIN}:{slugify(site_id)}_{key}"
+
+
+async def async_iter_telemetry(
+    api: XoltaApi,
+    site_id: str,
+    start: datetime,
+    end: datetime,
+    chunk: timedelta = timedelta(days=BACKFILL_CHUNK_DAYS),
+    max_in_flight: int = BACKFILL_MAX_IN_FLIGHT,
+) -> AsyncIterator[tuple[datetime, TelemetryColumns]]:
+    """Yield (chunk end, buckets) for consecutive chunks of start - end, in order.
+
+    The next chunks are requested while the caller handles the current one, up
+    to max_in_flight at a time. Only those chunks are held in memory, however
+    long the range.
+    """
+    in_flight: deque[tuple[datetime, asyncio.Task[TelemetryColumns]]] = deque()
+    try:
+        chunk_start = start
+        while chunk_start < end or in_flight:
+            while chunk_start < end and len(in_flight) < max_in_flight:
+                chunk_end = min(chunk_start + chunk, end)
+                in_flight.append(
+                    (
+                        chunk_end,
+                        asyncio.create_task(
+                            api.async_get_telemetry(site_id, chunk_start, chunk_end)
+                        ),
+                    )
+                )
+                chunk_start = chunk_end
+            chunk_end, task = in_flight.popleft()
+            yield chunk_end, await task
+    finally:
+        for _, task in in_flight:
+            task.cancel()
+        await asyncio.gather(*(task for _, task in in_flight), return_exceptions=True)
+
+
+def _sums_before(
+    hass: HomeAssistant, statistic_ids: dict[str, str], start: datetime
+) -> dict[str, float]:
+    """Return the sum per energy key of the last statistic before start, 0 if none.
+
+    Runs in the recorder executor.
+    """
+    sums = dict.fromkeys(statistic_ids, 0.0)
+    missing = {}
+    for key, stat_id in statistic_ids.items():
+        last = get_last_statistics(hass, 1, stat_id, False, {"sum"}).get(stat_id)
+        if last and last[0]["start"] < start.timestamp():
+            sums[key] = last[0]["sum"] or 0.0
+        elif last:
+            # A later range was imported before
+            missing[key] = stat_id
+    for lookback in BACKFILL_LOOKAROUND:
+        if not missing:
+            break
+        rows = statistics_during_period(
+            hass,
+            start - lookback if lookback else dt_util.utc_from_timestamp(0),
+            start,
+            set(missing.values()),
+            "hour",
+            None,
+            {"sum"},
+        )
+        for key, stat_id in list(missing.items()):
+            if stat_rows := rows.get(stat_id):
+                sums[key] = stat_rows[-1]["sum"] or 0.0
+                del missing[key]
+    return sums
+
+
+def _sums_after(
+    hass: HomeAssistant, statistic_ids: dict[str, str], end: datetime
+) -> dict[str, float | None]:
+    """Return the sum per energy key before the first statistic from end on.
+
+    None if there is none. Its state is the energy of its hour, which is taken off
+    its sum. Runs in the recorder executor.
+    """
+    sums: dict[str, float | None] = dict.fromkeys(statistic_ids)
+    missing = dict(statistic_ids)
+    for lookahead in BACKFILL_LOOKAROUND:
+        if not missing:
+            break
+        rows = statistics_during_period(
+            hass,
+            end,
+            lookahead and end + lookahead,
+            set(missing.values()),
+            "hour",
+            None,
+            {"state", "sum"},
+        )
+        for key, stat_id in list(missing.items()):
+            if stat_rows := rows.get(stat_id):
+                first = stat_rows[0]
+                sums[key] = (first["sum"] or 0.0) - (first["state"] or 0.0)
+                del missing[key]
+    return sums
+
+
+class Backfill:
+    """Imports the telemetry of the sites of a config entry over a date range.
+
+    Hourly energy is added as external statistics, one per site and energy key,
+    which the energy dashboard can use. The sums continue from the statistics
+    before the range, and those after it are shifted to continue from the
+    range, so the range can be imported in any order. Progress is stored after each chunk, so
+    a backfill of the same dates that was interrupted resumes where it stopped,
+    skipping the sites it had finished.
+    A backfill without an end date runs up to the current hour, however late it
+    is resumed.
+    """
+
+    def __init__(self, hass: HomeAssistant, entry: ConfigEntry, api: XoltaApi):
+        self._hass = hass
+        self._entry = entry
+        self._api = api
+        self._store = Store(
+            hass,
+            BACKFILL_STORAGE_VERSION,
+            BACKFILL_STORAGE_KEY_PREFIX + api.storage_key_suffix,
+        )
+        self.task: asyncio.Task | None = None
+
+    @callback
+    def async_start(
+        self, start_date: date, end_date: date | None = None
+    ) -> asyncio.Task:
+        """Start importing the local days start_date to end_date (inclusive).
+
+        Without an end date, up to the current hour.
+        """
+        if self.task is not None and not self.task.done():
+            raise HomeAssistantError(
+                f"A backfill of {self._entry.title} is already running"
+            )
+        start = dt_util.as_utc(dt_util.start_of_local_day(start_date))
+        # Statistics are hourly, in UTC
+        start = start.replace(minute=0)
+        # Only hours whose buckets have all been published
+        end = dt_util.utcnow() - timedelta(seconds=ENERGY_PUBLISH_DELAY_SEC)
+        if end_date is not None:
+            end = min(
+                end,
+                dt_util.as_utc(dt_util.start_of_local_day(end_date + timedelta(days=1))),
+            )
+        end = end.replace(minute=0, second=0, microsecond=0)
+        if end <= start:
+            raise HomeAssistantError("Nothing to backfill before the current hour")
+
+        # Checkpoints are kept per requested dates, the end may have moved since
+        dates = {
+            "start_date": start_date.isoformat(),
+            "end_date": end_date and end_date.isoformat(),
+        }
+        self.task = self._entry.async_create_background_task(
+            self._hass,
+            self._async_run(dates, start, end),
+            f"xolta_batt backfill {self._entry.entry_id}",
+        )
+        return self.task
+
+    async def _async_run(
+        self, dates: dict[str, str | None], start: datetime, end: datetime
+    ):
+        """Import all sites, one after the other."""
+        checkpoints = await self._store.async_load() or {}
+        for site_id in self._api.sites:
+            checkpoint = checkpoints.get(site_id)
+            if checkpoint is None or any(
+                checkpoint.get(key) != value for key, value in dates.items()
+            ):
+                checkpoint = checkpoints[site_id] = {
+                    **dates,
+                    "next": start.timestamp(),
+                    "sums": None,
+                    "done": False,
+                }
+            elif checkpoint.get("done"):
+                continue
+            else:
+                _LOGGER.info(
+                    "Resuming backfill of Xolta site %s from %s",
+                    site_id,
+                    dt_util.utc_from_timestamp(checkpoint["next"]),
+                )
+
+            try:
+                await self._async_backfill_site(site_id, checkpoint, checkpoints, end)
+            except Exception as err:  # pylint: disable=broad-except
+                _LOGGER.error("Backfill of Xolta site %s stopped: %s", site_id, err)
+                return
+
+            # Kept until all sites are done, so a resume skips this one
+            checkpoint["done"] = True
+            await self._store.async_save(checkpoints)
+            _LOGGER.info("Backfill of Xolta site %s done", site_id)
+
+        await self._store.async_remove()
+
+    async def _async_backfill_site(self, site_id, checkpoint, checkpoints, end):
+        """Import the chunks of a site from the checkpoint on, updating it."""
+        statistic_ids = {key: statistic_id(site_id, key) for key in ENERGY_KEYS}
+        recorder = get_instance(self._hass)
+        chunk_start = dt_util.utc_from_timestamp(checkpoint["next"])
+        sums = checkpoint["sums"]
+        if sums is None:
+            sums = await recorder.async_add_executor_job(
+                _sums_before, self._hass, statistic_ids, chunk_start
+            )
+
+        async for chunk_end, telemetry in async_iter_telemetry(
+            self._api, site_id, chunk_start, end
+        ):
+            statistics = {key: [] for key in ENERGY_KEYS}
+            for hour, energy in grouped_energy(
+                telemetry,
+                chunk_start.timestamp(),
+                chunk_end.timestamp(),
+                hour_group,
+                ENERGY_RESOLUTION_MIN,
+            ):
+                hour_start = dt_util.utc_from_timestamp(hour)
+                for key, value in energy.items():
+                    sums[key] += value
+                    statistics[key].append(
+                        StatisticData(start=hour_start, state=value, sum=sums[key])
+                    )
+            for key, rows in statistics.items():
+                if rows:
+                    async_add_external_statistics(
+                        self._hass,
+                        StatisticMetaData(
+                            has_mean=False,
+                            has_sum=True,
+                            name=f"{site_id} {STATISTIC_NAMES[key]}",
+                            source=DOMAIN,
+                            statistic_id=statistic_ids[key],
+                            unit_of_measurement=UnitOfEnergy.KILO_WATT_HOUR,
+                        ),
+                        rows,
+                    )
+
+            # Only record progress once the recorder has written the chunk
+            await recorder.async_block_till_done()
+            checkpoint["next"] = chunk_end.timestamp()
+            checkpoint["sums"] = sums
+            await self._store.async_save(checkpoints)
+            chunk_start = chunk_end
+
+        # Statistics imported earlier for a later range continue from this one.
+        # Shifting them again after an interruption shifts them by 0.
+        sums_after = await recorder.async_add_executor_job(
+            _sums_after, self._hass, statistic_ids, end
+        )
+        for key, sum_after in sums_after.items():
+            if sum_after is not None and abs(sums[key] - sum_after) > 1e-6:
+                recorder.async_adjust_statistics(
+                    statistic_ids[key],
+                    end,
+                    sums[key] - sum_after,
+                    UnitOfEnergy.KILO_WATT_HOUR,
+                )
+        await recorder.async_block_till_done()
+
+
+@callback
+def async_get_backfill(hass: HomeAssistant, entry: ConfigEntry) -> Backfill:
+    """Return the backfill of a loaded config entry, creating it if needed."""
+    backfills = hass.data.setdefault(DATA_BACKFILLS, {})
+    if (backfill := backfills.get(entry.entry_id)) is None:
+        backfill = backfills[entry.entry_id] = Backfill(
+            hass, entry, hass.data[DOMAIN][entry.entry_id]
+        )
+    return backfill
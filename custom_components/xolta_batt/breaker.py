@@ -0,0 +1,170 @@
+"""Per-host circuit breaker for the Xolta services."""
+from __future__ import annotations
+
+import asyncio
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+import logging
+import random
+import time
+
+import aiohttp
+from aiohttp.hdrs import RETRY_AFTER
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.util import dt as dt_util
+from yarl import URL
+
+_LOGGER = logging.getLogger(__name__)
+
+DATA_BREAKERS = "xolta_batt_breakers"
+
+# Consecutive failures after which requests to a host fail fast
+BREAKER_FAILURE_THRESHOLD = 3
+# Backoff after the breaker opens, doubled each time a probe fails
+BREAKER_BACKOFF_MIN_SEC = 30
+BREAKER_BACKOFF_MAX_SEC = 900
+# Longest Retry-After that is honored
+RETRY_AFTER_MAX_SEC = 3600
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(HomeAssistantError):
+    """Error to indicate a request was not sent because the host is backing off."""
+
+
+class CircuitBreaker:
+    """Fails requests to a host fast while it is down.
+
+    After BREAKER_FAILURE_THRESHOLD consecutive connection errors, timeouts, 5xx
+    or 429 responses the breaker opens for a jittered, exponentially growing
+    backoff, or for the Retry-After of a 429 or 503 response. After that, a single
+    probe request is let through (half-open). Its success closes the breaker,
+    its failure opens it again with a longer backoff.
+    """
+
+    def __init__(self, host: str):
+        self.host = host
+        self.state = STATE_CLOSED
+        self.failures = 0
+        # Times the breaker opened since it was last closed
+        self._opened = 0
+        # time.monotonic() at which a probe may be sent
+        self._reopen_at = 0.0
+        self._probing = False
+
+    @property
+    def retry_in(self) -> float:
+        """Return the seconds until a probe may be sent, 0 if not open."""
+        if self.state != STATE_OPEN:
+            return 0.0
+        return max(0.0, self._reopen_at - time.monotonic())
+
+    @contextmanager
+    def request(self):
+        """Guard a request. Raise CircuitOpenError instead of sending it if backing off."""
+        self._before_request()
+        try:
+            yield
+        except aiohttp.ClientResponseError as err:
+            if err.status >= 500 or err.status == 429:
+                self._record_failure(_retry_after(err))
+            else:
+                # The host is up, the request was wrong
+                self._record_success()
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self._record_failure()
+            raise
+        except BaseException:
+            # Cancelled, or failed processing the response. Says nothing about the host.
+            self._probing = False
+            raise
+        self._record_success()
+
+    def _before_request(self):
+        if self.state == STATE_CLOSED:
+            return
+        if self.state == STATE_OPEN:
+            if time.monotonic() < self._reopen_at:
+                raise CircuitOpenError(
+                    f"{self.host} is unavailable, retrying in {self.retry_in:.0f} s"
+                )
+            self.state = STATE_HALF_OPEN
+        if self._probing:
+            raise CircuitOpenError(f"{self.host} is unavailable, waiting for a probe")
+        self._probing = True
+
+    def _record_success(self):
+        if self.state != STATE_CLOSED:
+            _LOGGER.info("%s is available again", self.host)
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self._opened = 0
+        self._probing = False
+
+    def _record_failure(self, retry_after: float | None = None):
+        self.failures += 1
+        self._probing = False
+        if self.state == STATE_OPEN and retry_after is None:
+            # A request sent before the breaker opened
+            return
+        if (
+            retry_after is None
+            and self.state == STATE_CLOSED
+            and self.failures < BREAKER_FAILURE_THRESHOLD
+        ):
+            return
+
+        if retry_after is not None:
+            backoff = retry_after
+        else:
+            backoff = min(
+                BREAKER_BACKOFF_MAX_SEC, BREAKER_BACKOFF_MIN_SEC * 2**self._opened
+            )
+            # Spread the probes of clients that failed together
+            backoff *= random.uniform(0.5, 1.0)
+        self._opened += 1
+        self._reopen_at = time.monotonic() + backoff
+        if self.state != STATE_OPEN:
+            _LOGGER.warning(
+                "%s is unavailable, backing off for %.0f s", self.host, backoff
+            )
+        self.state = STATE_OPEN
+
+    def as_dict(self):
+        """Return the state as a dict."""
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "retry_in": round(self.retry_in),
+        }
+
+
+@callback
+def async_get_breaker(hass: HomeAssistant, url: str) -> CircuitBreaker:
+    """Return the breaker of the host of url, shared by all XoltaApi instances."""
+    host = URL(url).host
+    breakers = hass.data.setdefault(DATA_BREAKERS, {})
+    if (breaker := breakers.get(host)) is None:
+        breaker = breakers[host] = CircuitBreaker(host)
+    return breaker
+
+
+def _retry_after(err: aiohttp.ClientResponseError) -> float | None:
+    """Return the Retry-After (seconds) of a 429 or 503 response, if any."""
+    if err.status not in (429, 503) or err.headers is None:
+        return None
+    if (value := err.headers.get(RETRY_AFTER)) is None:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = (parsedate_to_datetime(value) - dt_util.utcnow()).total_seconds()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), RETRY_AFTER_MAX_SEC)
@@ -0,0 +1,100 @@
+"""Persistent cache of Xolta sites and telemetry, so restarts resume where they left off."""
+from __future__ import annotations
+
+import logging
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
+
+from .energy import EnergyAccumulator
+
+_LOGGER = logging.getLogger(__name__)
+
+CACHE_STORAGE_KEY_PREFIX = "xolta_batt_cache_"
+CACHE_STORAGE_VERSION = 1
+CACHE_STORAGE_MINOR_VERSION = 3
+# Seconds to wait before writing, so several refreshes result in one write
+CACHE_SAVE_DELAY = 30
+# Re-read the sites after this many seconds
+SITES_MAX_AGE = 24 * 60 * 60
+
+
+class _CacheStore(Store):
+    """Store that drops cached data it doesn't know how to migrate."""
+
+    async def _async_migrate_func(self, old_major_version, old_minor_version, old_data):
+        """Migrate to the current version."""
+        if old_major_version == CACHE_STORAGE_VERSION:
+            # Minor versions only add fields
+            return old_data
+
+        # The cache can always be rebuilt from the Xolta API
+        _LOGGER.debug(
+            "Discarding Xolta cache of unknown version %s.%s",
+            old_major_version,
+            old_minor_version,
+        )
+        return {}
+
+
+class TelemetryCache:
+    """Sites and per-site telemetry of the current day, stored next to the auth tokens."""
+
+    def __init__(self, hass: HomeAssistant, key_suffix: str):
+        self._store = _CacheStore(
+            hass,
+            CACHE_STORAGE_VERSION,
+            CACHE_STORAGE_KEY_PREFIX + key_suffix,
+            minor_version=CACHE_STORAGE_MINOR_VERSION,
+        )
+        self._sites = None
+        self._sites_ts = None
+        self._accumulators: dict[str, EnergyAccumulator] = {}
+        self._dirty = False
+
+    async def async_load(self):
+        """Return the cached sites (or None) and energy accumulators per site."""
+        data = await self._store.async_load() or {}
+
+        accumulators = {}
+        for site_id, telemetry in data.get("telemetry", {}).items():
+            try:
+                accumulators[site_id] = EnergyAccumulator.from_cache(telemetry)
+            except (KeyError, TypeError, ValueError) as err:
+                _LOGGER.debug("Ignoring cached telemetry of site %s: %s", site_id, err)
+
+        sites_ts = data.get("sites_ts")
+        if sites_ts is None or dt_util.utcnow().timestamp() - sites_ts > SITES_MAX_AGE:
+            return None, accumulators
+
+        self._sites = data.get("sites")
+        self._sites_ts = sites_ts
+        return self._sites, accumulators
+
+    def async_schedule_save(self, sites, accumulators: dict[str, EnergyAccumulator]):
+        """Save sites and telemetry after a delay, coalescing repeated calls."""
+        if sites is not self._sites:
+            self._sites = sites
+            self._sites_ts = dt_util.utcnow().timestamp()
+        self._accumulators = accumulators
+        self._dirty = True
+        self._store.async_delay_save(self._data_to_save, CACHE_SAVE_DELAY)
+
+    async def async_flush(self):
+        """Write a pending delayed save now."""
+        if self._dirty:
+            await self._store.async_save(self._data_to_save())
+
+    def _data_to_save(self):
+        """Return the data to store."""
+        self._dirty = False
+        return {
+            "sites": self._sites,
+            "sites_ts": self._sites_ts,
+            "telemetry": {
+                site_id: cached
+                for site_id, accumulator in self._accumulators.items()
+                if (cached := accumulator.to_cache()) is not None
+            },
+        }
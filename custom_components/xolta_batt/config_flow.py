@@ -8,10 +8,10 @@ from homeassistant.const import CONF_PASSWORD, CONF_USERNAME
 from homeassistant.config_entries import ConfigFlow, CONN_CLASS_CLOUD_POLL
 from homeassistant.core import HomeAssistant
 from homeassistant.data_entry_flow import FlowResult
-from homeassistant.helpers import aiohttp_client
 from homeassistant.exceptions import ConfigEntryAuthFailed
 
 from .const import DOMAIN, XOLTA_CONFIG_SCHEMA
+from .session import async_get_session
 from .xolta_api import XoltaApi
 
 _LOGGER = logging.getLogger(__name__)
@@ -50,7 +50,7 @@ class XoltaBatteryFlowHandler(ConfigFlow, domain=DOMAIN):
 
         api = XoltaApi(
             self.hass,
-            aiohttp_client.async_create_clientsession(self.hass),
+            async_get_session(self.hass),
             self._username,
             self._password,
         )
@@ -58,6 +58,8 @@ class XoltaBatteryFlowHandler(ConfigFlow, domain=DOMAIN):
         try:
             authenticated = await api.test_authentication()
             if authenticated:
+                # Store the tokens now, so setting up the entry doesn't exchange them again
+                await api.async_flush()
                 return None
             errors["base"] = "invalid_auth"
         except ConfigEntryAuthFailed as ex:
@@ -4,6 +4,22 @@ from homeassistant.const import CONF_PASSWORD, CONF_USERNAME
 
 DOMAIN = "xolta_batt"
 UPDATE_INTERVAL_SEC = 60
+# Poll siteStatus this often when there is no PV and the battery is idle
+STATUS_IDLE_INTERVAL_SEC = 300
+# Maximum number of requests in flight per account when fetching sites concurrently
+MAX_CONCURRENT_REQUESTS = 4
+# Maximum number of requests in flight across all accounts
+MAX_TOTAL_CONCURRENT_REQUESTS = 8
+# Resolution of the GetDataSummary telemetry buckets
+ENERGY_RESOLUTION_MIN = 10
+# Seconds after a bucket closes before it is expected to be available
+ENERGY_PUBLISH_DELAY_SEC = 60
+# Seconds between polls for a bucket that is late
+ENERGY_RETRY_SEC = 120
+# Ranges of missing buckets of a site fetched again per energy poll
+ENERGY_MAX_GAP_FETCHES = 2
+# Renew the access token this many seconds before it expires
+TOKEN_RENEW_MARGIN_SEC = 300
 
 # Validation of the user's configuration
 XOLTA_CONFIG_SCHEMA = vol.Schema(
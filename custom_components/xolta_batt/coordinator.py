@@ -0,0 +1,68 @@
+"""Data update coordinators of the Xolta integration."""
+from __future__ import annotations
+
+import logging
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.exceptions import ConfigEntryAuthFailed
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
+
+from .xolta_api import XoltaApi
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class XoltaCoordinator(DataUpdateCoordinator):
+    """Polls one endpoint (siteStatus or GetDataSummary) for all sites.
+
+    Refreshed by the Poller, in the slot of the config entry. Entities use their
+    site id as listener context. After a refresh only the listeners of the sites
+    that were polled are notified. Listeners without a context, and all listeners
+    when the refresh fails or recovers, are always notified.
+    """
+
+    def __init__(self, hass: HomeAssistant, api: XoltaApi, endpoint: str, name: str):
+        super().__init__(
+            hass,
+            _LOGGER,
+            # Name of the data. For logging purposes.
+            name=name,
+            # Polled by the Poller, staggered with the other config entries
+            update_interval=None,
+        )
+        self.api = api
+        self.endpoint = endpoint
+        # Sites polled by the refresh being notified, None to notify all listeners
+        self._updated_sites: set[str] | None = None
+        self._notified_success = True
+
+    async def _async_update_data(self):
+        """Fetch data from API endpoint."""
+        try:
+            # Note: asyncio.TimeoutError and aiohttp.ClientError are already
+            # handled by the data update coordinator.
+            data = await self.api.get_data(endpoints=(self.endpoint,))
+
+        except ConfigEntryAuthFailed:
+            raise
+
+        except Exception as err:
+            raise UpdateFailed(f"Error communicating with API: {err}") from err
+
+        self._updated_sites = data["updated_sites"][self.endpoint]
+        return data
+
+    @callback
+    def async_update_listeners(self) -> None:
+        """Update the listeners of the sites that were polled."""
+        updated_sites = self._updated_sites
+        self._updated_sites = None
+        if updated_sites is None or self.last_update_success != self._notified_success:
+            # Availability of all entities changed
+            self._notified_success = self.last_update_success
+            super().async_update_listeners()
+            return
+
+        for update_callback, context in list(self._listeners.values()):
+            if context is None or context in updated_sites:
+                update_callback()
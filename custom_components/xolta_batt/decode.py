@@ -0,0 +1,55 @@
+"""Decoding of Xolta API responses."""
+from __future__ import annotations
+
+from array import array
+import json
+
+import ciso8601
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+from .aggregation import TELEMETRY_FIELDS
+
+FIELD_END_TIME = "utcEndTime"
+
+if orjson is not None:
+    json_loads = orjson.loads
+else:  # pragma: no cover
+    json_loads = json.loads
+
+
+class TelemetryColumns:
+    """The buckets of a GetDataSummary response, as columns of the fields we use.
+
+    ends holds the bucket end times as UTC timestamps, columns the average power
+    (kW) per field of TELEMETRY_FIELDS.
+    """
+
+    __slots__ = ("ends", "columns")
+
+    def __init__(self):
+        self.ends = array("d")
+        self.columns = {field: array("d") for field in TELEMETRY_FIELDS}
+
+    def __len__(self):
+        return len(self.ends)
+
+
+def decode_telemetry(body: bytes) -> TelemetryColumns:
+    """Decode a GetDataSummary response body, keeping only the fields we use.
+
+    The body is parsed with orjson when it is installed, otherwise with the json
+    module. Only the copied fields outlive the call.
+    """
+    telemetry = TelemetryColumns()
+    ends = telemetry.ends
+    appends = [(field, column.append) for field, column in telemetry.columns.items()]
+    parse_datetime = ciso8601.parse_datetime
+    for bucket in json_loads(body)["telemetry"]:
+        ends.append(parse_datetime(bucket[FIELD_END_TIME]).timestamp())
+        for field, append in appends:
+            append(bucket[field])
+    return telemetry
@@ -0,0 +1,32 @@
+"""Diagnostics support for the Xolta Battery integration."""
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import CONF_PASSWORD, CONF_USERNAME
+from homeassistant.core import HomeAssistant
+
+from .breaker import DATA_BREAKERS
+from .const import DOMAIN
+from .poller import async_get_poller
+
+TO_REDACT = {CONF_PASSWORD, CONF_USERNAME, "title", "unique_id"}
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict[str, Any]:
+    """Return diagnostics for a config entry."""
+    api = hass.data[DOMAIN][entry.entry_id]
+
+    return {
+        "entry": async_redact_data(entry.as_dict(), TO_REDACT),
+        "metrics": api.metrics.as_dict(),
+        "poller": async_get_poller(hass).as_dict(),
+        "breakers": {
+            host: breaker.as_dict()
+            for host, breaker in hass.data.get(DATA_BREAKERS, {}).items()
+        },
+    }
@@ -0,0 +1,277 @@
+"""Incremental energy totals for Xolta sites."""
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_right
+from datetime import datetime, timedelta
+import logging
+from operator import itemgetter
+
+from homeassistant.util import dt as dt_util
+
+from .aggregation import ENERGY_KEYS, TELEMETRY_FIELDS, aggregate_energy_columns
+from .const import ENERGY_RESOLUTION_MIN
+from .decode import TelemetryColumns
+from .models import SiteEnergy, SiteStatus
+
+_LOGGER = logging.getLogger(__name__)
+
+# Readings further apart than this are not interpolated
+ESTIMATE_MAX_GAP_SEC = 900
+# Readings kept while the next bucket is late
+ESTIMATE_MAX_SAMPLES = 180
+# Times a range of missing buckets is fetched again before giving up on it
+GAP_MAX_TRIES = 3
+
+
+class EnergyAccumulator:
+    """Running energy totals of a single site since local midnight.
+
+    Only buckets newer than the last one seen are requested and added, so the
+    work per refresh stays the same throughout the day. The day's buckets are
+    kept as compact columns so they can be cached across restarts.
+
+    Between buckets, the siteStatus power readings are integrated into an interim
+    estimate, which is replaced by the buckets as they arrive.
+
+    Buckets missing between the ones that arrived are recorded as gaps, to be
+    fetched again with add_repair until they arrive or run out of tries.
+
+    The last buckets of a day, up to the one ending at midnight, close after the
+    last poll of the day. The windows of the new day start at carry_from until
+    they arrive, so they still reach the rollups and the archive.
+    """
+
+    def __init__(self, resolution_min=ENERGY_RESOLUTION_MIN):
+        self.resolution_min = resolution_min
+        self.day_start: datetime | None = None
+        self.last_end: datetime | None = None
+        self.totals = dict.fromkeys(ENERGY_KEYS, 0.0)
+        # Minutes since day_start of each bucket end, and the bucket values
+        self._ends = array("H")
+        self._columns = {field: array("d") for field in TELEMETRY_FIELDS}
+        # siteStatus readings as (timestamp, (pv, consumption, battery, grid))
+        self._samples: list[tuple[float, tuple[float, float, float, float]]] = []
+        # Missing buckets, as [start, end, tries left]: those ending within start - end
+        self.gaps: list[list] = []
+        # End of the last bucket of the previous day, while the rest of it is missing
+        self.carry_from: datetime | None = None
+
+    def reset(self, day_start: datetime):
+        """Start a new day."""
+        previous_end = self.last_end or self.day_start
+        self.carry_from = None
+        if previous_end is not None and previous_end < day_start:
+            self.carry_from = previous_end
+        self.day_start = day_start
+        self.last_end = None
+        self.totals = dict.fromkeys(ENERGY_KEYS, 0.0)
+        self._ends = array("H")
+        self._columns = {field: array("d") for field in TELEMETRY_FIELDS}
+        self._samples = []
+        self.gaps = []
+
+    def _start_day(self, now_utc: datetime):
+        """Reset the accumulator if now_utc is on a new local day."""
+        day_start = dt_util.as_utc(dt_util.start_of_local_day(dt_util.as_local(now_utc)))
+        if day_start != self.day_start:
+            self.reset(day_start)
+
+    def window(self, now_utc: datetime) -> tuple[datetime, datetime]:
+        """Return the (from, to) range in UTC that still needs to be fetched."""
+        self._start_day(now_utc)
+        return self.carry_from or self.last_end or self.day_start, now_utc
+
+    def add_status(self, status: SiteStatus, now_utc: datetime):
+        """Add a siteStatus reading to the interim estimate."""
+        self._start_day(now_utc)
+        self._samples.append(
+            (
+                now_utc.timestamp(),
+                (
+                    status.pv_power,
+                    status.consumption,
+                    status.battery_power,
+                    status.grid_power,
+                ),
+            )
+        )
+        self._trim_samples()
+
+    def _trim_samples(self):
+        """Drop readings no longer needed, those before the last bucket but one."""
+        since = (self.last_end or self.day_start).timestamp()
+        first = bisect_right(self._samples, since, key=itemgetter(0))
+        del self._samples[: max(0, first - 1)]
+        del self._samples[:-ESTIMATE_MAX_SAMPLES]
+
+    def estimate(self) -> dict[str, float]:
+        """Return the energy (kWh) since the last bucket, from the siteStatus readings.
+
+        Power is interpolated linearly between readings. Gaps longer than
+        ESTIMATE_MAX_GAP_SEC are left out.
+        """
+        estimate = dict.fromkeys(ENERGY_KEYS, 0.0)
+        if self.day_start is None:
+            return estimate
+        since = (self.last_end or self.day_start).timestamp()
+        for (start, before), (end, after) in zip(self._samples, self._samples[1:]):
+            if end <= since or end - start > ESTIMATE_MAX_GAP_SEC:
+                continue
+            hours = (end - max(start, since)) / 3600
+            pv, consumption, battery, grid = (
+                (a + b) / 2 * hours for a, b in zip(before, after)
+            )
+            estimate["pv"] += pv
+            estimate["consumption"] += consumption
+            if battery < 0:
+                estimate["battery_charged"] -= battery
+            else:
+                estimate["battery_discharged"] += battery
+            if grid < 0:
+                estimate["grid_exported"] -= grid
+            else:
+                estimate["grid_imported"] += grid
+        return estimate
+
+    def add(self, telemetry: TelemetryColumns, to_utc: datetime):
+        """Add the buckets of a GetDataSummary response for the window ending at to_utc."""
+        ends = telemetry.ends
+        day_start = self.day_start.timestamp()
+        if self.carry_from is not None and (
+            received := bisect_right(ends, to_utc.timestamp())
+        ):
+            # The previous day is complete once a bucket of this day arrived
+            latest = ends[received - 1]
+            self.carry_from = (
+                None if latest >= day_start else dt_util.utc_from_timestamp(latest)
+            )
+
+        # Skip buckets already counted, and buckets that have not closed yet. These
+        # are fetched again next time.
+        first = bisect_right(ends, (self.last_end or self.day_start).timestamp())
+        last = bisect_right(ends, to_utc.timestamp())
+        if first >= last:
+            return
+
+        since = (self.last_end or self.day_start).timestamp()
+        self._add_gaps(since, ends[first:last], GAP_MAX_TRIES)
+        self._ends.extend(int(end - day_start) // 60 for end in ends[first:last])
+        new_columns = [telemetry.columns[field][first:last] for field in TELEMETRY_FIELDS]
+        for column, new_column in zip(self._columns.values(), new_columns):
+            column.extend(new_column)
+
+        for key, value in aggregate_energy_columns(
+            *new_columns, self.resolution_min / 60
+        ).items():
+            self.totals[key] += value
+        self.last_end = dt_util.utc_from_timestamp(ends[last - 1])
+        self._trim_samples()
+
+    def _add_gaps(self, since: float, ends, tries: int):
+        """Record the buckets missing between since and each of ends as gaps."""
+        resolution_sec = self.resolution_min * 60
+        for end in ends:
+            if end - since > resolution_sec * 1.5:
+                self.gaps.append([since, end - resolution_sec, tries])
+            since = end
+
+    def add_repair(self, telemetry: TelemetryColumns, gap: list):
+        """Add the buckets of a gap fetched again, and record the ones still missing.
+
+        The buckets are inserted among those of the day, the totals include them
+        right away.
+        """
+        if gap not in self.gaps:
+            # Of a previous day
+            return
+        self.gaps.remove(gap)
+        start, end, tries = gap
+        ends = telemetry.ends
+        first = bisect_right(ends, start)
+        last = bisect_right(ends, end)
+
+        day_start = self.day_start.timestamp()
+        new_columns = [telemetry.columns[field][first:last] for field in TELEMETRY_FIELDS]
+        inserted = [array("d") for _ in TELEMETRY_FIELDS]
+        for i, bucket_end in enumerate(ends[first:last]):
+            minute = int(bucket_end - day_start) // 60
+            position = bisect_right(self._ends, minute)
+            if position and self._ends[position - 1] == minute:
+                continue
+            self._ends.insert(position, minute)
+            for column, new_column, added in zip(
+                self._columns.values(), new_columns, inserted
+            ):
+                column.insert(position, new_column[i])
+                added.append(new_column[i])
+        for key, value in aggregate_energy_columns(
+            *inserted, self.resolution_min / 60
+        ).items():
+            self.totals[key] += value
+
+        if tries > 1:
+            # The gap may have been filled partly
+            self._add_gaps(
+                start, [*ends[first:last], end + self.resolution_min * 60], tries - 1
+            )
+        else:
+            _LOGGER.debug(
+                "Giving up on telemetry buckets ending %s - %s",
+                dt_util.utc_from_timestamp(start),
+                dt_util.utc_from_timestamp(end),
+            )
+
+    def repair_failed(self, gap: list):
+        """Count a failed fetch of a gap against its tries."""
+        if gap not in self.gaps:
+            return
+        gap[2] -= 1
+        if gap[2] <= 0:
+            self.gaps.remove(gap)
+
+    def snapshot(self) -> SiteEnergy:
+        """Return the totals and interim estimate, as exposed through XoltaApi data."""
+        estimate = self.estimate()
+        return SiteEnergy(
+            **{key: value + estimate[key] for key, value in self.totals.items()},
+            last_end=self.last_end,
+            day_start=self.day_start,
+        )
+
+    def to_cache(self):
+        """Return the day's buckets in a compact, JSON serializable form."""
+        if self.day_start is None:
+            return None
+        return {
+            "day": int(self.day_start.timestamp()),
+            "resolution": self.resolution_min,
+            "end": self._ends.tolist(),
+            "gaps": self.gaps,
+            "carry_from": self.carry_from and int(self.carry_from.timestamp()),
+            **{
+                field: [round(value, 4) for value in column]
+                for field, column in self._columns.items()
+            },
+        }
+
+    @classmethod
+    def from_cache(cls, data) -> EnergyAccumulator:
+        """Restore an accumulator from the output of to_cache."""
+        accumulator = cls(data["resolution"])
+        accumulator.reset(dt_util.utc_from_timestamp(data["day"]))
+        accumulator._ends = array("H", data["end"])
+        accumulator._columns = {
+            field: array("d", data[field]) for field in TELEMETRY_FIELDS
+        }
+        accumulator.gaps = [list(gap) for gap in data.get("gaps", [])]
+        if (carry_from := data.get("carry_from")) is not None:
+            accumulator.carry_from = dt_util.utc_from_timestamp(carry_from)
+        if accumulator._ends:
+            accumulator.last_end = accumulator.day_start + timedelta(
+                minutes=accumulator._ends[-1]
+            )
+            accumulator.totals = aggregate_energy_columns(
+                *accumulator._columns.values(), accumulator.resolution_min / 60
+            )
+        return accumulator
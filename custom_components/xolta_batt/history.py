@@ -0,0 +1,90 @@
+"""Recent siteStatus readings of Xolta sites, kept in memory."""
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+
+from homeassistant.util import dt as dt_util
+
+from .models import SiteStatus
+
+# Readings kept per site, a day of readings polled every minute
+HISTORY_SIZE = 24 * 60
+# SiteStatus fields kept
+HISTORY_FIELDS = (
+    "battery_power",
+    "pv_power",
+    "consumption",
+    "battery_level",
+    "grid_power",
+)
+
+
+class PowerHistory:
+    """Ring buffer of the last HISTORY_SIZE siteStatus readings of a site.
+
+    Readings are stored in preallocated arrays, a timestamp column and one per
+    field of HISTORY_FIELDS, so a site takes the same memory however long it
+    runs. The oldest reading is overwritten by the newest.
+    """
+
+    __slots__ = ("size", "_times", "_columns", "_next", "_count")
+
+    def __init__(self, size=HISTORY_SIZE):
+        self.size = size
+        self._times = array("d", bytes(8 * size))
+        self._columns = {field: array("d", bytes(8 * size)) for field in HISTORY_FIELDS}
+        # Position the next reading is written to, and the number of readings
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def add(self, status: SiteStatus, now_utc: datetime):
+        """Add a reading."""
+        position = self._next
+        self._times[position] = now_utc.timestamp()
+        for field, column in self._columns.items():
+            column[position] = getattr(status, field)
+        self._next = (position + 1) % self.size
+        self._count = min(self._count + 1, self.size)
+
+    def _ordered(self, column: array) -> array:
+        """Return the readings of a column, oldest first."""
+        if self._count < self.size:
+            return column[: self._count]
+        return column[self._next :] + column[: self._next]
+
+    def stats(
+        self, since: datetime, fields=HISTORY_FIELDS, percentiles=(50, 90)
+    ) -> dict | None:
+        """Return min, max, mean and percentiles per field of the readings since since.
+
+        Returns None if there are no readings in the window.
+        """
+        times = self._ordered(self._times)
+        first = bisect_left(times, since.timestamp())
+        if first == len(times):
+            return None
+
+        result = {
+            "count": len(times) - first,
+            "first": dt_util.utc_from_timestamp(times[first]),
+            "last": dt_util.utc_from_timestamp(times[-1]),
+        }
+        for field in fields:
+            values = sorted(self._ordered(self._columns[field])[first:])
+            result[field] = {
+                "min": values[0],
+                "max": values[-1],
+                "mean": sum(values) / len(values),
+                **{
+                    f"p{percent:g}": values[
+                        min(len(values) - 1, int(len(values) * percent / 100))
+                    ]
+                    for percent in percentiles
+                },
+            }
+        return result
@@ -0,0 +1,113 @@
+"""Request metrics of the Xolta API client."""
+from __future__ import annotations
+
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+import time
+
+from homeassistant.util import dt as dt_util
+
+METRIC_SITE_GROUP = "SiteGroup"
+METRIC_SITE_STATUS = "siteStatus"
+METRIC_DATA_SUMMARY = "GetDataSummary"
+METRIC_TOKEN = "token"
+METRIC_LOGIN = "login"
+METRIC_ENDPOINTS = (
+    METRIC_SITE_GROUP,
+    METRIC_SITE_STATUS,
+    METRIC_DATA_SUMMARY,
+    METRIC_TOKEN,
+    METRIC_LOGIN,
+)
+
+# Number of recent requests the latency percentiles are computed from
+LATENCY_WINDOW = 100
+
+
+class _Measurement:
+    """A single request being measured."""
+
+    __slots__ = ("size",)
+
+    def __init__(self):
+        self.size = 0
+
+
+class EndpointMetrics:
+    """Latency, size and error counts of the recent requests to one endpoint."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.latencies: deque[float] = deque(maxlen=window)
+        self.requests = 0
+        self.errors = 0
+        self.bytes_received = 0
+        self.last_bytes: int | None = None
+
+    def record(self, latency: float, size: int, error: bool):
+        """Record a finished request. Latency is in seconds."""
+        self.requests += 1
+        self.latencies.append(latency)
+        if error:
+            self.errors += 1
+        else:
+            self.bytes_received += size
+            self.last_bytes = size
+
+    def percentile(self, percent: float) -> float | None:
+        """Return the latency percentile in milliseconds, None without requests."""
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * percent / 100))
+        return round(ordered[index] * 1000, 1)
+
+    def as_dict(self):
+        """Return the metrics as a dict."""
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "latency_p50_ms": self.percentile(50),
+            "latency_p90_ms": self.percentile(90),
+            "latency_p99_ms": self.percentile(99),
+            "bytes_received": self.bytes_received,
+            "last_bytes": self.last_bytes,
+        }
+
+
+class ApiMetrics:
+    """Metrics of a XoltaApi instance."""
+
+    def __init__(self):
+        self.endpoints = {endpoint: EndpointMetrics() for endpoint in METRIC_ENDPOINTS}
+        self.token_renewals_401 = 0
+        self.out_of_retries = 0
+        self.last_success: datetime | None = None
+
+    @contextmanager
+    def measure(self, endpoint: str):
+        """Measure a request. Set the size of the response on the yielded object."""
+        measurement = _Measurement()
+        start = time.monotonic()
+        try:
+            yield measurement
+        except BaseException:
+            self.endpoints[endpoint].record(time.monotonic() - start, 0, True)
+            raise
+        self.endpoints[endpoint].record(
+            time.monotonic() - start, measurement.size, False
+        )
+
+    def as_dict(self):
+        """Return all metrics as a dict."""
+        return {
+            "endpoints": {
+                endpoint: metrics.as_dict()
+                for endpoint, metrics in self.endpoints.items()
+            },
+            "token_renewals_401": self.token_renewals_401,
+            "out_of_retries": self.out_of_retries,
+            "last_success": self.last_success and self.last_success.isoformat(),
+            "seconds_since_last_success": self.last_success
+            and round((dt_util.utcnow() - self.last_success).total_seconds()),
+        }
@@ -0,0 +1,59 @@
+"""Immutable per-site snapshots of the Xolta API data."""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime
+
+STATE_RUNNING = "Running"
+
+
+@dataclass(frozen=True, slots=True)
+class SiteStatus:
+    """Live status of a site, from siteStatus.
+
+    Power (kW) and charge level are 0 while the site is not running.
+    """
+
+    state: str
+    # negative means charging, positive means discharging
+    battery_power: float
+    pv_power: float
+    consumption: float
+    battery_level: float
+    # negative means sell, positive means buy
+    grid_power: float
+
+    @classmethod
+    def from_json(cls, data) -> SiteStatus:
+        """Create a snapshot from an entry of the siteStatus response."""
+        state = data["state"]
+        if state != STATE_RUNNING:
+            return cls(state, 0, 0, 0, 0, 0)
+        return cls(
+            state,
+            data["inverterActivePowerAggAvg"],
+            data["meterPvActivePowerAggAvg"],
+            data["consumption"],
+            data["bmsSocRawArrayCloudTrimmedAggAvg"],
+            data["meterGridActivePowerAggAvg"],
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class SiteEnergy:
+    """Energy (kWh) of a site since local midnight.
+
+    From the GetDataSummary buckets, plus an estimate from siteStatus since the
+    last bucket.
+    """
+
+    pv: float
+    consumption: float
+    battery_charged: float
+    battery_discharged: float
+    grid_exported: float
+    grid_imported: float
+    # End of the last telemetry bucket included
+    last_end: datetime | None
+    # Local midnight (UTC) the totals count from
+    day_start: datetime | None
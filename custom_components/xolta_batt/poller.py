@@ -0,0 +1,138 @@
+"""Staggered polling of all Xolta config entries."""
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Iterable
+from contextlib import asynccontextmanager
+import hashlib
+import logging
+import time
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers.event import async_call_later
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
+
+from .const import MAX_TOTAL_CONCURRENT_REQUESTS, UPDATE_INTERVAL_SEC
+
+_LOGGER = logging.getLogger(__name__)
+
+DATA_POLLER = "xolta_batt_poller"
+
+
+class Poller:
+    """Refreshes the coordinators of all config entries on one schedule.
+
+    Each entry is refreshed once per interval, at a fixed offset derived from its
+    entry id. Many accounts then spread their requests over the interval instead
+    of all polling at the same time after a restart. Requests of all entries share
+    one concurrency limit.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        interval: float = UPDATE_INTERVAL_SEC,
+        max_concurrent_requests: int = MAX_TOTAL_CONCURRENT_REQUESTS,
+    ):
+        self._hass = hass
+        self.interval = interval
+        self._request_semaphore = asyncio.Semaphore(max_concurrent_requests)
+        self._entries: dict[str, list[DataUpdateCoordinator]] = {}
+        self._unsub_timers: dict[str, CALLBACK_TYPE] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+        self.requests_in_flight = 0
+        self.requests_waiting = 0
+        # Refreshes not started because the previous one of the entry was still running
+        self.refreshes_skipped = 0
+
+    def offset(self, entry_id: str) -> float:
+        """Return the seconds into each interval at which the entry is refreshed."""
+        digest = hashlib.sha1(entry_id.encode()).digest()
+        return int.from_bytes(digest[:4], "big") % int(self.interval * 1000) / 1000
+
+    @callback
+    def async_add(
+        self, entry_id: str, coordinators: Iterable[DataUpdateCoordinator]
+    ) -> CALLBACK_TYPE:
+        """Refresh the coordinators of an entry in its slot. Returns a remove callback."""
+        self._entries[entry_id] = list(coordinators)
+        self._schedule(entry_id)
+
+        @callback
+        def remove():
+            self._entries.pop(entry_id, None)
+            if (unsub := self._unsub_timers.pop(entry_id, None)) is not None:
+                unsub()
+            if (task := self._tasks.pop(entry_id, None)) is not None:
+                task.cancel()
+
+        return remove
+
+    @callback
+    def _schedule(self, entry_id: str, fired_slot: float | None = None):
+        # Wall clock, so the slots stay the same across restarts
+        now = time.time()
+        slot = now + (self.offset(entry_id) - now) % self.interval
+        if fired_slot is not None and slot < fired_slot + self.interval / 2:
+            # The timer fired a little early, this is the slot just handled
+            slot += self.interval
+
+        @callback
+        def fire(_now):
+            self._unsub_timers.pop(entry_id, None)
+            if entry_id not in self._entries:
+                return
+            self._schedule(entry_id, slot)
+            if (task := self._tasks.get(entry_id)) is not None and not task.done():
+                self.refreshes_skipped += 1
+                _LOGGER.debug("Previous refresh of %s still running, skipping", entry_id)
+                return
+            self._tasks[entry_id] = self._hass.async_create_task(
+                self._async_refresh(entry_id), f"xolta_batt refresh {entry_id}"
+            )
+
+        self._unsub_timers[entry_id] = async_call_later(self._hass, slot - now, fire)
+
+    async def _async_refresh(self, entry_id: str):
+        """Refresh the coordinators of an entry concurrently."""
+        await asyncio.gather(
+            *(coordinator.async_refresh() for coordinator in self._entries[entry_id])
+        )
+
+    @asynccontextmanager
+    async def request_slot(self):
+        """Wait for one of the requests allowed in flight across all entries."""
+        self.requests_waiting += 1
+        try:
+            await self._request_semaphore.acquire()
+        finally:
+            self.requests_waiting -= 1
+        self.requests_in_flight += 1
+        try:
+            yield
+        finally:
+            self.requests_in_flight -= 1
+            self._request_semaphore.release()
+
+    def as_dict(self):
+        """Return the schedule and backlog as a dict."""
+        return {
+            "interval": self.interval,
+            "entries": {
+                entry_id: self.offset(entry_id) for entry_id in self._entries
+            },
+            "refreshes_running": sum(
+                not task.done() for task in self._tasks.values()
+            ),
+            "refreshes_skipped": self.refreshes_skipped,
+            "requests_in_flight": self.requests_in_flight,
+            "requests_waiting": self.requests_waiting,
+        }
+
+
+@callback
+def async_get_poller(hass: HomeAssistant) -> Poller:
+    """Return the poller shared by all config entries, creating it if needed."""
+    if (poller := hass.data.get(DATA_POLLER)) is None:
+        poller = hass.data[DATA_POLLER] = Poller(hass)
+    return poller
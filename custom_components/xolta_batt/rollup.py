@@ -0,0 +1,255 @@
+"""Hourly and daily energy rollups of Xolta sites, kept across restarts."""
+from __future__ import annotations
+
+from array import array
+from datetime import date, datetime, timedelta
+from itertools import accumulate
+import logging
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
+
+from .aggregation import ENERGY_KEYS, grouped_energy, hour_group
+from .cache import CACHE_SAVE_DELAY
+from .decode import TelemetryColumns
+from .models import SiteEnergy
+
+_LOGGER = logging.getLogger(__name__)
+
+ROLLUP_STORAGE_KEY_PREFIX = "xolta_batt_rollup_"
+ROLLUP_STORAGE_VERSION = 1
+# Days of hourly energy kept, older energy is only kept per day
+ROLLUP_HOURLY_DAYS = 35
+
+PERIOD_WEEK = "week"
+PERIOD_MONTH = "month"
+PERIOD_YEAR = "year"
+PERIOD_ROLLING_30_DAYS = "30_days"
+PERIODS = (PERIOD_WEEK, PERIOD_MONTH, PERIOD_YEAR, PERIOD_ROLLING_30_DAYS)
+
+
+def _local_day_group(start: float) -> tuple[int, float]:
+    """Return the local day (ordinal) a bucket starting at start is in, and its end."""
+    day = dt_util.as_local(dt_util.utc_from_timestamp(start)).date()
+    return day.toordinal(), dt_util.start_of_local_day(day + timedelta(days=1)).timestamp()
+
+
+class _PrefixSeries:
+    """Energy per key of consecutive periods (hours or days), with prefix sums.
+
+    Periods are numbered, and stored from the first one with energy on. prefix
+    holds the running total up to each period, so the total of any range is the
+    difference of two entries. Energy is usually added to the last period, which
+    only updates the last prefix sum.
+    """
+
+    __slots__ = ("first", "values", "prefix")
+
+    def __init__(self):
+        self.first: int | None = None
+        self.values = {key: array("d") for key in ENERGY_KEYS}
+        # One more entry than values, prefix[i] is the total before period first + i
+        self.prefix = {key: array("d", [0.0]) for key in ENERGY_KEYS}
+
+    def __len__(self):
+        return len(self.values[ENERGY_KEYS[0]])
+
+    @property
+    def last(self) -> int | None:
+        """Return the number of the last period, None if empty."""
+        return None if self.first is None else self.first + len(self) - 1
+
+    def add(self, period: int, energy: dict[str, float]):
+        """Add energy (kWh) per key to a period."""
+        if self.first is None:
+            self.first = period
+        if period < self.first:
+            # Late buckets from before the first period
+            padding = array("d", bytes(8 * (self.first - period)))
+            for values in self.values.values():
+                values[0:0] = padding
+            self.first = period
+            self._rebuild_prefix()
+        index = period - self.first
+        if index >= len(self):
+            padding = array("d", bytes(8 * (index + 1 - len(self))))
+            for key, values in self.values.items():
+                values.extend(padding)
+                self.prefix[key].extend(array("d", [self.prefix[key][-1]]) * len(padding))
+
+        for key, value in energy.items():
+            self.values[key][index] += value
+            prefix = self.prefix[key]
+            for i in range(index + 1, len(prefix)):
+                prefix[i] += value
+
+    def total(self, start: int, end: int) -> dict[str, float]:
+        """Return the energy per key of periods start up to (not including) end."""
+        if self.first is None:
+            return dict.fromkeys(ENERGY_KEYS, 0.0)
+        start = min(max(start - self.first, 0), len(self))
+        end = min(max(end - self.first, start), len(self))
+        return {key: prefix[end] - prefix[start] for key, prefix in self.prefix.items()}
+
+    def trim(self, first: int):
+        """Drop the periods before first."""
+        if self.first is None or first <= self.first:
+            return
+        count = min(first - self.first, len(self))
+        for key in ENERGY_KEYS:
+            del self.values[key][:count]
+            # The differences of the remaining prefix sums stay the same
+            del self.prefix[key][:count]
+        self.first += count
+
+    def _rebuild_prefix(self):
+        self.prefix = {
+            key: array("d", accumulate(values, initial=0.0))
+            for key, values in self.values.items()
+        }
+
+    def to_cache(self):
+        """Return the periods in a compact, JSON serializable form."""
+        return {
+            "first": self.first,
+            **{
+                key: [round(value, 4) for value in values]
+                for key, values in self.values.items()
+            },
+        }
+
+    @classmethod
+    def from_cache(cls, data) -> _PrefixSeries:
+        """Restore a series from the output of to_cache."""
+        series = cls()
+        series.first = data["first"]
+        series.values = {key: array("d", data[key]) for key in ENERGY_KEYS}
+        if len({len(values) for values in series.values.values()}) != 1:
+            raise ValueError("Columns of different length")
+        series._rebuild_prefix()
+        return series
+
+
+class EnergyRollup:
+    """Hourly and daily energy (kWh) of a site, built from the telemetry buckets.
+
+    Days are local days, kept as long as the integration runs, hours are kept for
+    the last ROLLUP_HOURLY_DAYS days. Both have prefix sums, so the total of a
+    period takes the same time however long it is.
+    """
+
+    def __init__(self):
+        # UTC hours, numbered by timestamp // 3600
+        self.hours = _PrefixSeries()
+        # Local days, numbered by date ordinal
+        self.days = _PrefixSeries()
+
+    def add(
+        self,
+        telemetry: TelemetryColumns,
+        from_utc: datetime,
+        to_utc: datetime,
+        resolution_min: int,
+    ):
+        """Add the buckets ending within from_utc - to_utc."""
+        start, end = from_utc.timestamp(), to_utc.timestamp()
+        for hour, energy in grouped_energy(
+            telemetry, start, end, hour_group, resolution_min
+        ):
+            self.hours.add(hour // 3600, energy)
+        for day, energy in grouped_energy(
+            telemetry, start, end, _local_day_group, resolution_min
+        ):
+            self.days.add(day, energy)
+        if (last := self.hours.last) is not None:
+            self.hours.trim(last + 1 - ROLLUP_HOURLY_DAYS * 24)
+
+    def total(self, start: date, end: date) -> dict[str, float]:
+        """Return the energy per key of the local days start up to (not including) end."""
+        return self.days.total(start.toordinal(), end.toordinal())
+
+    def total_hours(self, start: datetime, end: datetime) -> dict[str, float]:
+        """Return the energy per key of the whole UTC hours from start up to end.
+
+        Hours older than ROLLUP_HOURLY_DAYS days are not counted.
+        """
+        return self.hours.total(
+            int(start.timestamp()) // 3600, int(end.timestamp()) // 3600
+        )
+
+    def periods(self, today: date) -> dict[str, SiteEnergy]:
+        """Return the energy of each of PERIODS before today.
+
+        day_start of each is the (UTC) start of the period. Adding today's energy
+        gives the total of the period.
+        """
+        starts = {
+            PERIOD_WEEK: today - timedelta(days=today.weekday()),
+            PERIOD_MONTH: today.replace(day=1),
+            PERIOD_YEAR: today.replace(month=1, day=1),
+            PERIOD_ROLLING_30_DAYS: today - timedelta(days=29),
+        }
+        return {
+            period: SiteEnergy(
+                **self.total(start, today),
+                last_end=None,
+                day_start=dt_util.as_utc(dt_util.start_of_local_day(start)),
+            )
+            for period, start in starts.items()
+        }
+
+    def to_cache(self):
+        """Return the rollups in a compact, JSON serializable form."""
+        return {"hours": self.hours.to_cache(), "days": self.days.to_cache()}
+
+    @classmethod
+    def from_cache(cls, data) -> EnergyRollup:
+        """Restore rollups from the output of to_cache."""
+        rollup = cls()
+        rollup.hours = _PrefixSeries.from_cache(data["hours"])
+        rollup.days = _PrefixSeries.from_cache(data["days"])
+        return rollup
+
+
+class RollupStore:
+    """Energy rollups of all sites of an account, stored next to the auth tokens.
+
+    Unlike the telemetry cache, the rollups can't be rebuilt from a single request,
+    so they are kept in a store of their own.
+    """
+
+    def __init__(self, hass: HomeAssistant, key_suffix: str):
+        self._store = Store(
+            hass, ROLLUP_STORAGE_VERSION, ROLLUP_STORAGE_KEY_PREFIX + key_suffix
+        )
+        self._rollups: dict[str, EnergyRollup] = {}
+        self._dirty = False
+
+    async def async_load(self) -> dict[str, EnergyRollup]:
+        """Return the stored rollups per site."""
+        data = await self._store.async_load() or {}
+
+        rollups = {}
+        for site_id, cached in data.items():
+            try:
+                rollups[site_id] = EnergyRollup.from_cache(cached)
+            except (KeyError, TypeError, ValueError) as err:
+                _LOGGER.warning("Ignoring stored energy of site %s: %s", site_id, err)
+        return rollups
+
+    def async_schedule_save(self, rollups: dict[str, EnergyRollup]):
+        """Save the rollups after a delay, coalescing repeated calls."""
+        self._rollups = rollups
+        self._dirty = True
+        self._store.async_delay_save(self._data_to_save, CACHE_SAVE_DELAY)
+
+    async def async_flush(self):
+        """Write a pending delayed save now."""
+        if self._dirty:
+            await self._store.async_save(self._data_to_save())
+
+    def _data_to_save(self):
+        """Return the data to store."""
+        self._dirty = False
+        return {site_id: rollup.to_cache() for site_id, rollup in self._rollups.items()}
@@ -0,0 +1,56 @@
+"""Decide which Xolta endpoints to poll for which site."""
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+
+from .const import (
+    ENERGY_PUBLISH_DELAY_SEC,
+    ENERGY_RESOLUTION_MIN,
+    ENERGY_RETRY_SEC,
+    STATUS_IDLE_INTERVAL_SEC,
+    UPDATE_INTERVAL_SEC,
+)
+from .models import SiteStatus
+
+ENDPOINT_STATUS = "siteStatus"
+ENDPOINT_ENERGY = "GetDataSummary"
+
+# Battery power (kW) below which the battery is considered idle
+IDLE_BATTERY_POWER = 0.05
+
+
+class PollScheduler:
+    """Next due time per (site, endpoint).
+
+    siteStatus is polled every UPDATE_INTERVAL_SEC, or less often while there is
+    no PV and the battery is idle. GetDataSummary is polled when the next
+    telemetry bucket has closed.
+    """
+
+    def __init__(self):
+        self._due: dict[tuple[str, str], datetime] = {}
+
+    def is_due(self, site_id: str, endpoint: str, now: datetime) -> bool:
+        """Return if the endpoint should be polled for the site."""
+        due = self._due.get((site_id, endpoint))
+        return due is None or now >= due
+
+    def status_polled(self, site_id: str, status: SiteStatus, now: datetime):
+        """Schedule the next siteStatus poll after a successful one."""
+        idle = not status.pv_power and abs(status.battery_power) < IDLE_BATTERY_POWER
+        interval = STATUS_IDLE_INTERVAL_SEC if idle else UPDATE_INTERVAL_SEC
+        # Allow for the coordinator firing slightly early
+        self._due[(site_id, ENDPOINT_STATUS)] = now + timedelta(seconds=interval - 1)
+
+    def energy_polled(self, site_id: str, last_end: datetime | None, now: datetime):
+        """Schedule the next GetDataSummary poll after a successful one."""
+        resolution = timedelta(minutes=ENERGY_RESOLUTION_MIN)
+        if last_end is None:
+            # No buckets yet today, wait for the first one to close
+            last_end = now - (now - datetime.min.replace(tzinfo=now.tzinfo)) % resolution
+
+        due = last_end + resolution + timedelta(seconds=ENERGY_PUBLISH_DELAY_SEC)
+        # The bucket may be published late, don't ask for it on every poll
+        self._due[(site_id, ENDPOINT_ENERGY)] = max(
+            due, now + timedelta(seconds=ENERGY_RETRY_SEC)
+        )
@@ -1,59 +1,151 @@
-from homeassistant.components.sensor import SensorDeviceClass, SensorStateClass
-from homeassistant.exceptions import ConfigEntryAuthFailed
-import logging
-
-from datetime import timedelta
+from __future__ import annotations
 
-from homeassistant.helpers.update_coordinator import (
-    CoordinatorEntity,
-    DataUpdateCoordinator,
-    UpdateFailed,
+from collections.abc import Callable
+from dataclasses import dataclass
+import logging
+from typing import Any
+
+from homeassistant.components.sensor import (
+    RestoreSensor,
+    SensorDeviceClass,
+    SensorEntity,
+    SensorEntityDescription,
+    SensorStateClass,
 )
-from homeassistant.components.sensor import SensorEntity
-from homeassistant.const import UnitOfEnergy, UnitOfPower
+from homeassistant.core import callback
+from homeassistant.helpers.typing import StateType
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
+from homeassistant.const import EntityCategory, UnitOfEnergy, UnitOfPower, UnitOfTime
 from homeassistant.const import (
     PERCENTAGE
 )
-from .const import DOMAIN, UPDATE_INTERVAL_SEC
+from homeassistant.helpers.device_registry import DeviceEntryType, DeviceInfo
+from .const import DOMAIN
+from .coordinator import XoltaCoordinator
+from .metrics import METRIC_ENDPOINTS
+from .poller import async_get_poller
+from .rollup import (
+    PERIOD_MONTH,
+    PERIOD_ROLLING_30_DAYS,
+    PERIOD_WEEK,
+    PERIOD_YEAR,
+    PERIODS,
+)
+from .scheduler import ENDPOINT_ENERGY, ENDPOINT_STATUS
 
 _LOGGER = logging.getLogger(__name__)
 
 
+@dataclass(frozen=True, kw_only=True)
+class XoltaSensorEntityDescription(SensorEntityDescription):
+    """Describes a sensor of a Xolta site. The key is also the sensor type."""
+
+    # Returns the value from the site's SiteStatus or SiteEnergy
+    value_fn: Callable[[Any], StateType]
+
+
+STATUS_SENSORS = (
+    XoltaSensorEntityDescription(
+        key="Battery power flow",
+        name="Battery power flow",
+        device_class=SensorDeviceClass.POWER,
+        native_unit_of_measurement=UnitOfPower.KILO_WATT,
+        icon="mdi:battery-charging-100",
+        # negative means charging, positive means discharging
+        value_fn=lambda status: status.battery_power,
+    ),
+    XoltaSensorEntityDescription(
+        key="PV power",
+        name="PV power",
+        device_class=SensorDeviceClass.POWER,
+        native_unit_of_measurement=UnitOfPower.KILO_WATT,
+        icon="mdi:solar-power",
+        value_fn=lambda status: status.pv_power,
+    ),
+    XoltaSensorEntityDescription(
+        key="Power consumption",
+        name="Power consumption",
+        device_class=SensorDeviceClass.POWER,
+        native_unit_of_measurement=UnitOfPower.KILO_WATT,
+        icon="mdi:home-lightning-bolt",
+        value_fn=lambda status: status.consumption,
+    ),
+    XoltaSensorEntityDescription(
+        key="Battery charge level",
+        name="Battery charge level",
+        device_class=SensorDeviceClass.BATTERY,
+        native_unit_of_measurement=PERCENTAGE,
+        value_fn=lambda status: status.battery_level,
+    ),
+    XoltaSensorEntityDescription(
+        key="Grid power flow",
+        name="Grid power flow",
+        device_class=SensorDeviceClass.POWER,
+        native_unit_of_measurement=UnitOfPower.KILO_WATT,
+        icon="mdi:transmission-tower",
+        # negative means sell, positive means buy
+        value_fn=lambda status: status.grid_power,
+    ),
+)
+
+ENERGY_SENSORS = (
+    XoltaSensorEntityDescription(
+        key="Grid energy imported",
+        name="Grid energy imported",
+        icon="mdi:transmission-tower-export",  # yes, this is correct
+        value_fn=lambda energy: energy.grid_imported,
+    ),
+    XoltaSensorEntityDescription(
+        key="Grid energy exported",
+        name="Grid energy exported",
+        icon="mdi:transmission-tower-import",  # yes, this is correct
+        value_fn=lambda energy: energy.grid_exported,
+    ),
+    XoltaSensorEntityDescription(
+        key="Battery energy charged",
+        name="Battery energy charged",
+        icon="mdi:battery-arrow-up",
+        value_fn=lambda energy: energy.battery_charged,
+    ),
+    XoltaSensorEntityDescription(
+        key="Battery energy discharged",
+        name="Battery energy discharged",
+        icon="mdi:battery-arrow-down",
+        value_fn=lambda energy: energy.battery_discharged,
+    ),
+    XoltaSensorEntityDescription(
+        key="PV energy",
+        name="PV energy",
+        icon="mdi:solar-power",
+        value_fn=lambda energy: energy.pv,
+    ),
+    XoltaSensorEntityDescription(
+        key="Energy consumption",
+        name="Energy consumption",
+        icon="mdi:home-lightning-bolt",
+        value_fn=lambda energy: energy.consumption,
+    ),
+)
+
+# Appended to the name of the energy sensors of each period
+PERIOD_NAMES = {
+    PERIOD_WEEK: "this week",
+    PERIOD_MONTH: "this month",
+    PERIOD_YEAR: "this year",
+    PERIOD_ROLLING_30_DAYS: "last 30 days",
+}
+
+
 async def async_setup_entry(hass, config_entry, async_add_entities):
     """Add sensors for passed config_entry in HA."""
     xoltaApi = hass.data[DOMAIN][config_entry.entry_id]
 
     # _LOGGER.debug("config_entry %s", config_entry.data)
-    update_interval = timedelta(seconds=UPDATE_INTERVAL_SEC)
 
-    async def async_update_data():
-        """Fetch data from API endpoint.
-
-        This is the place to pre-process the data to lookup tables
-        so entities can quickly look up their data.
-        """
-        try:
-            # Note: asyncio.TimeoutError and aiohttp.ClientError are already
-            # handled by the data update coordinator.
-            # async with async_timeout.timeout(10):
-            result = await xoltaApi.get_data()
-            return result
-
-        except ConfigEntryAuthFailed as err:
-            raise
-
-        except Exception as err:
-            # logging.exception("Something awful happened!")
-            raise UpdateFailed(f"Error communicating with API: {err}")
-
-    coordinator = DataUpdateCoordinator(
-        hass,
-        _LOGGER,
-        # Name of the data. For logging purposes.
-        name="XOLTA API",
-        update_method=async_update_data,
-        # Polling interval. Will only be polled if there are subscribers.
-        update_interval=update_interval,
+    # Live power and SoC, and the energy totals, are refreshed independently
+    coordinator = XoltaCoordinator(hass, xoltaApi, ENDPOINT_STATUS, "XOLTA API status")
+    energy_coordinator = XoltaCoordinator(
+        hass, xoltaApi, ENDPOINT_ENERGY, "XOLTA API energy"
     )
 
     #
@@ -66,148 +158,137 @@ async def async_setup_entry(hass, config_entry, async_add_entities):
     # coordinator.async_refresh() instead
     #
     await coordinator.async_config_entry_first_refresh()
+    await energy_coordinator.async_config_entry_first_refresh()
+    config_entry.async_on_unload(
+        async_get_poller(hass).async_add(
+            config_entry.entry_id, (coordinator, energy_coordinator)
+        )
+    )
 
     for site in coordinator.data["sites"]:
         siteId = site["siteId"]
         async_add_entities(
             [
-                XoltaSensor(
-                    coordinator,
-                    siteId,
-                    "Battery power flow",
-                    SensorDeviceClass.POWER,
-                    UnitOfPower.KILO_WATT,
-                    "mdi:battery-charging-100",
-                    # negative means charging, positive means discharging
-                    "inverterActivePowerAggAvg",
-                ),
-                XoltaSensor(
-                    coordinator,
-                    siteId,
-                    "PV power",
-                    SensorDeviceClass.POWER,
-                    UnitOfPower.KILO_WATT,
-                    "mdi:solar-power",
-                    "meterPvActivePowerAggAvg",
-                ),
-                XoltaSensor(
-                    coordinator,
-                    siteId,
-                    "Power consumption",
-                    SensorDeviceClass.POWER,
-                    UnitOfPower.KILO_WATT,
-                    "mdi:home-lightning-bolt",
-                    "consumption",
-                ),
-                XoltaSensor(
-                    coordinator,
-                    siteId,
-                    "Battery charge level",
-                    SensorDeviceClass.BATTERY,
-                    PERCENTAGE,
-                    None,
-                    "bmsSocRawArrayCloudTrimmedAggAvg",
-                ),
-                XoltaSensor(
-                    coordinator,
-                    siteId,
-                    "Grid power flow",
-                    SensorDeviceClass.POWER,
-                    UnitOfPower.KILO_WATT,
-                    "mdi:transmission-tower",
-                    # negative means sell, positive means buy
-                    "meterGridActivePowerAggAvg",
-                ),
-                # Energy sensors:
-                XoltaEnergySensor(
-                    coordinator,
-                    siteId,
-                    "Grid energy imported",
-                    "mdi:transmission-tower-export", # yes, this is correct
-                    "grid_imported",
-                ),
-                XoltaEnergySensor(
-                    coordinator,
-                    siteId,
-                    "Grid energy exported",
-                    "mdi:transmission-tower-import", # yes, this is correct
-                    "grid_exported",
-                ),
-                XoltaEnergySensor(
-                    coordinator,
-                    siteId,
-                    "Battery energy charged",
-                    "mdi:battery-arrow-up",
-                    "battery_charged",
-                ),
-                XoltaEnergySensor(
-                    coordinator,
-                    siteId,
-                    "Battery energy discharged",
-                    "mdi:battery-arrow-down",
-                    "battery_discharged",
-                ),
-                XoltaEnergySensor(
-                    coordinator,
-                    siteId,
-                    "PV energy",
-                    "mdi:solar-power",
-                    "pv",
-                ),
-                XoltaEnergySensor(
-                    coordinator,
-                    siteId,
-                    "Energy consumption",
-                    "mdi:home-lightning-bolt",
-                    "consumption",
-                ),
+                XoltaSensor(coordinator, siteId, description)
+                for description in STATUS_SENSORS
+            ]
+            + [
+                XoltaEnergySensor(energy_coordinator, coordinator, siteId, description)
+                for description in ENERGY_SENSORS
+            ]
+            + [
+                XoltaPeriodEnergySensor(
+                    energy_coordinator, coordinator, siteId, description, period
+                )
+                for period in PERIODS
+                for description in ENERGY_SENSORS
             ]
         )
 
+    # Diagnostic sensors with the request metrics of the account
+    async_add_entities(
+        [
+            XoltaMetricSensor(
+                coordinator,
+                xoltaApi,
+                config_entry,
+                f"{endpoint} latency",
+                lambda metrics, endpoint=endpoint: metrics.endpoints[endpoint].percentile(90),
+                lambda metrics, endpoint=endpoint: metrics.endpoints[endpoint].as_dict(),
+                SensorDeviceClass.DURATION,
+                UnitOfTime.MILLISECONDS,
+            )
+            for endpoint in METRIC_ENDPOINTS
+        ]
+        + [
+            XoltaMetricSensor(
+                coordinator,
+                xoltaApi,
+                config_entry,
+                "Token renewals after 401",
+                lambda metrics: metrics.token_renewals_401,
+                state_class=SensorStateClass.TOTAL_INCREASING,
+            ),
+            XoltaMetricSensor(
+                coordinator,
+                xoltaApi,
+                config_entry,
+                "Out of retries",
+                lambda metrics: metrics.out_of_retries,
+                state_class=SensorStateClass.TOTAL_INCREASING,
+            ),
+            XoltaMetricSensor(
+                coordinator,
+                xoltaApi,
+                config_entry,
+                "Last successful update",
+                lambda metrics: metrics.last_success,
+                device_class=SensorDeviceClass.TIMESTAMP,
+            ),
+        ]
+    )
+
 
 class XoltaBaseSensor(CoordinatorEntity, SensorEntity):
-    def __init__(
-        self, coordinator, site_id, sensor_type, icon
-    ):
-        super().__init__(coordinator)
-        self.coordinator = coordinator
-        self._site_id = site_id
-        self._sensor_type = sensor_type
-        self._attr_icon = icon
+    """Sensor of a Xolta site, reading a field of the site's snapshot."""
 
-    @property
-    def name(self) -> str:
-        return f"{self._sensor_type}"
+    entity_description: XoltaSensorEntityDescription
+    _attr_should_poll = False
+    # Key of the coordinator data with the snapshots of this sensor
+    _data_key: str
 
-    @property
-    def should_poll(self) -> bool:
-        """No need to poll. Coordinator notifies entity of updates."""
-        return False
+    def __init__(self, coordinator, site_id, description: XoltaSensorEntityDescription):
+        # Only notified when a refresh polled this site
+        super().__init__(coordinator, context=site_id)
+        self.entity_description = description
+        self._site_id = site_id
+        self._sensor_type = description.key
+        self._attr_device_info = DeviceInfo(
+            # Serial numbers are unique identifiers within a specific domain
+            identifiers={(DOMAIN, site_id)},
+            name=f"Battery {site_id}",
+            manufacturer="Xolta",
+            model="Battery",
+        )
+        # Availability, state and attributes of the last write
+        self._last_written = None
 
     @property
     def available(self):
         """Return if entity is available."""
-        return self.coordinator.last_update_success
+        # A site that failed to refresh is marked stale without failing the other sites
+        return (
+            self.coordinator.last_update_success
+            and self._site_id
+            not in self.coordinator.data["stale_sites"][self.coordinator.endpoint]
+        )
 
     @property
-    def device_info(self):
-        return {
-            "identifiers": {
-                # Serial numbers are unique identifiers within a specific domain
-                (DOMAIN, self._site_id)
-            },
-            "name": f"Battery {self._site_id}",
-            "manufacturer": "Xolta",
-            "model": "Battery",
-            # "sw_version": self.extra_state_attributes.get("firmwareversion", "unknown"),
-            # "via_device": (DOMAIN, self.api.bridgeid),
-        }
+    def native_value(self) -> StateType:
+        snapshot = self.coordinator.data[self._data_key].get(self._site_id)
+        if snapshot is None:
+            return None
+        return self.entity_description.value_fn(snapshot)
+
+    def _written_state(self):
+        """Return what a state write would store: availability, state and attributes."""
+        if not self.available:
+            return (False, None, None)
+        return (True, self.state, self.extra_state_attributes)
 
     async def async_added_to_hass(self):
         """When entity is added to hass."""
-        self.async_on_remove(
-            self.coordinator.async_add_listener(self.async_write_ha_state)
-        )
+        await super().async_added_to_hass()
+        # The state is written right after this
+        self._last_written = self._written_state()
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Write the state only when value, availability or attributes changed."""
+        written = self._written_state()
+        if written != self._last_written:
+            self._last_written = written
+            self.async_write_ha_state()
 
     async def async_update(self):
         """Update the entity.
@@ -218,53 +299,179 @@ class XoltaBaseSensor(CoordinatorEntity, SensorEntity):
 
 
 class XoltaSensor(XoltaBaseSensor):
-    def __init__(
-        self, coordinator, site_id, sensor_type, device_class, units, icon, data_property
-    ):
-        super().__init__(coordinator, site_id, sensor_type, icon)
-        self.coordinator = coordinator
-        self.entity_id = f"sensor.{self._site_id}_{self._sensor_type}"
-        self._attr_device_class = device_class
-        self._attr_native_unit_of_measurement = units
-        self._data_property = data_property
-        _LOGGER.debug("Creating XoltaBatterySensor with id %s", self._site_id)
+    """Live power or charge level of a site."""
 
-    @property
-    def unique_id(self) -> str:
-        return f"{self._site_id}-{self._sensor_type}"
+    _data_key = "sensors"
 
-    @property
-    def state(self):
-        data = self.coordinator.data["sensors"][self._site_id]
-        return data[self._data_property] if data["state"] == "Running" else 0
+    def __init__(self, coordinator, site_id, description):
+        super().__init__(coordinator, site_id, description)
+        self.entity_id = f"sensor.{self._site_id}_{self._sensor_type}"
+        self._attr_unique_id = f"{self._site_id}-{self._sensor_type}"
+        _LOGGER.debug("Creating XoltaBatterySensor with id %s", self._site_id)
 
     # For backwards compatibility
     @property
     def extra_state_attributes(self):
         """Return the state attributes of the monitored installation."""
-        data = self.coordinator.data["sensors"][self._site_id]
-        attributes = {}
-        attributes["statusText"] = data["state"]
-        return attributes
+        status = self.coordinator.data["sensors"].get(self._site_id)
+        if status is None:
+            return None
+        return {"statusText": status.state}
+
 
+class XoltaEnergySensor(XoltaBaseSensor, RestoreSensor):
+    """Energy of a site since local midnight.
 
-class XoltaEnergySensor(XoltaBaseSensor):
+    Also updated by the status coordinator, which adds an interim estimate to the
+    totals between telemetry buckets. As the estimate may run ahead of the
+    buckets that replace it, the value never decreases within a day.
+    """
 
     _attr_device_class = SensorDeviceClass.ENERGY
     _attr_state_class = SensorStateClass.TOTAL_INCREASING
     _attr_native_unit_of_measurement = UnitOfEnergy.KILO_WATT_HOUR
     _attr_suggested_display_precision = 1
+    _data_key = "energy"
 
-    def __init__(self, coordinator, site_id, sensor_type, icon, data_property):
-        super().__init__(coordinator, site_id, sensor_type, icon)
+    def __init__(self, coordinator, status_coordinator, site_id, description):
+        super().__init__(coordinator, site_id, description)
+        self._status_coordinator = status_coordinator
         self.entity_id = f"sensor.{self._site_id}_energy_{self._sensor_type}"
-        self._data_property = data_property
+        self._attr_unique_id = f"{self._site_id}-energy-{self._sensor_type}"
+        # Last value written, and the start of the period it counts from
+        self._published: float | None = None
+        self._published_start = None
+
+    def _energy_value(self):
+        """Return the energy, and the start of the period it must not decrease in."""
+        energy = self.coordinator.data["energy"].get(self._site_id)
+        if energy is None:
+            return None, None
+        return self.entity_description.value_fn(energy), energy.day_start
+
+    @property
+    def native_value(self) -> StateType:
+        value, start = self._energy_value()
+        if value is None:
+            return None
+        if self._published is not None and start == self._published_start:
+            return max(value, self._published)
+        return value
+
+    async def async_added_to_hass(self):
+        """When entity is added to hass."""
+        _, start = self._energy_value()
+        last_state = await self.async_get_last_state()
+        last_data = await self.async_get_last_sensor_data()
+        if (
+            start is not None
+            and last_state is not None
+            and last_data is not None
+            and isinstance(last_data.native_value, (int, float))
+            and last_state.last_updated >= start
+        ):
+            # Don't go below the value written before the restart
+            self._published = last_data.native_value
+            self._published_start = start
+
+        self.async_on_remove(
+            self._status_coordinator.async_add_listener(
+                self._handle_coordinator_update, self._site_id
+            )
+        )
+        await super().async_added_to_hass()
+
+    @callback
+    def async_write_ha_state(self) -> None:
+        """Write the state, and remember it as the lowest value for the rest of the period."""
+        super().async_write_ha_state()
+        _, start = self._energy_value()
+        if self.available and start is not None:
+            self._published = self.native_value
+            self._published_start = start
+
+
+class XoltaPeriodEnergySensor(XoltaEnergySensor):
+    """Energy of a site this week, month or year, or in the last 30 days.
+
+    The energy of the days before today comes from the rollups, today's energy is
+    that of the daily sensor. The last 30 days may decrease at midnight, but
+    otherwise the value never decreases within the period.
+    """
+
+    def __init__(self, coordinator, status_coordinator, site_id, description, period):
+        super().__init__(coordinator, status_coordinator, site_id, description)
+        self._period = period
+        self._attr_name = f"{description.name} {PERIOD_NAMES[period]}"
+        self.entity_id = f"sensor.{self._site_id}_energy_{period}_{self._sensor_type}"
+        self._attr_unique_id = f"{self._site_id}-energy-{period}-{self._sensor_type}"
+        if period == PERIOD_ROLLING_30_DAYS:
+            # Not a meter, days drop out of it
+            self._attr_state_class = None
+
+    def _energy_value(self):
+        """Return the energy, and the start of the period it must not decrease in."""
+        energy = self.coordinator.data["energy"].get(self._site_id)
+        before = self.coordinator.data["periods"].get(self._site_id)
+        if energy is None or before is None:
+            return None, None
+        before = before[self._period]
+        value_fn = self.entity_description.value_fn
+        value = value_fn(energy) + value_fn(before)
+        if self._period == PERIOD_ROLLING_30_DAYS:
+            return value, energy.day_start
+        return value, before.day_start
+
+
+class XoltaMetricSensor(CoordinatorEntity, SensorEntity):
+    """Diagnostic sensor with a request metric of the Xolta API client."""
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_entity_registry_enabled_default = False
+    _attr_should_poll = False
+
+    def __init__(
+        self,
+        coordinator,
+        api,
+        config_entry,
+        metric_name,
+        value_fn,
+        attributes_fn=None,
+        device_class=None,
+        units=None,
+        state_class=None,
+    ):
+        super().__init__(coordinator)
+        self._api = api
+        self._value_fn = value_fn
+        self._attributes_fn = attributes_fn
+        self._attr_name = f"Xolta API {metric_name}"
+        self._attr_unique_id = (
+            f"{config_entry.entry_id}-api-{metric_name.lower().replace(' ', '_')}"
+        )
+        self._attr_device_class = device_class
+        self._attr_native_unit_of_measurement = units
+        self._attr_state_class = state_class
+        self._attr_device_info = DeviceInfo(
+            identifiers={(DOMAIN, config_entry.entry_id)},
+            name=f"Xolta account {config_entry.title}",
+            manufacturer="Xolta",
+            model="Cloud API",
+            entry_type=DeviceEntryType.SERVICE,
+        )
 
     @property
-    def unique_id(self) -> str:
-        return f"{self._site_id}-energy-{self._sensor_type}"
+    def available(self):
+        """Metrics are also available, and most useful, when updates fail."""
+        return True
 
     @property
-    def native_value(self) -> float:
-        data = self.coordinator.data["energy"][self._site_id]
-        return data[self._data_property]
+    def native_value(self):
+        return self._value_fn(self._api.metrics)
+
+    @property
+    def extra_state_attributes(self):
+        if self._attributes_fn is None:
+            return None
+        return self._attributes_fn(self._api.metrics)
@@ -0,0 +1,165 @@
+"""Services of the Xolta Battery integration."""
+from __future__ import annotations
+
+from datetime import timedelta
+
+import voluptuous as vol
+
+from homeassistant.config_entries import ConfigEntry, ConfigEntryState
+from homeassistant.core import (
+    HomeAssistant,
+    ServiceCall,
+    ServiceResponse,
+    SupportsResponse,
+)
+from homeassistant.exceptions import HomeAssistantError
+import homeassistant.helpers.config_validation as cv
+from homeassistant.util import dt as dt_util, slugify
+
+from .backfill import async_get_backfill
+from .const import DOMAIN
+from .history import HISTORY_FIELDS
+
+SERVICE_BACKFILL = "backfill"
+SERVICE_QUERY_HISTORY = "query_history"
+SERVICE_EXPORT_CSV = "export_csv"
+
+# Directory in the config directory the CSV exports are written to
+EXPORT_DIR = "export"
+
+ATTR_CONFIG_ENTRY_ID = "config_entry_id"
+ATTR_START_DATE = "start_date"
+ATTR_END_DATE = "end_date"
+ATTR_SITE_ID = "site_id"
+ATTR_WINDOW = "window"
+ATTR_FIELDS = "fields"
+ATTR_PERCENTILES = "percentiles"
+
+BACKFILL_SCHEMA = vol.Schema(
+    {
+        vol.Required(ATTR_START_DATE): cv.date,
+        vol.Optional(ATTR_END_DATE): cv.date,
+        vol.Optional(ATTR_CONFIG_ENTRY_ID): cv.string,
+    }
+)
+
+QUERY_HISTORY_SCHEMA = vol.Schema(
+    {
+        vol.Optional(ATTR_WINDOW, default=timedelta(hours=1)): cv.time_period,
+        vol.Optional(ATTR_FIELDS, default=list(HISTORY_FIELDS)): vol.All(
+            cv.ensure_list, [vol.In(HISTORY_FIELDS)]
+        ),
+        vol.Optional(ATTR_PERCENTILES, default=[50, 90]): vol.All(
+            cv.ensure_list, [vol.All(vol.Coerce(float), vol.Range(min=0, max=100))]
+        ),
+        vol.Optional(ATTR_SITE_ID): cv.string,
+        vol.Optional(ATTR_CONFIG_ENTRY_ID): cv.string,
+    }
+)
+
+EXPORT_CSV_SCHEMA = vol.Schema(
+    {
+        vol.Required(ATTR_START_DATE): cv.date,
+        vol.Optional(ATTR_END_DATE): cv.date,
+        vol.Optional(ATTR_SITE_ID): cv.string,
+        vol.Optional(ATTR_CONFIG_ENTRY_ID): cv.string,
+    }
+)
+
+
+def _loaded_entries(hass: HomeAssistant, call: ServiceCall) -> list[ConfigEntry]:
+    """Return the entry given in the call, or all loaded entries."""
+    if (entry_id := call.data.get(ATTR_CONFIG_ENTRY_ID)) is None:
+        return [
+            entry
+            for entry in hass.config_entries.async_entries(DOMAIN)
+            if entry.state is ConfigEntryState.LOADED
+        ]
+    entry = hass.config_entries.async_get_entry(entry_id)
+    if entry is None or entry.domain != DOMAIN:
+        raise HomeAssistantError(f"Unknown Xolta config entry {entry_id}")
+    if entry.state is not ConfigEntryState.LOADED:
+        raise HomeAssistantError(f"Xolta config entry {entry.title} is not loaded")
+    return [entry]
+
+
+def async_setup_services(hass: HomeAssistant):
+    """Register the services of the integration."""
+
+    async def async_backfill(call: ServiceCall):
+        """Start importing the history of the sites as statistics."""
+        if "recorder" not in hass.config.components:
+            raise HomeAssistantError("Backfilling needs the recorder")
+        start_date = call.data[ATTR_START_DATE]
+        end_date = call.data.get(ATTR_END_DATE)
+        if end_date is not None and end_date < start_date:
+            raise HomeAssistantError("The end date is before the start date")
+        for entry in _loaded_entries(hass, call):
+            async_get_backfill(hass, entry).async_start(start_date, end_date)
+
+    hass.services.async_register(
+        DOMAIN, SERVICE_BACKFILL, async_backfill, schema=BACKFILL_SCHEMA
+    )
+
+    async def async_query_history(call: ServiceCall) -> ServiceResponse:
+        """Return statistics of the recent siteStatus readings, from memory."""
+        since = dt_util.utcnow() - call.data[ATTR_WINDOW]
+        site_id = call.data.get(ATTR_SITE_ID)
+        sites = {}
+        for entry in _loaded_entries(hass, call):
+            api = hass.data[DOMAIN][entry.entry_id]
+            for history_site, history in api.history.items():
+                if site_id is not None and history_site != site_id:
+                    continue
+                stats = history.stats(
+                    since, call.data[ATTR_FIELDS], call.data[ATTR_PERCENTILES]
+                )
+                if stats is not None:
+                    stats["first"] = stats["first"].isoformat()
+                    stats["last"] = stats["last"].isoformat()
+                sites[history_site] = stats
+        if site_id is not None and site_id not in sites:
+            raise HomeAssistantError(f"No readings of Xolta site {site_id}")
+        return {"sites": sites}
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_QUERY_HISTORY,
+        async_query_history,
+        schema=QUERY_HISTORY_SCHEMA,
+        supports_response=SupportsResponse.ONLY,
+    )
+
+    async def async_export_csv(call: ServiceCall) -> ServiceResponse:
+        """Write the archived buckets of each site to a CSV file."""
+        start_date = call.data[ATTR_START_DATE]
+        end_date = call.data.get(ATTR_END_DATE, dt_util.now().date())
+        if end_date < start_date:
+            raise HomeAssistantError("The end date is before the start date")
+        start = dt_util.as_utc(dt_util.start_of_local_day(start_date))
+        end = dt_util.as_utc(dt_util.start_of_local_day(end_date + timedelta(days=1)))
+        site_id = call.data.get(ATTR_SITE_ID)
+        files = {}
+        for entry in _loaded_entries(hass, call):
+            api = hass.data[DOMAIN][entry.entry_id]
+            for api_site in api.sites:
+                if site_id is not None and api_site != site_id:
+                    continue
+                path = hass.config.path(
+                    DOMAIN,
+                    EXPORT_DIR,
+                    f"{slugify(api_site)}_{start_date}_{end_date}.csv",
+                )
+                rows = await api.archive.async_export_csv(api_site, start, end, path)
+                files[api_site] = {"path": path, "rows": rows}
+        if site_id is not None and site_id not in files:
+            raise HomeAssistantError(f"Unknown Xolta site {site_id}")
+        return {"files": files}
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_EXPORT_CSV,
+        async_export_csv,
+        schema=EXPORT_CSV_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
@@ -0,0 +1,53 @@
+"""aiohttp session shared by all Xolta API clients."""
+from __future__ import annotations
+
+import aiohttp
+from aiohttp.hdrs import USER_AGENT
+from homeassistant.const import EVENT_HOMEASSISTANT_CLOSE
+from homeassistant.core import Event, HomeAssistant, callback
+from homeassistant.helpers.aiohttp_client import SERVER_SOFTWARE
+from homeassistant.util import ssl as ssl_util
+
+DATA_SESSION = "xolta_batt_session"
+
+# Connections per host (API cluster, b2clogin and add-on). Matches
+# MAX_TOTAL_CONCURRENT_REQUESTS, so requests don't wait for a connection.
+CONNECTION_LIMIT_PER_HOST = 8
+# Keep idle connections open across a 60 s poll, so TLS handshakes aren't repeated
+KEEPALIVE_TIMEOUT = 75
+# The Azure cluster and b2clogin addresses rarely change
+DNS_CACHE_TTL = 300
+
+
+@callback
+def async_get_session(hass: HomeAssistant) -> aiohttp.ClientSession:
+    """Return the shared session, creating it if needed."""
+    if (session := hass.data.get(DATA_SESSION)) is not None and not session.closed:
+        return session
+
+    connector = aiohttp.TCPConnector(
+        limit_per_host=CONNECTION_LIMIT_PER_HOST,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+        use_dns_cache=True,
+        ttl_dns_cache=DNS_CACHE_TTL,
+        enable_cleanup_closed=True,
+        ssl=ssl_util.get_default_context(),
+    )
+    session = aiohttp.ClientSession(
+        connector=connector, headers={USER_AGENT: SERVER_SOFTWARE}
+    )
+    hass.data[DATA_SESSION] = session
+
+    async def _async_close_session(event: Event) -> None:
+        """Close the session when Home Assistant stops."""
+        await session.close()
+
+    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_CLOSE, _async_close_session)
+
+    return session
+
+
+async def async_close_session(hass: HomeAssistant) -> None:
+    """Close the shared session. A new one is created on the next use."""
+    if (session := hass.data.pop(DATA_SESSION, None)) is not None:
+        await session.close()
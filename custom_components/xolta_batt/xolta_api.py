@@ -1,7 +1,7 @@
 import asyncio
-from datetime import timedelta, timezone, datetime as dt
+import base64
+from datetime import datetime as dt
 import hashlib
-import ciso8601
 import json
 import logging
 import aiohttp
@@ -11,12 +11,41 @@ from homeassistant.core import HomeAssistant
 from homeassistant.util import dt as dt_util
 from homeassistant.helpers.storage import Store
 
+from .archive import TelemetryArchive
+from .breaker import CircuitOpenError, async_get_breaker
+from .cache import TelemetryCache
+from .const import (
+    ENERGY_MAX_GAP_FETCHES,
+    ENERGY_RESOLUTION_MIN,
+    MAX_CONCURRENT_REQUESTS,
+    TOKEN_RENEW_MARGIN_SEC,
+)
+from .decode import TelemetryColumns, decode_telemetry, json_loads
+from .energy import EnergyAccumulator
+from .history import PowerHistory
+from .metrics import (
+    METRIC_DATA_SUMMARY,
+    METRIC_LOGIN,
+    METRIC_SITE_GROUP,
+    METRIC_SITE_STATUS,
+    METRIC_TOKEN,
+    ApiMetrics,
+)
+from .models import SiteStatus
+from .poller import async_get_poller
+from .rollup import EnergyRollup, RollupStore
+from .scheduler import ENDPOINT_ENERGY, ENDPOINT_STATUS, PollScheduler
+
 _LOGGER = logging.getLogger(__name__)
 
 STORAGE_KEY_PREFIX = "xolta_batt_auth_"
 STORAGE_VERSION = 1
 STORAGE_ACCESS_TOKEN = "access_token"
 STORAGE_REFRESH_TOKEN = "refresh_token"
+# Seconds to wait before writing new tokens, so close exchanges result in one write
+STORAGE_SAVE_DELAY = 10
+# Token exchanges in flight, by storage key
+DATA_TOKEN_EXCHANGES = "xolta_batt_token_exchanges"
 
 _LoginUrl = "http://70f0fc4b-xolta-batt-auth-addon:8000/login"
 _TokenURL = "https://xolta.b2clogin.com/145c2c43-a8da-46ab-b5da-1d4de444ed82/b2c_1_sisu/oauth2/v2.0/token"
@@ -33,57 +62,103 @@ class XoltaApi:
         webclient: aiohttp.ClientSession,
         username,
         password,
+        max_concurrent_requests=MAX_CONCURRENT_REQUESTS,
+        token_renew_margin=TOKEN_RENEW_MARGIN_SEC,
     ):
         self._hass = hass
         self._webclient = webclient
+        # Limits the number of requests in flight when fetching sites concurrently
+        self._request_semaphore = asyncio.Semaphore(max_concurrent_requests)
 
         self._username = username
         self._password = password
 
+        # Access tokens are renewed in the background this many seconds before they expire
+        self._token_renew_margin = token_renew_margin
+        self._renew_task: asyncio.Task | None = None
+
         self._prefs = None
+        self._prefs_dirty = False
+        # Identifies the stored data of the account
+        self.storage_key_suffix = hashlib.md5(username.encode()).hexdigest()
         self._store = Store(
             hass,
             STORAGE_VERSION,
-            STORAGE_KEY_PREFIX + hashlib.md5(username.encode()).hexdigest(),
+            STORAGE_KEY_PREFIX + self.storage_key_suffix,
         )
-
-        self._telemetry_data_ts = None
-        self._data = {"sites": None, "sensors": {}, "energy": {}}
+        self._cache = TelemetryCache(hass, self.storage_key_suffix)
+        self._rollup_store = RollupStore(hass, self.storage_key_suffix)
+        # Every bucket fetched, on disk
+        self.archive = TelemetryArchive(hass, self.storage_key_suffix)
+        self._cache_loaded = False
+
+        # Fail fast while the API cluster or the token endpoint is down
+        self._api_breaker = async_get_breaker(hass, _ApiBaseURL)
+        self._token_breaker = async_get_breaker(hass, _TokenURL)
+
+        self._scheduler = PollScheduler()
+        # Shares the requests allowed in flight with the other accounts
+        self._poller = async_get_poller(hass)
+        self.metrics = ApiMetrics()
+        self._energy: dict[str, EnergyAccumulator] = {}
+        self._rollups: dict[str, EnergyRollup] = {}
+        # Recent siteStatus readings per site
+        self.history: dict[str, PowerHistory] = {}
+        # Serializes loading preferences, cache and sites when refreshes run concurrently
+        self._load_lock = asyncio.Lock()
+        self._data = {
+            "sites": None,
+            "sensors": {},
+            "energy": {},
+            # Per site: energy of the week, month, year and 30 days before today
+            "periods": {},
+            # Per endpoint: sites that failed to refresh, and sites polled by the last refresh
+            "stale_sites": {ENDPOINT_STATUS: set(), ENDPOINT_ENERGY: set()},
+            "updated_sites": {ENDPOINT_STATUS: set(), ENDPOINT_ENERGY: set()},
+        }
+
+    @property
+    def sites(self) -> list[str]:
+        """Return the ids of the sites of the account, as of the last refresh."""
+        return [site["siteId"] for site in self._data["sites"] or ()]
 
     async def login(self):
         """Call Xolta Battery authenticator add-on to exchange username+password for access token"""
-        try:
-            if self._prefs is None:
-                await self.async_load_preferences()
+        await self._async_token_exchange(self._async_login)
+        return True
 
+    async def _async_login(self):
+        """Log in using the add-on. Must be called from a token exchange."""
+        try:
             login_data = {"username": self._username, "password": self._password}
 
-            async with self._webclient.post(
-                _LoginUrl, json=login_data
-            ) as login_response:
-
-                login_response.raise_for_status()
+            with self.metrics.measure(METRIC_LOGIN) as measurement:
+                async with self._webclient.post(
+                    _LoginUrl, json=login_data
+                ) as login_response:
 
-                # Process response as JSON
-                json_response = await login_response.json()
+                    login_response.raise_for_status()
 
-                if json_response["status"] == "200":
-                    self._prefs[STORAGE_ACCESS_TOKEN] = json_response["access_token"]
-                    self._prefs[STORAGE_REFRESH_TOKEN] = json_response["refresh_token"]
-                    await self._store.async_save(self._prefs)
-                    return True
+                    # Process response as JSON
+                    measurement.size = len(await login_response.read())
+                    json_response = await login_response.json()
 
-                if json_response["status"] == "400":
-                    # 400 is returned with unknown username / invalid password
-                    raise exceptions.ConfigEntryAuthFailed(
-                        f"Status { json_response['status'] }: { json_response['message'] }"
-                    )
+            if json_response["status"] == "200":
+                self._prefs[STORAGE_ACCESS_TOKEN] = json_response["access_token"]
+                self._prefs[STORAGE_REFRESH_TOKEN] = json_response["refresh_token"]
+                return
 
-                # other error:
-                raise Exception(
-                    f"Error logging in. Status: { json_response['status'] }: { json_response['message'] }"
+            if json_response["status"] == "400":
+                # 400 is returned with unknown username / invalid password
+                raise exceptions.ConfigEntryAuthFailed(
+                    f"Status { json_response['status'] }: { json_response['message'] }"
                 )
 
+            # other error:
+            raise Exception(
+                f"Error logging in. Status: { json_response['status'] }: { json_response['message'] }"
+            )
+
         except exceptions.ConfigEntryAuthFailed:
             raise
 
@@ -102,16 +177,16 @@ class XoltaApi:
 
     async def refresh_tokens(self):
         """Get an access token for the Xolta API from a refresh token"""
+        await self._async_token_exchange(self._async_refresh_tokens)
 
-        if self._prefs is None:
-            await self.async_load_preferences()
-
+    async def _async_refresh_tokens(self):
+        """Exchange the refresh token. Must be called from a token exchange."""
         try:
             _LOGGER.debug("Xolta - Getting API access token from refresh token")
 
             if self._prefs[STORAGE_REFRESH_TOKEN] is None:
                 _LOGGER.debug("No refresh token set. Logging in")
-                await self.login()
+                await self._async_login()
                 return
 
             login_data = {
@@ -120,52 +195,155 @@ class XoltaApi:
             }
 
             # Make POST request to retrieve Authentication Token from Xolta API
-            async with self._webclient.post(
-                _TokenURL, data=login_data, timeout=_RequestTimeout
-            ) as login_response:
-                _LOGGER.debug("Login Response: %s", login_response)
-
-                if login_response.status == 400:
-                    txt = await login_response.text()
-                    if "AADB2C90080" in txt:
-                        _LOGGER.info(
-                            "Could not authenticate against Xolta. Refresh token expired. Logging in using add-on"
-                        )
-                        await self.login()
-                        return
+            with self._token_breaker.request(), self.metrics.measure(
+                METRIC_TOKEN
+            ) as measurement:
+                async with self._webclient.post(
+                    _TokenURL, data=login_data, timeout=_RequestTimeout
+                ) as login_response:
+                    _LOGGER.debug("Login Response: %s", login_response)
+
+                    body = await login_response.read()
+                    measurement.size = len(body)
+                    refresh_token_expired = (
+                        login_response.status == 400 and b"AADB2C90080" in body
+                    )
+                    if not refresh_token_expired:
+                        login_response.raise_for_status()
 
-                login_response.raise_for_status()
+                        # Process response as JSON
+                        json_response = await login_response.json()
 
-                # Process response as JSON
-                json_response = await login_response.json()
+            if refresh_token_expired:
+                _LOGGER.info(
+                    "Could not authenticate against Xolta. Refresh token expired. Logging in using add-on"
+                )
+                await self._async_login()
+                return
 
-                self._prefs[STORAGE_ACCESS_TOKEN] = json_response["access_token"]
-                self._prefs[STORAGE_REFRESH_TOKEN] = json_response["refresh_token"]
-                await self._store.async_save(self._prefs)
+            self._prefs[STORAGE_ACCESS_TOKEN] = json_response["access_token"]
+            self._prefs[STORAGE_REFRESH_TOKEN] = json_response["refresh_token"]
 
-                _LOGGER.debug(
-                    "Xolta - API Token received: %s", self._prefs[STORAGE_ACCESS_TOKEN]
-                )
+            _LOGGER.debug(
+                "Xolta - API Token received: %s", self._prefs[STORAGE_ACCESS_TOKEN]
+            )
 
         except Exception as exception:
             _LOGGER.error("Unable to fetch login token from Xolta API. %s", exception)
             raise
 
-    async def get_data(self, force_renew_token=False, max_token_retries=2):
-        """Get the latest data from the Xolta API and updates the state."""
+    async def _async_token_exchange(self, exchange):
+        """Run a token exchange, or wait for the one already in flight for this account.
+
+        Config flow, setup and data updates may each have their own XoltaApi for
+        the same account. They all share one exchange and one, delayed, write to
+        the store.
+        """
         if self._prefs is None:
             await self.async_load_preferences()
 
+        flights = self._hass.data.setdefault(DATA_TOKEN_EXCHANGES, {})
+        key = self._store.key
+        task = flights.get(key)
+        if task is None:
+
+            async def _async_exchange():
+                await exchange()
+                self._prefs_dirty = True
+                self._store.async_delay_save(self._prefs_to_save, STORAGE_SAVE_DELAY)
+                return dict(self._prefs)
+
+            task = flights[key] = self._hass.async_create_task(_async_exchange())
+
+            def _async_exchange_done(_):
+                if flights.get(key) is task:
+                    del flights[key]
+
+            task.add_done_callback(_async_exchange_done)
+        else:
+            _LOGGER.debug("Waiting for token exchange already in progress")
+
+        self._prefs.update(await asyncio.shield(task))
+
+    async def async_ensure_token(self):
+        """Make sure there is an access token that has not expired.
+
+        A token that expires within the renewal margin is still used, while a
+        new one is fetched in the background.
+        """
+        if self._prefs is None:
+            await self.async_load_preferences()
+
+        token = self._prefs[STORAGE_ACCESS_TOKEN]
+        if token is None:
+            _LOGGER.debug("API token not set, fetching")
+            await self._async_renew_token()
+            return
+
+        expiry = _token_expiry(token)
+        if expiry is None:
+            # Can't tell, rely on the API answering 401
+            return
+
+        remaining = expiry - dt_util.utcnow().timestamp()
+        if remaining <= 0:
+            _LOGGER.debug("API token expired, fetching")
+            await self._async_renew_token()
+        elif remaining <= self._token_renew_margin and self._renew_task is None:
+            _LOGGER.debug("API token expires in %.0f seconds, renewing", remaining)
+            self._start_token_renewal()
+
+    def _start_token_renewal(self) -> asyncio.Task:
+        """Start renewing the access token, unless a renewal is already in flight."""
+        if self._renew_task is None or self._renew_task.done():
+            self._renew_task = self._hass.async_create_background_task(
+                self.refresh_tokens(), "xolta_batt token renewal"
+            )
+            self._renew_task.add_done_callback(self._token_renewal_done)
+        return self._renew_task
+
+    def _token_renewal_done(self, task: asyncio.Task):
+        """Clear the finished renewal. Callers awaiting it get its result."""
+        if self._renew_task is task:
+            self._renew_task = None
+        if not task.cancelled() and task.exception() is not None:
+            _LOGGER.debug("Renewing API token failed: %s", task.exception())
+
+    async def _async_renew_token(self):
+        """Renew the access token, sharing a renewal that is already in flight."""
+        await asyncio.shield(self._start_token_renewal())
+
+    async def get_data(
+        self,
+        force_renew_token=False,
+        max_token_retries=2,
+        endpoints=(ENDPOINT_STATUS, ENDPOINT_ENERGY),
+    ):
+        """Get the latest data from the Xolta API and updates the state.
+
+        Only the given endpoints are polled, for the sites where they are due.
+        """
+        async with self._load_lock:
+            if self._prefs is None:
+                await self.async_load_preferences()
+
+            if not self._cache_loaded:
+                await self.async_load_cache()
+
         try:
+            # (site, endpoint) requests still to be done in this refresh. Kept across
+            # token renewals, so a 401 only repeats what was rejected or not yet sent.
+            pending = None
+            failed = {}
+            now_utc = dt_util.utcnow()
+
             for try_number in range(max_token_retries):
 
-                if self._prefs[STORAGE_ACCESS_TOKEN] is None or force_renew_token:
-                    _LOGGER.debug(
-                        "API token not set (%s) or new token requested (%s), fetching",
-                        self._prefs[STORAGE_ACCESS_TOKEN],
-                        force_renew_token,
-                    )
-                    await self.refresh_tokens()
+                if force_renew_token:
+                    _LOGGER.debug("New API token requested, fetching")
+                    await self._async_renew_token()
+                else:
+                    await self.async_ensure_token()
 
                 try:
                     headers = {
@@ -174,116 +352,89 @@ class XoltaApi:
                         "Authorization": "Bearer " + self._prefs[STORAGE_ACCESS_TOKEN],
                     }
 
-                    if self._data["sites"] is None:
+                    async with self._load_lock:
+                        if self._data["sites"] is None:
 
-                        # Read sites. These probably never changes, so only read them once.
-                        async with await self._webclient.get(
-                            _ApiBaseURL + "SiteGroup",
-                            headers=headers,
-                            timeout=_RequestTimeout,
-                        ) as response:
-
-                            response.raise_for_status()
-                            json_response = await response.json()
+                            # Read sites. These probably never changes, so only read them once.
+                            json_response = await self._async_get_json(
+                                METRIC_SITE_GROUP, headers
+                            )
                             self._data["sites"] = json_response["sites"]
 
-                    for site in self._data["sites"]:
-
-                        site_id = site["siteId"]
-
-                        async with await self._webclient.get(
-                            _ApiBaseURL + "siteStatus",
-                            headers=headers,
-                            params={"siteId": site_id},
-                            timeout=_RequestTimeout,
-                        ) as response:
-
-                            response.raise_for_status()
-                            json_response = await response.json()
-                            self._data["sensors"][site_id] = json_response["data"][0]
-                        
-
-                        # Only refresh energy data every 10 minutes
-                        now_utc = dt_util.utcnow()
+                    if pending is None:
+                        pending = [
+                            (site["siteId"], endpoint)
+                            for site in self._data["sites"]
+                            for endpoint in endpoints
+                            if self._scheduler.is_due(site["siteId"], endpoint, now_utc)
+                        ]
+                        requested = list(pending)
+
+                    # Set by the first 401, requests not sent yet are then held back
+                    unauthorized = asyncio.Event()
+                    results = await asyncio.gather(
+                        *(
+                            self._fetch(site_id, endpoint, headers, now_utc, unauthorized)
+                            for site_id, endpoint in pending
+                        ),
+                        return_exceptions=True,
+                    )
 
-                        if (
-                            self._telemetry_data_ts is None or 
-                            ((now_utc - self._telemetry_data_ts).total_seconds() / 60) >= 10
+                    rejected = []
+                    for item, result in zip(pending, results):
+                        if isinstance(result, _TokenRejected) or (
+                            isinstance(result, aiohttp.ClientResponseError)
+                            and result.status == 401
                         ):
-                            resolution_min = 10
-                            resolution_hour = resolution_min / 60
-
-                            # Query data from midnight (local tz) to now, but query in UTC
-                            now_local = dt_util.as_local(now_utc)
-                            start_of_local_day_utc = dt_util.as_utc(dt_util.start_of_local_day(now_local))
-
-                            params = {
-                                "siteId": site_id,
-                                "CalculateConsumptionNeeded": "true",
-                                "fromDateTime": f"{start_of_local_day_utc.replace(tzinfo=None).isoformat()}Z",
-                                "toDateTime": f"{now_utc.replace(tzinfo=None, microsecond=0).isoformat()}Z",
-                                "resolutionMin": resolution_min,
-                            }
-                            async with await self._webclient.get(
-                                _ApiBaseURL + "GetDataSummary",
-                                headers=headers,
-                                params=params,
-                                timeout=_RequestTimeout,
-                            ) as response:
-
-                                response.raise_for_status()
-
-                                json_response = await response.json()
-                                telemetry_data = json_response["telemetry"]
-
-                                energy_data = {
-                                    "pv": sum(
-                                        t["meterPvActivePowerAggAvgSiteSingle"]
-                                        for t in telemetry_data
-                                    )
-                                    * resolution_hour,
-                                    "consumption": sum(
-                                        t["calculatedConsumption"]
-                                        for t in telemetry_data
-                                    )
-                                    * resolution_hour,
-                                    "battery_charged": sum(
-                                        min(0, t["inverterActivePowerAggAvgSiteSum"])
-                                        for t in telemetry_data
-                                    )
-                                    * -resolution_hour,
-                                    "battery_discharged": sum(
-                                        max(0, t["inverterActivePowerAggAvgSiteSum"])
-                                        for t in telemetry_data
-                                    )
-                                    * resolution_hour,
-                                    "grid_exported": sum(
-                                        min(
-                                            0, t["meterGridActivePowerAggAvgSiteSingle"]
-                                        )
-                                        for t in telemetry_data
-                                    )
-                                    * -resolution_hour,
-                                    "grid_imported": sum(
-                                        max(
-                                            0, t["meterGridActivePowerAggAvgSiteSingle"]
-                                        )
-                                        for t in telemetry_data
-                                    )
-                                    * resolution_hour,
-                                    "dt": telemetry_data
-                                    and ciso8601.parse_datetime(
-                                        telemetry_data[-1]["utcEndTime"]
-                                    )
-                                    or None,
-                                }
-                                self._telemetry_data_ts = energy_data["dt"] or now_utc
-                                self._data["energy"][site_id] = energy_data
+                            rejected.append(item)
+                        elif isinstance(result, Exception):
+                            failed[item] = result
+                        elif isinstance(result, BaseException):
+                            raise result
+                    pending = rejected
+
+                    if pending:
+                        # Handled below by renewing the token and resuming
+                        raise _TokenRejected
+
+                    stale_sites = {}
+                    for (site_id, _), err in failed.items():
+                        stale_sites.setdefault(site_id, err)
+
+                    if failed and len(failed) == len(requested):
+                        # Nothing could be fetched, so fail the whole refresh
+                        raise next(iter(failed.values()))
+
+                    for site_id, err in stale_sites.items():
+                        _LOGGER.warning(
+                            "Unable to fetch data for Xolta site %s, keeping previous values. %s",
+                            site_id,
+                            err,
+                        )
 
+                    for endpoint in endpoints:
+                        self._data["stale_sites"][endpoint] = {
+                            site_id for site_id, failed_endpoint in failed
+                            if failed_endpoint == endpoint
+                        }
+                        self._data["updated_sites"][endpoint] = {
+                            site_id for site_id, requested_endpoint in requested
+                            if requested_endpoint == endpoint
+                        }
+                    if len(failed) < len(requested):
+                        # Not when nothing was due
+                        self.metrics.last_success = now_utc
+                    if any(
+                        endpoint == ENDPOINT_ENERGY and (site_id, endpoint) not in failed
+                        for site_id, endpoint in requested
+                    ):
+                        self._cache.async_schedule_save(self._data["sites"], self._energy)
+                        self._rollup_store.async_schedule_save(self._rollups)
                     return self._data
 
-                except aiohttp.ClientResponseError as err:
-                    if err.status == 401:
+                except (aiohttp.ClientResponseError, _TokenRejected) as err:
+                    if isinstance(err, _TokenRejected) or err.status == 401:
+                        self.metrics.token_renewals_401 += 1
                         _LOGGER.debug(
                             "Unauthorized call to Xolta API. Renewing token (try %s of %s time(s))",
                             try_number + 1,
@@ -295,12 +446,215 @@ class XoltaApi:
                     raise
 
             _LOGGER.info("Xolta - Maximum token fetch tries reached, aborting for now")
+            self.metrics.out_of_retries += 1
             raise OutOfRetries
 
+        except CircuitOpenError as exception:
+            # Already logged when the breaker opened
+            _LOGGER.debug("Not fetching data from Xolta api. %s", exception)
+            raise
+
         except Exception as exception:
             _LOGGER.error("Unable to fetch data from Xolta api. %s", exception)
             raise
 
+    async def _fetch(self, site_id, endpoint, headers, now_utc, unauthorized):
+        """Fetch one endpoint for one site."""
+        if endpoint == ENDPOINT_STATUS:
+            await self._fetch_status(site_id, headers, now_utc, unauthorized)
+        else:
+            await self._fetch_energy(site_id, headers, now_utc, unauthorized)
+
+    async def _fetch_status(self, site_id, headers, now_utc, unauthorized=None):
+        """Fetch the current status of a site."""
+        json_response = await self._async_get_json(
+            METRIC_SITE_STATUS, headers, {"siteId": site_id}, unauthorized
+        )
+        status = SiteStatus.from_json(json_response["data"][0])
+        self._data["sensors"][site_id] = status
+        if (history := self.history.get(site_id)) is None:
+            history = self.history[site_id] = PowerHistory()
+        history.add(status, now_utc)
+
+        # Energy totals move between telemetry buckets
+        accumulator = self._energy.setdefault(site_id, EnergyAccumulator())
+        accumulator.add_status(status, now_utc)
+        self._update_energy(site_id, accumulator)
+
+        self._scheduler.status_polled(site_id, status, now_utc)
+
+    async def _fetch_energy(self, site_id, headers, now_utc, unauthorized=None):
+        """Fetch the telemetry buckets of a site that closed since the last call."""
+
+        accumulator = self._energy.setdefault(site_id, EnergyAccumulator())
+        from_utc, to_utc = accumulator.window(now_utc)
+
+        params = {
+            "siteId": site_id,
+            "CalculateConsumptionNeeded": "true",
+            "fromDateTime": _format_utc(from_utc),
+            "toDateTime": _format_utc(to_utc),
+            "resolutionMin": accumulator.resolution_min,
+        }
+        telemetry = await self._async_get_json(
+            METRIC_DATA_SUMMARY, headers, params, unauthorized, decode_telemetry
+        )
+        accumulator.add(telemetry, to_utc)
+        self._rollups.setdefault(site_id, EnergyRollup()).add(
+            telemetry, from_utc, to_utc, accumulator.resolution_min
+        )
+        self.archive.async_append(site_id, telemetry, from_utc, to_utc)
+        await self._repair_gaps(site_id, accumulator, headers, unauthorized)
+
+        self._update_energy(site_id, accumulator)
+        self._scheduler.energy_polled(site_id, accumulator.last_end, now_utc)
+
+    async def _repair_gaps(
+        self, site_id, accumulator: EnergyAccumulator, headers, unauthorized=None
+    ):
+        """Fetch again the oldest ranges of buckets missing from earlier responses.
+
+        A failed fetch only counts against the tries of the range, it doesn't fail
+        the refresh. Ranges left over are fetched on later polls. A rejected token
+        is raised, so the site is fetched again with the renewed token.
+        """
+        for gap in accumulator.gaps[:ENERGY_MAX_GAP_FETCHES]:
+            start, end, _ = gap
+            from_utc = dt_util.utc_from_timestamp(start)
+            to_utc = dt_util.utc_from_timestamp(end)
+            params = {
+                "siteId": site_id,
+                "CalculateConsumptionNeeded": "true",
+                "fromDateTime": _format_utc(from_utc),
+                "toDateTime": _format_utc(to_utc),
+                "resolutionMin": accumulator.resolution_min,
+            }
+            try:
+                telemetry = await self._async_get_json(
+                    METRIC_DATA_SUMMARY, headers, params, unauthorized, decode_telemetry
+                )
+            except CircuitOpenError:
+                # Tried again once the API is back
+                return
+            except Exception as err:  # pylint: disable=broad-except
+                if isinstance(err, _TokenRejected) or (
+                    isinstance(err, aiohttp.ClientResponseError) and err.status == 401
+                ):
+                    raise
+                _LOGGER.debug(
+                    "Unable to fetch missing telemetry of Xolta site %s: %s", site_id, err
+                )
+                accumulator.repair_failed(gap)
+                continue
+            accumulator.add_repair(telemetry, gap)
+            self._rollups.setdefault(site_id, EnergyRollup()).add(
+                telemetry, from_utc, to_utc, accumulator.resolution_min
+            )
+            self.archive.async_append(site_id, telemetry, from_utc, to_utc, late=True)
+
+    async def async_get_telemetry(
+        self,
+        site_id,
+        from_utc: dt,
+        to_utc: dt,
+        resolution_min=ENERGY_RESOLUTION_MIN,
+    ) -> TelemetryColumns:
+        """Fetch the telemetry buckets of a site ending within from_utc - to_utc.
+
+        Used for backfills. The request shares the limits of the refreshes, and is
+        repeated once with a new token if the token is rejected.
+        """
+        params = {
+            "siteId": site_id,
+            "CalculateConsumptionNeeded": "true",
+            "fromDateTime": _format_utc(from_utc),
+            "toDateTime": _format_utc(to_utc),
+            "resolutionMin": resolution_min,
+        }
+        for try_number in range(2):
+            if try_number:
+                await self._async_renew_token()
+            else:
+                await self.async_ensure_token()
+            headers = {
+                "Accept": "application/json",
+                "Cache-Control": "no-cache",
+                "Authorization": "Bearer " + self._prefs[STORAGE_ACCESS_TOKEN],
+            }
+            try:
+                return await self._async_get_json(
+                    METRIC_DATA_SUMMARY, headers, params, decode=decode_telemetry
+                )
+            except aiohttp.ClientResponseError as err:
+                if err.status != 401 or try_number:
+                    raise
+                self.metrics.token_renewals_401 += 1
+                _LOGGER.debug("Unauthorized call to Xolta API. Renewing token")
+
+    def _update_energy(self, site_id, accumulator: EnergyAccumulator):
+        """Update the energy of a site since midnight, and of the periods before."""
+        self._data["energy"][site_id] = accumulator.snapshot()
+        if (rollup := self._rollups.get(site_id)) is None:
+            rollup = self._rollups[site_id] = EnergyRollup()
+        today = dt_util.as_local(accumulator.day_start).date()
+        self._data["periods"][site_id] = rollup.periods(today)
+
+    async def _async_get_json(
+        self, endpoint, headers, params=None, unauthorized=None, decode=json_loads
+    ):
+        """GET an API endpoint and return the response body, decoded by decode.
+
+        If given, the unauthorized event is set on a 401, and requests still waiting
+        for a slot raise _TokenRejected instead of being sent with the rejected token.
+        """
+        async with self._request_semaphore, self._poller.request_slot():
+            if unauthorized is not None and unauthorized.is_set():
+                raise _TokenRejected
+            with self._api_breaker.request(), self.metrics.measure(
+                endpoint
+            ) as measurement:
+                async with await self._webclient.get(
+                    _ApiBaseURL + endpoint,
+                    headers=headers,
+                    params=params,
+                    timeout=_RequestTimeout,
+                ) as response:
+
+                    if response.status == 401 and unauthorized is not None:
+                        unauthorized.set()
+                    response.raise_for_status()
+                    body = await response.read()
+                    measurement.size = len(body)
+            return decode(body)
+
+    async def async_load_cache(self):
+        """Resume from the sites, telemetry and energy rollups stored before the last restart."""
+        self._cache_loaded = True
+        sites, accumulators = await self._cache.async_load()
+        for site_id, rollup in (await self._rollup_store.async_load()).items():
+            self._rollups.setdefault(site_id, rollup)
+
+        if self._data["sites"] is None:
+            self._data["sites"] = sites
+
+        for site_id, accumulator in accumulators.items():
+            if site_id not in self._energy:
+                self._energy[site_id] = accumulator
+                self._update_energy(site_id, accumulator)
+
+    def _prefs_to_save(self):
+        """Return the preferences to write to the store."""
+        self._prefs_dirty = False
+        return self._prefs
+
+    async def async_flush(self):
+        """Write tokens and cache that are waiting for a delayed save."""
+        if self._prefs_dirty:
+            await self._store.async_save(self._prefs_to_save())
+        await self._cache.async_flush()
+        await self._rollup_store.async_flush()
+        await self.archive.async_flush()
+
     async def async_load_preferences(self):
         """Load preferences with stored tokens."""
         self._prefs = await self._store.async_load()
@@ -309,5 +663,24 @@ class XoltaApi:
             self._prefs = {STORAGE_ACCESS_TOKEN: None, STORAGE_REFRESH_TOKEN: None}
 
 
+def _token_expiry(token: str) -> float | None:
+    """Return the expiry (unix time) of a JWT access token, without verifying it."""
+    try:
+        payload = token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        return float(claims["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+def _format_utc(value: dt) -> str:
+    """Format an aware datetime the way the Xolta API expects it."""
+    return f"{dt_util.as_utc(value).replace(tzinfo=None, microsecond=0).isoformat()}Z"
+
+
 class OutOfRetries(exceptions.HomeAssistantError):
     """Error to indicate too many error attempts."""
+
+
+class _TokenRejected(Exception):
+    """A request held back because another request of the refresh got a 401."""
@@ -0,0 +1 @@
+"""Benchmarks for the Xolta Battery integration."""
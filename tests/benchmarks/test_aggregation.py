@@ -0,0 +1,148 @@
+"""Benchmark energy aggregation over synthetic telemetry.
+
+Not part of the default test run. Run with:
+python -m pytest tests/benchmarks -m benchmark -s --no-cov
+"""
+from array import array
+import math
+import random
+import timeit
+from unittest.mock import patch
+
+import pytest
+
+from custom_components.xolta_batt import aggregation
+from custom_components.xolta_batt.aggregation import (
+    TELEMETRY_FIELDS,
+    aggregate_energy_columns,
+    np,
+)
+
+RESOLUTION_MIN = 10
+BUCKETS_PER_DAY = 24 * 60 // RESOLUTION_MIN
+DAYS = (1, 30, 365)
+
+pytestmark = pytest.mark.benchmark
+
+
+def make_telemetry(days, seed=1):
+    """Return synthetic GetDataSummary buckets covering the given number of days."""
+    rnd = random.Random(seed)
+    telemetry = []
+    for i in range(days * BUCKETS_PER_DAY):
+        daylight = max(0.0, math.sin((i % BUCKETS_PER_DAY) / BUCKETS_PER_DAY * math.pi))
+        pv = 5 * daylight * rnd.random()
+        consumption = 0.3 + 2 * rnd.random()
+        battery = rnd.uniform(-3, 3)
+        telemetry.append(
+            {
+                "meterPvActivePowerAggAvgSiteSingle": pv,
+                "calculatedConsumption": consumption,
+                "inverterActivePowerAggAvgSiteSum": battery,
+                "meterGridActivePowerAggAvgSiteSingle": consumption - pv - battery,
+            }
+        )
+    return telemetry
+
+
+def legacy_aggregate(telemetry_data, resolution_hour):
+    """The six-pass aggregation previously inlined in XoltaApi.get_data."""
+    return {
+        "pv": sum(t["meterPvActivePowerAggAvgSiteSingle"] for t in telemetry_data)
+        * resolution_hour,
+        "consumption": sum(t["calculatedConsumption"] for t in telemetry_data)
+        * resolution_hour,
+        "battery_charged": sum(
+            min(0, t["inverterActivePowerAggAvgSiteSum"]) for t in telemetry_data
+        )
+        * -resolution_hour,
+        "battery_discharged": sum(
+            max(0, t["inverterActivePowerAggAvgSiteSum"]) for t in telemetry_data
+        )
+        * resolution_hour,
+        "grid_exported": sum(
+            min(0, t["meterGridActivePowerAggAvgSiteSingle"]) for t in telemetry_data
+        )
+        * -resolution_hour,
+        "grid_imported": sum(
+            max(0, t["meterGridActivePowerAggAvgSiteSingle"]) for t in telemetry_data
+        )
+        * resolution_hour,
+    }
+
+
+def single_pass_aggregate(pv, consumption, battery, grid, resolution_hour):
+    """One Python loop over all four columns, the alternative to separate passes."""
+    totals = dict.fromkeys(aggregation.ENERGY_KEYS, 0.0)
+    for pv_power, consumption_power, battery_power, grid_power in zip(
+        pv, consumption, battery, grid
+    ):
+        totals["pv"] += pv_power
+        totals["consumption"] += consumption_power
+        if battery_power < 0:
+            totals["battery_charged"] -= battery_power
+        else:
+            totals["battery_discharged"] += battery_power
+        if grid_power < 0:
+            totals["grid_exported"] -= grid_power
+        else:
+            totals["grid_imported"] += grid_power
+    return {key: value * resolution_hour for key, value in totals.items()}
+
+
+def to_columns(telemetry):
+    """Split buckets into per-field columns, the way decode_telemetry returns them."""
+    return [array("d", (t[field] for t in telemetry)) for field in TELEMETRY_FIELDS]
+
+
+def throughput(func, telemetry):
+    """Return buckets/sec for func over telemetry (best of 5 runs)."""
+    number = max(1, 20000 // len(telemetry))
+    best = min(timeit.repeat(lambda: func(telemetry), number=number, repeat=5))
+    return len(telemetry) * number / best
+
+
+def test_aggregation_throughput():
+    """Print the buckets per second of each aggregation, checking they agree."""
+    resolution_hour = RESOLUTION_MIN / 60
+    # Column extraction is not timed, as the integration decodes responses
+    # straight into columns
+    columns_cache = {}
+
+    def columnar(t):
+        if id(t) not in columns_cache:
+            columns_cache[id(t)] = to_columns(t)
+        return aggregate_energy_columns(*columns_cache[id(t)], resolution_hour)
+
+    def columnar_without_numpy(t):
+        with patch.object(aggregation, "np", None):
+            return columnar(t)
+
+    def columnar_single_pass(t):
+        columnar(t)
+        return single_pass_aggregate(*columns_cache[id(t)], resolution_hour)
+
+    implementations = {
+        "legacy (6 passes)": lambda t: legacy_aggregate(t, resolution_hour),
+        "columns, one loop": columnar_single_pass,
+        "columns, no NumPy": columnar_without_numpy,
+    }
+    if np is not None:
+        # NumPy from NUMPY_MIN_BUCKETS buckets on
+        implementations["columns"] = columnar
+    else:
+        print("NumPy not installed, skipping the NumPy path")
+
+    print(f"\n{'range':>8} {'buckets':>8}  " + "  ".join(f"{name:>18}" for name in implementations))
+    for days in DAYS:
+        telemetry = make_telemetry(days)
+        expected = legacy_aggregate(telemetry, resolution_hour)
+        results = []
+        for func in implementations.values():
+            result = func(telemetry)
+            assert all(math.isclose(result[k], expected[k]) for k in expected)
+            results.append(throughput(func, telemetry))
+        print(
+            f"{days:>6} d {len(telemetry):>8}  "
+            + "  ".join(f"{rate:>12,.0f} b/s" for rate in results)
+        )
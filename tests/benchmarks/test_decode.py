@@ -0,0 +1,130 @@
+"""Benchmark decoding of GetDataSummary responses.
+
+Not part of the default test run. Run with:
+python -m pytest tests/benchmarks -m benchmark -s --no-cov
+"""
+from datetime import datetime, timedelta, timezone
+import json
+import math
+import random
+import timeit
+import tracemalloc
+
+import ciso8601
+import pytest
+
+from custom_components.xolta_batt import decode
+from custom_components.xolta_batt.aggregation import TELEMETRY_FIELDS
+from custom_components.xolta_batt.decode import decode_telemetry
+
+RESOLUTION_MIN = 10
+BUCKETS_PER_DAY = 24 * 60 // RESOLUTION_MIN
+DAYS = (1, 30, 365)
+
+pytestmark = pytest.mark.benchmark
+# The API returns many more fields per bucket than the energy totals use
+UNUSED_FIELDS = (
+    "meterPvActivePowerAggAvgSiteSum",
+    "inverterActivePowerAggAvgSiteSingle",
+    "bmsSocRawArrayCloudTrimmedAggAvg",
+    "bmsSohRawArrayAggAvg",
+    "inverterReactivePowerAggAvg",
+    "meterGridReactivePowerAggAvg",
+    "gridFrequencyAggAvg",
+    "temperatureAggAvg",
+)
+
+
+def make_body(days, seed=1):
+    """Return a synthetic GetDataSummary response body covering the given number of days."""
+    rnd = random.Random(seed)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    telemetry = []
+    for i in range(days * BUCKETS_PER_DAY):
+        daylight = max(0.0, math.sin((i % BUCKETS_PER_DAY) / BUCKETS_PER_DAY * math.pi))
+        pv = 5 * daylight * rnd.random()
+        consumption = 0.3 + 2 * rnd.random()
+        battery = rnd.uniform(-3, 3)
+        end = start + timedelta(minutes=RESOLUTION_MIN * (i + 1))
+        telemetry.append(
+            {
+                "utcEndTime": end.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "meterPvActivePowerAggAvgSiteSingle": pv,
+                "calculatedConsumption": consumption,
+                "inverterActivePowerAggAvgSiteSum": battery,
+                "meterGridActivePowerAggAvgSiteSingle": consumption - pv - battery,
+                **{field: rnd.random() for field in UNUSED_FIELDS},
+            }
+        )
+    return json.dumps({"telemetry": telemetry}).encode()
+
+
+def legacy_decode(body):
+    """Decode the whole response with the json module, as response.json() did."""
+    telemetry = json.loads(body)["telemetry"]
+    for bucket in telemetry:
+        bucket["utcEndTime"] = ciso8601.parse_datetime(bucket["utcEndTime"])
+    return telemetry
+
+
+def stdlib_decode(body):
+    """decode_telemetry with the json module fallback."""
+    json_loads = decode.json_loads
+    decode.json_loads = json.loads
+    try:
+        return decode_telemetry(body)
+    finally:
+        decode.json_loads = json_loads
+
+
+def measure(func, body):
+    """Return ms per decode (best of 5), and peak and retained KiB for func over body."""
+    number = max(1, 200 // (len(body) // 100_000 + 1))
+    best = min(timeit.repeat(lambda: func(body), number=number, repeat=5))
+
+    tracemalloc.start()
+    try:
+        result = func(body)
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return best / number * 1000, peak / 1024, retained / 1024
+
+
+def test_decode_time_and_memory():
+    """Print the time and memory of each decoder, checking they agree."""
+    implementations = {
+        "json, whole buckets": legacy_decode,
+        "json, columns": stdlib_decode,
+    }
+    if decode.orjson is not None:
+        implementations["orjson, columns"] = decode_telemetry
+    else:
+        print("orjson not installed, skipping the fast parser")
+
+    print("\nTime per decode, and peak / retained memory")
+    print(
+        f"{'range':>8} {'buckets':>8} {'body KiB':>9}  "
+        + "  ".join(f"{name:>37}" for name in implementations)
+    )
+    for days in DAYS:
+        body = make_body(days)
+        expected = legacy_decode(body)
+        results = []
+        for func in implementations.values():
+            result = func(body)
+            if func is not legacy_decode:
+                assert len(result) == len(expected)
+                assert all(
+                    math.isclose(sum(result.columns[field]), sum(b[field] for b in expected))
+                    for field in TELEMETRY_FIELDS
+                )
+            results.append(measure(func, body))
+        print(
+            f"{days:>6} d {len(expected):>8} {len(body) / 1024:>9.0f}  "
+            + "  ".join(
+                f"{ms:>8.2f} ms {peak:>7.0f} / {retained:>7.0f} KiB"
+                for ms, peak, retained in results
+            )
+        )
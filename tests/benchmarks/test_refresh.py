@@ -0,0 +1,139 @@
+"""End-to-end refresh benchmarks against the local Xolta stand-in server.
+
+Not part of the default test run. Run with:
+python -m pytest tests/benchmarks -m benchmark -s --no-cov
+"""
+import asyncio
+from datetime import timedelta
+import time
+import tracemalloc
+
+import pytest
+from homeassistant.util import dt as dt_util
+from pytest_homeassistant_custom_component.common import async_fire_time_changed
+
+from custom_components.xolta_batt.const import DOMAIN
+from custom_components.xolta_batt.session import async_get_session
+from custom_components.xolta_batt.xolta_api import XoltaApi
+
+pytestmark = pytest.mark.benchmark
+
+
+def report(name, stub, wall_time, peak_memory=None, refreshes=1, clock="wall"):
+    """Print a benchmark result line."""
+    line = (
+        f"{name:<40} {clock} {wall_time * 1000:9.1f} ms"
+        f"  per refresh {wall_time / refreshes * 1000:7.2f} ms"
+        f"  requests {stub.request_count:5}"
+        f"  bytes {stub.bytes_sent:9}"
+    )
+    if peak_memory is not None:
+        line += f"  peak {peak_memory / 1024:8.1f} KiB"
+    print(f"\n{line}  {stub.requests}")
+
+
+async def _run(hass, stub, refresh):
+    """Run refresh twice, timed and with tracemalloc, and return time and peak memory."""
+    start = time.perf_counter()
+    await refresh()
+    wall_time = time.perf_counter() - start
+
+    tracemalloc.start()
+    try:
+        await refresh()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return wall_time, peak_memory
+
+
+@pytest.mark.parametrize(("site_count", "latency"), [(1, 0.0), (10, 0.0), (10, 0.05)])
+async def test_cold_refresh(hass, stub, site_count, latency):
+    """Benchmark the first refresh: login, sites, status and the day's telemetry."""
+    stub.config.site_count = site_count
+    stub.config.latency = latency
+
+    async def refresh():
+        api = XoltaApi(hass, async_get_session(hass), f"user-{time.monotonic()}", "pw")
+        data = await api.get_data()
+        assert len(data["sensors"]) == site_count
+
+    wall_time, peak_memory = await _run(hass, stub, refresh)
+    # Requests and bytes of a single run
+    stub.requests = {key: value // 2 for key, value in stub.requests.items()}
+    stub.bytes_sent //= 2
+    report(
+        f"cold refresh, {site_count} sites, {latency * 1000:.0f} ms",
+        stub,
+        wall_time,
+        peak_memory,
+    )
+
+
+async def test_refresh_with_401(hass, stub):
+    """Benchmark a refresh where the API rejects the token halfway."""
+    stub.config.site_count = 10
+    api = XoltaApi(hass, async_get_session(hass), "user", "pw")
+    await api.get_data()
+    stub.requests = {}
+    stub.bytes_sent = 0
+    # The next refresh asks both endpoints for every site, reject the fifth request
+    stub.config.inject_401 = {stub._api_requests + 5}
+    api._scheduler._due.clear()
+
+    start = time.perf_counter()
+    await api.get_data()
+    report("refresh with 401, 10 sites", stub, time.perf_counter() - start)
+    assert stub.requests["token"] == 1
+    # Only the rejected request is repeated
+    assert stub.requests["siteStatus"] + stub.requests["GetDataSummary"] == 2 * 10 + 1
+
+
+async def test_day_of_polls(hass, stub, freezer):
+    """Benchmark a day of once-a-minute polls, including token rollovers."""
+    stub.config.site_count = 2
+    freezer.move_to(dt_util.start_of_local_day() + timedelta(minutes=5))
+    api = XoltaApi(hass, async_get_session(hass), "user", "pw")
+
+    async def refresh():
+        for _ in range(24 * 60):
+            await api.get_data()
+            if api._renew_task is not None:
+                # Finish background token renewals before the clock jumps
+                await api._renew_task
+            freezer.tick(timedelta(minutes=1))
+
+    # The frozen clock doesn't move while polling, so report CPU time
+    start = time.process_time()
+    await refresh()
+    report(
+        "day of polls, 2 sites",
+        stub,
+        time.process_time() - start,
+        refreshes=24 * 60,
+        clock="cpu ",
+    )
+
+
+async def test_coordinator_refresh(hass, stub, setup_entry):
+    """Benchmark setting up the sensor platform and a coordinator refresh."""
+    stub.config.site_count = 3
+
+    start = time.perf_counter()
+    entry = await setup_entry()
+    report("entry setup incl. first refresh, 3 sites", stub, time.perf_counter() - start)
+
+    coordinators = [
+        hass.data["sensor"].get_entity(entity_id).coordinator
+        for entity_id in ("sensor.site0_pv_power", "sensor.site0_energy_pv_energy")
+    ]
+    # Make every endpoint due again
+    hass.data[DOMAIN][entry.entry_id]._scheduler._due.clear()
+    stub.requests = {}
+    stub.bytes_sent = 0
+    start = time.perf_counter()
+    await asyncio.gather(*(coordinator.async_refresh() for coordinator in coordinators))
+    report("status and energy coordinator refresh, 3 sites", stub, time.perf_counter() - start)
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+    async_fire_time_changed(hass)
@@ -0,0 +1,53 @@
+"""Global fixtures for the Xolta Battery integration."""
+from homeassistant.config_entries import ConfigEntryState
+import pytest
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.xolta_batt.const import DOMAIN
+from custom_components.xolta_batt.session import async_close_session
+from tests.xolta_stub import StubConfig, XoltaStub
+
+pytest_plugins = "pytest_homeassistant_custom_component"
+
+
+@pytest.fixture(autouse=True)
+def auto_enable_custom_integrations(enable_custom_integrations):
+    """Enable loading the custom integration in all tests."""
+    yield
+
+
+@pytest.fixture
+async def stub(hass, socket_enabled, tmp_path):
+    """Start the stand-in server and point the integration at it."""
+    # Files the integration writes, such as the telemetry archive
+    hass.config.config_dir = str(tmp_path)
+    server = XoltaStub(StubConfig())
+    await server.start()
+    with server.patch_urls():
+        yield server
+    await async_close_session(hass)
+    await server.stop()
+
+
+@pytest.fixture
+async def setup_entry(hass, stub):
+    """Return a function setting up a config entry of the stand-in account."""
+    entries = []
+
+    async def setup(title="user", data=None, **kwargs) -> MockConfigEntry:
+        entry = MockConfigEntry(
+            domain=DOMAIN,
+            title=title,
+            data=data or {"username": "user", "password": "pw"},
+            **kwargs,
+        )
+        entry.add_to_hass(hass)
+        entries.append(entry)
+        assert await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+        return entry
+
+    yield setup
+    for entry in entries:
+        if entry.state is ConfigEntryState.LOADED:
+            await hass.config_entries.async_unload(entry.entry_id)
@@ -0,0 +1,124 @@
+"""Test the on-disk telemetry archive."""
+import csv
+from datetime import datetime, timedelta, timezone
+import os
+
+from pytest_homeassistant_custom_component.common import async_fire_time_changed
+
+from custom_components.xolta_batt.aggregation import FIELD_PV
+from custom_components.xolta_batt.archive import ARCHIVE_INDEX_STRIDE, SiteArchive
+from custom_components.xolta_batt.const import DOMAIN
+from tests.test_energy import telemetry
+
+START = datetime(2024, 6, 1, tzinfo=timezone.utc)
+RESOLUTION = timedelta(minutes=10)
+
+
+def buckets(first, count):
+    """Return count buckets from the first-th after START, PV is the bucket number."""
+    return telemetry(
+        *((START + RESOLUTION * i, float(i)) for i in range(first, first + count))
+    )
+
+
+def test_append_and_range_reads(tmp_path):
+    """Test appends skip archived buckets, and reads return exactly the range."""
+    archive = SiteArchive(str(tmp_path / "site0"))
+    first = buckets(1, 1000)
+    assert archive.append(first.ends, first.columns) == 1000
+    # Overlapping with what is archived already
+    second = buckets(900, 200)
+    assert archive.append(second.ends, second.columns) == 99
+    assert archive.rows() == 1099
+    assert os.path.getsize(tmp_path / "site0" / "index.bin") == 8 * -(
+        -1099 // ARCHIVE_INDEX_STRIDE
+    )
+
+    read = archive.read(
+        (START + RESOLUTION * 300).timestamp(), (START + RESOLUTION * 700).timestamp()
+    )
+    assert len(read) == 400
+    assert read.ends[0] == (START + RESOLUTION * 301).timestamp()
+    assert list(read.columns[FIELD_PV][:2]) == [301.0, 302.0]
+    assert len(archive.read(0, START.timestamp())) == 0
+    assert sum(len(batch) for batch in archive.scan(0, 2e9, batch_rows=100)) == 1099
+
+
+def test_incomplete_row_is_dropped(tmp_path):
+    """Test values of a row whose end time wasn't written are overwritten."""
+    archive = SiteArchive(str(tmp_path / "site0"))
+    first = buckets(1, 10)
+    archive.append(first.ends, first.columns)
+    # A crash after writing the PV value of the next row
+    with open(tmp_path / "site0" / "pv.bin", "ab") as file:
+        file.write(b"\0\0\0\0")
+
+    second = buckets(11, 5)
+    archive.append(second.ends, second.columns)
+    assert list(archive.read(0, 2e9).columns[FIELD_PV]) == [float(i) for i in range(1, 16)]
+
+
+def test_late_buckets_are_merged_into_reads(tmp_path):
+    """Test buckets older than the last row are inserted, and read in time order."""
+    archive = SiteArchive(str(tmp_path / "site0"))
+    first = buckets(1, 100)
+    # Buckets 40 - 49 and 90 are missing
+    keep = [i for i in range(100) if not 39 <= i < 49 and i != 89]
+    archive.append(
+        [first.ends[i] for i in keep],
+        {field: [column[i] for i in keep] for field, column in first.columns.items()},
+    )
+
+    repaired = buckets(40, 20)
+    assert archive.insert(repaired.ends, repaired.columns) == 10
+    # Archived already, the newer ones are appended
+    again = buckets(45, 70)
+    assert archive.insert(again.ends, again.columns) == 1 + 14
+    # The late ones are kept apart
+    assert archive.rows() == 114 - 11
+
+    read = archive.read(0, 2e9)
+    assert list(read.columns[FIELD_PV]) == [float(i) for i in range(1, 115)]
+    batches = list(archive.scan(0, 2e9, batch_rows=30))
+    assert [end for batch in batches for end in batch.ends] == list(read.ends)
+    late = archive.read(
+        (START + RESOLUTION * 41).timestamp(), (START + RESOLUTION * 44).timestamp()
+    )
+    assert list(late.columns[FIELD_PV]) == [42.0, 43.0, 44.0]
+
+
+async def test_fetched_buckets_are_archived_and_exported(
+    hass, stub, setup_entry, freezer
+):
+    """Test the buckets of each refresh are archived and can be exported."""
+    freezer.move_to(datetime(2024, 6, 1, 10, 5, tzinfo=timezone.utc))
+    entry = await setup_entry()
+    for _ in range(3):
+        freezer.tick(timedelta(minutes=10))
+        async_fire_time_changed(hass)
+        await hass.async_block_till_done()
+
+    api = hass.data[DOMAIN][entry.entry_id]
+    archived = await api.archive.async_read("site0", START, START + timedelta(days=1))
+    # Local midnight (US/Pacific) until 10:30
+    assert len(archived) == (10 * 60 + 30 - 7 * 60) // 10
+    assert list(archived.ends) == sorted(set(archived.ends))
+
+    requests = stub.request_count
+    response = await hass.services.async_call(
+        DOMAIN,
+        "export_csv",
+        {"start_date": "2024-06-01", "end_date": "2024-06-01"},
+        blocking=True,
+        return_response=True,
+    )
+    assert stub.request_count == requests
+    export = response["files"]["site0"]
+    assert export["rows"] == len(archived)
+    with open(export["path"], newline="", encoding="utf-8") as file:
+        rows = list(csv.reader(file))
+    assert rows[0] == ["utc_end_time", "pv_kw", "consumption_kw", "battery_kw", "grid_kw"]
+    assert rows[1][0] == "2024-06-01T07:10:00+00:00"
+    assert len(rows) == len(archived) + 1
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
@@ -0,0 +1,204 @@
+"""Test the backfill of statistics."""
+from datetime import date, datetime, timedelta, timezone
+import hashlib
+from unittest.mock import patch
+
+import aiohttp
+from homeassistant.components.recorder import get_instance
+from homeassistant.components.recorder.statistics import statistics_during_period
+from homeassistant.util import dt as dt_util
+import pytest
+
+from custom_components.xolta_batt.backfill import (
+    BACKFILL_STORAGE_KEY_PREFIX,
+    STATISTIC_NAMES,
+    async_get_backfill,
+    statistic_id,
+)
+from custom_components.xolta_batt.const import DOMAIN
+from tests.xolta_stub import RESOLUTION, _power
+
+STORAGE_KEY = BACKFILL_STORAGE_KEY_PREFIX + hashlib.md5(b"user").hexdigest()
+# PV energy (kWh) the stand-in server reports per day
+DAILY_PV = sum(
+    _power(minute / 60)[0] for minute in range(10, 24 * 60 + 1, 10)
+) * RESOLUTION / timedelta(hours=1)
+
+
+@pytest.fixture(autouse=True)
+def auto_enable_custom_integrations(recorder_mock, enable_custom_integrations):
+    """Start the recorder before Home Assistant, as it requires."""
+    yield
+
+
+@pytest.fixture
+async def entry(hass, setup_entry, freezer):
+    """Set up an entry in June 2024."""
+    freezer.move_to(datetime(2024, 6, 5, 10, 5, tzinfo=timezone.utc))
+    entry = await setup_entry()
+    yield entry
+    assert await hass.config_entries.async_unload(entry.entry_id)
+
+
+async def _pv_statistics(hass, start, site_id="site0"):
+    """Return the imported hourly PV statistics of a site since start."""
+    stat_id = statistic_id(site_id, "pv")
+    statistics = await get_instance(hass).async_add_executor_job(
+        statistics_during_period,
+        hass,
+        start,
+        None,
+        {stat_id},
+        "hour",
+        None,
+        {"sum"},
+    )
+    return statistics.get(stat_id, [])
+
+
+async def _backfill(hass, entry, start_date, end_date=None):
+    data = {"start_date": start_date}
+    if end_date is not None:
+        data["end_date"] = end_date
+    await hass.services.async_call(DOMAIN, "backfill", data, blocking=True)
+    await async_get_backfill(hass, entry).task
+
+
+async def test_backfill_imports_hourly_statistics(hass, entry, stub, hass_storage):
+    """Test a backfill imports the range in chunks, as cumulative hourly sums."""
+    requests = stub.requests["GetDataSummary"]
+    await _backfill(hass, entry, "2024-05-20", "2024-06-03")
+
+    # 15 local days, in chunks of a week
+    assert stub.requests["GetDataSummary"] == requests + 3
+    start = dt_util.as_utc(dt_util.start_of_local_day(date(2024, 5, 20)))
+    rows = await _pv_statistics(hass, start)
+    assert len(rows) == 15 * 24
+    assert rows[0]["start"] == start.timestamp()
+    assert rows[-1]["sum"] == pytest.approx(15 * DAILY_PV)
+    # Done, nothing left to resume
+    assert STORAGE_KEY not in hass_storage
+
+
+async def test_backfill_resumes_from_checkpoint(hass, entry, stub, hass_storage):
+    """Test a backfill of the same range continues where the last one stopped."""
+    start = dt_util.as_utc(dt_util.start_of_local_day(date(2024, 5, 20)))
+    resume = start + timedelta(days=14)
+    hass_storage[STORAGE_KEY] = {
+        "version": 1,
+        "key": STORAGE_KEY,
+        "data": {
+            "site0": {
+                "start_date": "2024-05-20",
+                "end_date": "2024-06-03",
+                "next": resume.timestamp(),
+                "sums": {
+                    "pv": 100.0,
+                    "consumption": 0.0,
+                    "battery_charged": 0.0,
+                    "battery_discharged": 0.0,
+                    "grid_exported": 0.0,
+                    "grid_imported": 0.0,
+                },
+            }
+        },
+    }
+
+    requests = stub.requests["GetDataSummary"]
+    await _backfill(hass, entry, "2024-05-20", "2024-06-03")
+
+    assert stub.requests["GetDataSummary"] == requests + 1
+    rows = await _pv_statistics(hass, start)
+    assert len(rows) == 24
+    assert rows[0]["start"] == resume.timestamp()
+    assert rows[-1]["sum"] == pytest.approx(100 + DAILY_PV)
+    assert STORAGE_KEY not in hass_storage
+
+
+async def test_backfill_up_to_now_resumes_later(
+    hass, entry, stub, hass_storage, freezer
+):
+    """Test a backfill without an end date resumes, and runs up to the current hour."""
+    resume = dt_util.as_utc(dt_util.start_of_local_day(date(2024, 6, 4)))
+    hass_storage[STORAGE_KEY] = {
+        "version": 1,
+        "key": STORAGE_KEY,
+        "data": {
+            "site0": {
+                "start_date": "2024-06-03",
+                "end_date": None,
+                "next": resume.timestamp(),
+                "sums": dict.fromkeys(STATISTIC_NAMES, 0.0) | {"pv": 100.0},
+            }
+        },
+    }
+    # Interrupted a few hours ago
+    freezer.tick(timedelta(hours=3))
+    await _backfill(hass, entry, "2024-06-03")
+
+    # Not from June 3, but from local midnight of June 4 (07:00 UTC) up to the
+    # current hour, 13:00 UTC the next day
+    rows = await _pv_statistics(hass, resume - timedelta(days=1))
+    assert rows[0]["start"] == resume.timestamp()
+    assert len(rows) == 24 + 6
+    first_hour = sum(_power(7 + minute / 60)[0] for minute in range(10, 61, 10)) / 6
+    assert rows[0]["sum"] == pytest.approx(100 + first_hour)
+    assert STORAGE_KEY not in hass_storage
+
+
+async def test_earlier_backfill_shifts_later_statistics(hass, entry, stub):
+    """Test importing a range before one imported earlier keeps the sums increasing."""
+    await _backfill(hass, entry, "2024-05-27", "2024-06-03")
+    await _backfill(hass, entry, "2024-05-20", "2024-05-26")
+
+    start = dt_util.as_utc(dt_util.start_of_local_day(date(2024, 5, 20)))
+    rows = await _pv_statistics(hass, start)
+    assert len(rows) == 15 * 24
+    sums = [row["sum"] for row in rows]
+    assert sums == sorted(sums)
+    assert sums[7 * 24 - 1] == pytest.approx(7 * DAILY_PV)
+    assert sums[-1] == pytest.approx(15 * DAILY_PV)
+
+    # A range overlapping both, imported again, changes nothing
+    await _backfill(hass, entry, "2024-05-25", "2024-05-28")
+    rows = await _pv_statistics(hass, start)
+    assert [row["sum"] for row in rows] == pytest.approx(sums)
+
+
+async def test_interrupted_backfill_resumes_unfinished_sites(
+    hass, setup_entry, stub, hass_storage, freezer
+):
+    """Test a resumed backfill skips the sites it finished and continues the others."""
+    freezer.move_to(datetime(2024, 6, 5, 10, 5, tzinfo=timezone.utc))
+    stub.config.site_count = 2
+    entry = await setup_entry()
+    api = hass.data[DOMAIN][entry.entry_id]
+    get_telemetry = api.async_get_telemetry
+    calls = []
+    failed = []
+
+    async def flaky_get_telemetry(site_id, from_utc, to_utc, *args):
+        calls.append(site_id)
+        # The second chunk of site1 fails, once
+        if calls.count("site1") == 2 and not failed:
+            failed.append(site_id)
+            raise aiohttp.ClientError("Server error")
+        return await get_telemetry(site_id, from_utc, to_utc, *args)
+
+    with patch.object(api, "async_get_telemetry", flaky_get_telemetry):
+        await _backfill(hass, entry, "2024-05-20", "2024-06-03")
+        checkpoints = hass_storage[STORAGE_KEY]["data"]
+        assert checkpoints["site0"]["done"]
+        assert not checkpoints["site1"]["done"]
+
+        calls.clear()
+        await _backfill(hass, entry, "2024-05-20", "2024-06-03")
+
+    # Only the chunks of site1 after the first one
+    assert calls == ["site1", "site1"]
+    assert STORAGE_KEY not in hass_storage
+    start = dt_util.as_utc(dt_util.start_of_local_day(date(2024, 5, 20)))
+    for site_id in ("site0", "site1"):
+        rows = await _pv_statistics(hass, start, site_id)
+        assert len(rows) == 15 * 24
+        assert rows[-1]["sum"] == pytest.approx(15 * DAILY_PV)
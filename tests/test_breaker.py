@@ -0,0 +1,76 @@
+"""Test the per-host circuit breaker."""
+from datetime import timedelta
+from unittest.mock import patch
+
+from aiohttp import ClientConnectionError, ClientResponseError
+import pytest
+
+from custom_components.xolta_batt.breaker import (
+    BREAKER_BACKOFF_MIN_SEC,
+    BREAKER_FAILURE_THRESHOLD,
+    STATE_CLOSED,
+    STATE_HALF_OPEN,
+    STATE_OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+)
+
+
+def fail(breaker, err=None):
+    """Send a request through the breaker that fails."""
+    with pytest.raises(type(err) if err else ClientConnectionError):
+        with breaker.request():
+            raise err or ClientConnectionError
+
+
+def succeed(breaker):
+    """Send a request through the breaker that succeeds."""
+    with breaker.request():
+        pass
+
+
+def test_opens_and_probes(freezer):
+    """Test the breaker fails fast after repeated failures, then lets one probe through."""
+    breaker = CircuitBreaker("example.com")
+    with patch("random.uniform", return_value=1.0):
+        for _ in range(BREAKER_FAILURE_THRESHOLD):
+            fail(breaker)
+    assert breaker.state == STATE_OPEN
+
+    with pytest.raises(CircuitOpenError):
+        succeed(breaker)
+
+    freezer.tick(timedelta(seconds=BREAKER_BACKOFF_MIN_SEC))
+    with breaker.request():
+        assert breaker.state == STATE_HALF_OPEN
+        # Only a single probe at a time
+        with pytest.raises(CircuitOpenError):
+            succeed(breaker)
+    assert breaker.state == STATE_CLOSED
+    assert breaker.failures == 0
+
+
+def test_failed_probe_doubles_backoff(freezer):
+    """Test a failed probe opens the breaker for twice as long."""
+    breaker = CircuitBreaker("example.com")
+    with patch("random.uniform", return_value=1.0):
+        for _ in range(BREAKER_FAILURE_THRESHOLD):
+            fail(breaker)
+        freezer.tick(timedelta(seconds=BREAKER_BACKOFF_MIN_SEC))
+        fail(breaker)
+    assert breaker.state == STATE_OPEN
+    assert breaker.retry_in == 2 * BREAKER_BACKOFF_MIN_SEC
+
+
+def test_retry_after(freezer):
+    """Test a 503 with Retry-After opens the breaker for that long right away."""
+    breaker = CircuitBreaker("example.com")
+    err = ClientResponseError(None, (), status=503, headers={"Retry-After": "120"})
+    fail(breaker, err)
+    assert breaker.state == STATE_OPEN
+    assert breaker.retry_in == 120
+
+    # Client errors mean the host is up
+    freezer.tick(timedelta(seconds=120))
+    fail(breaker, ClientResponseError(None, (), status=404))
+    assert breaker.state == STATE_CLOSED
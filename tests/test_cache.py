@@ -0,0 +1,69 @@
+"""Test the cache of sites and telemetry kept across restarts."""
+from datetime import datetime, timedelta, timezone
+
+from custom_components.xolta_batt.cache import (
+    CACHE_STORAGE_KEY_PREFIX,
+    SITES_MAX_AGE,
+    TelemetryCache,
+)
+from custom_components.xolta_batt.scheduler import ENDPOINT_ENERGY
+from custom_components.xolta_batt.session import async_get_session
+from custom_components.xolta_batt.xolta_api import XoltaApi
+
+
+async def _poll_and_restart(hass, freezer, restart_after: timedelta) -> XoltaApi:
+    """Poll the energy once, then return a new client started restart_after later."""
+    freezer.move_to(datetime(2024, 6, 1, 10, 5, tzinfo=timezone.utc))
+    api = XoltaApi(hass, async_get_session(hass), "user", "pw")
+    await api.get_data(endpoints=(ENDPOINT_ENERGY,))
+    await api.async_flush()
+
+    freezer.tick(restart_after)
+    return XoltaApi(hass, async_get_session(hass), "user", "pw")
+
+
+async def test_restart_resumes_from_the_cache(hass, stub, freezer):
+    """Test a restart only requests the buckets closed since, without the sites."""
+    api = await _poll_and_restart(hass, freezer, timedelta(minutes=30))
+    stub.data_summary_windows.clear()
+
+    data = await api.get_data(endpoints=(ENDPOINT_ENERGY,))
+    assert stub.requests["SiteGroup"] == 1
+    assert stub.data_summary_windows == [
+        (
+            "site0",
+            datetime(2024, 6, 1, 10, 0, tzinfo=timezone.utc),
+            datetime(2024, 6, 1, 10, 35, tzinfo=timezone.utc),
+        )
+    ]
+    # Local midnight (US/Pacific) until 10:30
+    assert len(api._energy["site0"]._ends) == 3 * 6 + 3
+    assert "site0" in data["energy"]
+    await api.async_flush()
+
+
+async def test_sites_are_read_again_after_max_age(hass, stub, freezer):
+    """Test cached sites older than SITES_MAX_AGE are read again."""
+    api = await _poll_and_restart(hass, freezer, timedelta(seconds=SITES_MAX_AGE + 60))
+
+    await api.get_data(endpoints=(ENDPOINT_ENERGY,))
+    assert stub.requests["SiteGroup"] == 2
+    await api.async_flush()
+
+
+async def test_cache_of_other_major_version_is_dropped(hass, hass_storage):
+    """Test a cache written with another major version is discarded, not migrated."""
+    hass_storage[CACHE_STORAGE_KEY_PREFIX + "suffix"] = {
+        "version": 2,
+        "minor_version": 1,
+        "key": CACHE_STORAGE_KEY_PREFIX + "suffix",
+        "data": {
+            "sites": [{"siteId": "site0"}],
+            "sites_ts": datetime.now(timezone.utc).timestamp(),
+            "telemetry": {},
+        },
+    }
+
+    sites, accumulators = await TelemetryCache(hass, "suffix").async_load()
+    assert sites is None
+    assert accumulators == {}
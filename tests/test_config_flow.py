@@ -0,0 +1,23 @@
+"""Test the Xolta config flow."""
+from homeassistant import config_entries
+from homeassistant.data_entry_flow import FlowResultType
+
+from custom_components.xolta_batt.const import DOMAIN
+
+
+async def test_entry_uses_tokens_of_the_flow(hass, stub):
+    """Test setting up the new entry doesn't exchange tokens again."""
+    result = await hass.config_entries.flow.async_init(
+        DOMAIN,
+        context={"source": config_entries.SOURCE_USER},
+        data={"username": "user", "password": "pw"},
+    )
+    assert result["type"] == FlowResultType.CREATE_ENTRY
+    await hass.async_block_till_done()
+
+    entry = result["result"]
+    assert entry.state is config_entries.ConfigEntryState.LOADED
+    assert stub.requests["login"] == 1
+    assert "token" not in stub.requests
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
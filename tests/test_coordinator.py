@@ -0,0 +1,33 @@
+"""Test the Xolta data update coordinators."""
+from custom_components.xolta_batt.coordinator import XoltaCoordinator
+from custom_components.xolta_batt.scheduler import ENDPOINT_STATUS
+from custom_components.xolta_batt.session import async_get_session
+from custom_components.xolta_batt.xolta_api import XoltaApi
+
+
+async def test_listeners_are_notified_per_site(hass, stub):
+    """Test only the listeners of the polled sites are notified."""
+    stub.config.site_count = 2
+    api = XoltaApi(hass, async_get_session(hass), "user", "pw")
+    coordinator = XoltaCoordinator(hass, api, ENDPOINT_STATUS, "test")
+    notified = []
+    unsubscribe = [
+        coordinator.async_add_listener(
+            lambda context=context: notified.append(context), context
+        )
+        for context in ("site0", "site1", None)
+    ]
+
+    await coordinator.async_refresh()
+    assert notified == ["site0", "site1", None]
+    assert stub.requests["siteStatus"] == 2
+
+    # Only site0 is due
+    notified.clear()
+    api._scheduler._due.pop(("site0", ENDPOINT_STATUS))
+    await coordinator.async_refresh()
+    assert notified == ["site0", None]
+    assert stub.requests["siteStatus"] == 3
+
+    for unsub in unsubscribe:
+        unsub()
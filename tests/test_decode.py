@@ -0,0 +1,36 @@
+"""Test decoding of Xolta API responses."""
+import json
+from unittest.mock import patch
+
+import pytest
+
+from custom_components.xolta_batt import decode
+from custom_components.xolta_batt.decode import decode_telemetry
+
+BODY = json.dumps(
+    {
+        "telemetry": [
+            {
+                "utcEndTime": "2024-06-01T10:10:00Z",
+                "meterPvActivePowerAggAvgSiteSingle": 2.5,
+                "calculatedConsumption": 0.5,
+                "inverterActivePowerAggAvgSiteSum": -1.5,
+                "meterGridActivePowerAggAvgSiteSingle": -0.5,
+                "bmsSocRawArrayCloudTrimmedAggAvg": 63,
+            }
+        ]
+    }
+).encode()
+
+
+@pytest.mark.parametrize("json_loads", [decode.json_loads, json.loads])
+def test_decode_telemetry(json_loads):
+    """Test only the used fields are kept, with the fast parser and the fallback."""
+    with patch.object(decode, "json_loads", json_loads):
+        telemetry = decode_telemetry(BODY)
+
+    assert len(telemetry) == 1
+    assert telemetry.ends[0] == 1717236600
+    assert telemetry.columns["meterPvActivePowerAggAvgSiteSingle"][0] == 2.5
+    assert telemetry.columns["inverterActivePowerAggAvgSiteSum"][0] == -1.5
+    assert "bmsSocRawArrayCloudTrimmedAggAvg" not in telemetry.columns
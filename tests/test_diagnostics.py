@@ -0,0 +1,32 @@
+"""Test the diagnostics of the Xolta Battery integration."""
+from custom_components.xolta_batt.diagnostics import (
+    async_get_config_entry_diagnostics,
+)
+
+
+async def test_diagnostics_are_redacted(hass, stub, setup_entry):
+    """Test diagnostics hold the metrics of the entry, without its credentials."""
+    entry = await setup_entry(
+        title="user@example.com",
+        unique_id="user@example.com",
+        data={"username": "user@example.com", "password": "secret"},
+    )
+
+    diagnostics = await async_get_config_entry_diagnostics(hass, entry)
+    assert "user@example.com" not in str(diagnostics)
+    assert "secret" not in str(diagnostics)
+    assert diagnostics["entry"]["data"] == {
+        "username": "**REDACTED**",
+        "password": "**REDACTED**",
+    }
+    assert diagnostics["entry"]["title"] == "**REDACTED**"
+
+    metrics = diagnostics["metrics"]
+    assert metrics["endpoints"]["siteStatus"]["requests"] == stub.requests["siteStatus"]
+    assert metrics["last_success"] is not None
+    assert entry.entry_id in diagnostics["poller"]["entries"]
+    assert [breaker["state"] for breaker in diagnostics["breakers"].values()] == [
+        "closed"
+    ]
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
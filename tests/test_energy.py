@@ -0,0 +1,137 @@
+"""Test the energy totals of a site."""
+from datetime import datetime, timedelta, timezone
+import json
+
+import pytest
+
+from custom_components.xolta_batt.decode import decode_telemetry
+from custom_components.xolta_batt.energy import GAP_MAX_TRIES, EnergyAccumulator
+from custom_components.xolta_batt.models import SiteStatus
+
+START = datetime(2024, 6, 1, 10, 0, tzinfo=timezone.utc)
+
+
+def status(pv):
+    """Return a running status with the given PV power, all used in the house."""
+    return SiteStatus("Running", 0.0, pv, pv, 50, 0.0)
+
+
+def telemetry(*buckets):
+    """Return decoded GetDataSummary buckets of (end, pv)."""
+    body = json.dumps(
+        {
+            "telemetry": [
+                {
+                    "utcEndTime": end.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                    "meterPvActivePowerAggAvgSiteSingle": pv,
+                    "calculatedConsumption": pv,
+                    "inverterActivePowerAggAvgSiteSum": 0.0,
+                    "meterGridActivePowerAggAvgSiteSingle": 0.0,
+                }
+                for end, pv in buckets
+            ]
+        }
+    ).encode()
+    return decode_telemetry(body)
+
+
+def test_interim_estimate_is_replaced_by_buckets():
+    """Test siteStatus power is integrated until the bucket covering it arrives."""
+    accumulator = EnergyAccumulator()
+    accumulator.window(START)
+    # Buckets up to START have arrived
+    accumulator.add(telemetry((START, 0.0)), START)
+
+    for minute in range(0, 31):
+        accumulator.add_status(status(1.2), START + timedelta(minutes=minute))
+    assert accumulator.snapshot().pv == pytest.approx(0.6)
+
+    # The bucket says the first 10 minutes were a bit lower than the readings
+    end = START + timedelta(minutes=10)
+    accumulator.add(telemetry((end, 0.9)), START + timedelta(minutes=31))
+    snapshot = accumulator.snapshot()
+    assert snapshot.last_end == end
+    assert accumulator.totals["pv"] == pytest.approx(0.15)
+    assert snapshot.pv == pytest.approx(0.15 + 0.4)
+
+
+def test_gaps_are_not_interpolated():
+    """Test readings far apart, e.g. across a restart, don't add energy."""
+    accumulator = EnergyAccumulator()
+    accumulator.window(START)
+    accumulator.add_status(status(2.0), START)
+    accumulator.add_status(status(2.0), START + timedelta(hours=1))
+    assert accumulator.estimate()["pv"] == 0
+
+
+def test_missing_buckets_are_repaired():
+    """Test buckets missing from a response are recorded and added when fetched again."""
+    accumulator = EnergyAccumulator()
+    # From local midnight
+    start, _ = accumulator.window(START)
+    bucket = timedelta(minutes=10)
+    accumulator.add(
+        telemetry(*((start + bucket * i, 0.6) for i in (1, 4))),
+        start + bucket * 4,
+    )
+    assert accumulator.totals["pv"] == pytest.approx(0.2)
+    [gap] = accumulator.gaps
+    assert gap[:2] == [(start + bucket).timestamp(), (start + bucket * 3).timestamp()]
+
+    # Only one of the two buckets arrives
+    accumulator.add_repair(telemetry((start + bucket * 3, 1.2)), gap)
+    assert accumulator.totals["pv"] == pytest.approx(0.4)
+    assert accumulator.gaps == [
+        [
+            (start + bucket).timestamp(),
+            (start + bucket * 2).timestamp(),
+            GAP_MAX_TRIES - 1,
+        ]
+    ]
+    restored = EnergyAccumulator.from_cache(accumulator.to_cache())
+    assert restored.gaps == accumulator.gaps
+
+    accumulator.add_repair(telemetry((start + bucket * 2, 1.2)), accumulator.gaps[0])
+    assert accumulator.totals["pv"] == pytest.approx(0.6)
+    assert accumulator.gaps == []
+    # The inserted buckets are kept in order
+    assert EnergyAccumulator.from_cache(accumulator.to_cache()).last_end == (
+        start + bucket * 4
+    )
+
+
+def test_repairs_give_up_after_tries():
+    """Test a range that keeps failing is dropped once it runs out of tries."""
+    accumulator = EnergyAccumulator()
+    start, _ = accumulator.window(START)
+    end = start + timedelta(minutes=30)
+    accumulator.add(telemetry((start + timedelta(minutes=10), 0.0), (end, 0.6)), end)
+    [gap] = accumulator.gaps
+    for _ in range(GAP_MAX_TRIES - 1):
+        accumulator.repair_failed(gap)
+    assert accumulator.gaps == [gap]
+    accumulator.repair_failed(gap)
+    assert accumulator.gaps == []
+
+
+def test_last_buckets_of_a_day_are_fetched_after_midnight():
+    """Test the windows of a new day start at the last bucket of the previous one."""
+    accumulator = EnergyAccumulator()
+    start, _ = accumulator.window(START)
+    day_end = start + timedelta(days=1)
+    bucket = timedelta(minutes=10)
+    late = day_end - bucket * 2
+    accumulator.add(telemetry((late, 0.6)), day_end - bucket)
+
+    # The bucket ending at midnight had not closed at the last poll of the day
+    now = day_end + timedelta(minutes=1)
+    assert accumulator.window(now) == (late, now)
+    assert accumulator.day_start == day_end
+    accumulator.add(telemetry((late + bucket, 0.6)), now)
+    restored = EnergyAccumulator.from_cache(accumulator.to_cache())
+    assert restored.window(now) == (late + bucket, now)
+
+    accumulator.add(telemetry((day_end, 0.6), (day_end + bucket, 1.2)), now + bucket)
+    # Only this day's buckets count towards its totals
+    assert accumulator.totals["pv"] == pytest.approx(0.2)
+    assert accumulator.window(now + bucket) == (day_end + bucket, now + bucket)
@@ -0,0 +1,65 @@
+"""Test the in-memory history of siteStatus readings."""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from pytest_homeassistant_custom_component.common import async_fire_time_changed
+
+from custom_components.xolta_batt.const import DOMAIN
+from custom_components.xolta_batt.history import PowerHistory
+from custom_components.xolta_batt.models import SiteStatus
+
+START = datetime(2024, 6, 1, 10, 0, tzinfo=timezone.utc)
+
+
+def test_ring_buffer_keeps_the_latest_readings():
+    """Test the oldest readings are overwritten once the buffer is full."""
+    history = PowerHistory(size=10)
+    for minute in range(25):
+        history.add(
+            SiteStatus("Running", 0.0, float(minute), 0.5, 50, 0.0),
+            START + timedelta(minutes=minute),
+        )
+
+    assert len(history) == 10
+    stats = history.stats(START, fields=("pv_power",), percentiles=(50, 90))
+    assert stats["count"] == 10
+    assert stats["first"] == START + timedelta(minutes=15)
+    assert stats["pv_power"] == {
+        "min": 15.0,
+        "max": 24.0,
+        "mean": pytest.approx(19.5),
+        "p50": 20.0,
+        "p90": 24.0,
+    }
+    # Only the readings in the window
+    stats = history.stats(START + timedelta(minutes=22), fields=("pv_power",))
+    assert stats["count"] == 3
+    assert history.stats(START + timedelta(hours=1)) is None
+
+
+async def test_query_history_service(hass, stub, setup_entry, freezer):
+    """Test the service returns statistics of the readings polled so far."""
+    freezer.move_to(datetime(2024, 6, 1, 10, 5, tzinfo=timezone.utc))
+    entry = await setup_entry()
+    for _ in range(4):
+        freezer.tick(timedelta(minutes=1))
+        async_fire_time_changed(hass)
+        await hass.async_block_till_done()
+
+    requests = stub.request_count
+    response = await hass.services.async_call(
+        DOMAIN,
+        "query_history",
+        {"window": {"minutes": 30}, "fields": ["pv_power", "battery_level"]},
+        blocking=True,
+        return_response=True,
+    )
+    # Answered from memory
+    assert stub.request_count == requests
+    stats = response["sites"]["site0"]
+    assert stats["count"] == 5
+    assert stats["battery_level"]["mean"] == 63
+    assert stats["pv_power"]["min"] < stats["pv_power"]["max"]
+    assert "grid_power" not in stats
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
@@ -0,0 +1,29 @@
+"""Test the Xolta site snapshots."""
+import dataclasses
+
+import pytest
+
+from custom_components.xolta_batt.models import SiteStatus
+
+STATUS = {
+    "siteId": "site0",
+    "state": "Running",
+    "inverterActivePowerAggAvg": -0.5,
+    "meterPvActivePowerAggAvg": 2.1,
+    "consumption": 0.6,
+    "bmsSocRawArrayCloudTrimmedAggAvg": 63,
+    "meterGridActivePowerAggAvg": -1.0,
+}
+
+
+def test_site_status_from_json():
+    """Test fields are resolved once, and zeroed while the site isn't running."""
+    status = SiteStatus.from_json(STATUS)
+    assert (status.battery_power, status.pv_power, status.battery_level) == (-0.5, 2.1, 63)
+    assert not hasattr(status, "__dict__")
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        status.pv_power = 0
+
+    stopped = SiteStatus.from_json({**STATUS, "state": "Stopped"})
+    assert stopped.state == "Stopped"
+    assert (stopped.pv_power, stopped.grid_power, stopped.battery_level) == (0, 0, 0)
@@ -0,0 +1,58 @@
+"""Test the staggered poller of the config entries."""
+import asyncio
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, Mock
+
+from homeassistant.util import dt as dt_util
+from pytest_homeassistant_custom_component.common import async_fire_time_changed
+
+from custom_components.xolta_batt.poller import Poller
+
+
+async def test_offsets_are_spread(hass):
+    """Test each entry has a fixed offset, and many entries spread over the interval."""
+    poller = Poller(hass, interval=60)
+    offsets = [poller.offset(f"entry{i}") for i in range(50)]
+    assert offsets == [Poller(hass, interval=60).offset(f"entry{i}") for i in range(50)]
+    assert all(0 <= offset < 60 for offset in offsets)
+    # No ten second window holds more than a third of the entries
+    assert max(sum(start <= o < start + 10 for o in offsets) for start in range(50)) < 17
+
+
+async def test_entry_refreshed_once_per_interval(hass, freezer):
+    """Test the coordinators of an entry are refreshed in its slot."""
+    freezer.move_to(datetime(2024, 6, 1, tzinfo=timezone.utc))
+    poller = Poller(hass, interval=60)
+    coordinators = [Mock(async_refresh=AsyncMock()) for _ in range(2)]
+    remove = poller.async_add("entry", coordinators)
+
+    for refreshes in (1, 2):
+        freezer.tick(timedelta(seconds=60))
+        async_fire_time_changed(hass, dt_util.utcnow())
+        await hass.async_block_till_done()
+        assert [c.async_refresh.call_count for c in coordinators] == [refreshes] * 2
+
+    remove()
+    freezer.tick(timedelta(seconds=60))
+    async_fire_time_changed(hass, dt_util.utcnow())
+    await hass.async_block_till_done()
+    assert coordinators[0].async_refresh.call_count == 2
+
+
+async def test_request_slots_are_shared(hass):
+    """Test requests wait for a slot once the limit is in flight."""
+    poller = Poller(hass, max_concurrent_requests=2)
+    release = asyncio.Event()
+
+    async def request():
+        async with poller.request_slot():
+            await release.wait()
+
+    tasks = [asyncio.create_task(request()) for _ in range(3)]
+    await asyncio.sleep(0)
+    assert poller.as_dict()["requests_in_flight"] == 2
+    assert poller.as_dict()["requests_waiting"] == 1
+
+    release.set()
+    await asyncio.gather(*tasks)
+    assert poller.requests_in_flight == poller.requests_waiting == 0
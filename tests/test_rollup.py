@@ -0,0 +1,107 @@
+"""Test the hourly and daily energy rollups."""
+from datetime import date, datetime, timedelta, timezone
+
+from homeassistant.util import dt as dt_util
+import pytest
+
+from custom_components.xolta_batt.rollup import (
+    PERIOD_MONTH,
+    PERIOD_ROLLING_30_DAYS,
+    PERIOD_WEEK,
+    PERIOD_YEAR,
+    ROLLUP_HOURLY_DAYS,
+    EnergyRollup,
+)
+from custom_components.xolta_batt.scheduler import ENDPOINT_ENERGY
+from custom_components.xolta_batt.session import async_get_session
+from custom_components.xolta_batt.xolta_api import XoltaApi
+from tests.test_energy import telemetry
+
+RESOLUTION = timedelta(minutes=10)
+
+
+@pytest.fixture(autouse=True)
+def utc_days():
+    """Make local days UTC days."""
+    default_time_zone = dt_util.DEFAULT_TIME_ZONE
+    dt_util.set_default_time_zone(timezone.utc)
+    yield
+    dt_util.set_default_time_zone(default_time_zone)
+
+
+def add_days(rollup, first_day, days, pv=1.0):
+    """Add buckets of constant PV power (kW) for whole UTC days, a day at a time."""
+    start = datetime.combine(first_day, datetime.min.time(), timezone.utc)
+    for day in range(days):
+        day_start = start + timedelta(days=day)
+        buckets = telemetry(
+            *((day_start + RESOLUTION * (i + 1), pv) for i in range(144))
+        )
+        rollup.add(buckets, day_start, day_start + timedelta(days=1), 10)
+
+
+def test_periods_sum_the_days_before_today():
+    """Test the periods count the local days from their start up to today."""
+    rollup = EnergyRollup()
+    add_days(rollup, date(2024, 5, 30), 5)
+
+    # Monday
+    periods = rollup.periods(date(2024, 6, 3))
+    assert periods[PERIOD_WEEK].pv == 0
+    assert periods[PERIOD_MONTH].pv == pytest.approx(48)
+    assert periods[PERIOD_YEAR].pv == pytest.approx(96)
+    assert periods[PERIOD_ROLLING_30_DAYS].pv == pytest.approx(96)
+    assert periods[PERIOD_MONTH].day_start == datetime(2024, 6, 1, tzinfo=timezone.utc)
+
+    # A late bucket of an earlier day
+    end = datetime(2024, 5, 31, 12, tzinfo=timezone.utc)
+    rollup.add(telemetry((end, 6.0)), end - RESOLUTION, end, 10)
+    assert rollup.total(date(2024, 5, 31), date(2024, 6, 1))["pv"] == pytest.approx(25)
+    assert rollup.total_hours(end - timedelta(hours=1), end)["pv"] == pytest.approx(2)
+    assert rollup.periods(date(2024, 6, 3))[PERIOD_YEAR].pv == pytest.approx(97)
+
+
+def test_hours_are_trimmed_and_stored_compactly():
+    """Test only recent hours are kept, and the rollups survive a round trip."""
+    rollup = EnergyRollup()
+    add_days(rollup, date(2024, 1, 1), ROLLUP_HOURLY_DAYS + 5, pv=2.0)
+
+    assert len(rollup.hours) == ROLLUP_HOURLY_DAYS * 24
+    assert len(rollup.days) == ROLLUP_HOURLY_DAYS + 5
+    last_day = datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(
+        days=ROLLUP_HOURLY_DAYS + 4
+    )
+    assert rollup.total_hours(last_day, last_day + timedelta(days=1))[
+        "pv"
+    ] == pytest.approx(48)
+    # Hours that were dropped are not counted
+    assert rollup.total_hours(
+        datetime(2024, 1, 1, tzinfo=timezone.utc), last_day
+    )["pv"] == pytest.approx((ROLLUP_HOURLY_DAYS - 1) * 48)
+
+    restored = EnergyRollup.from_cache(rollup.to_cache())
+    assert restored.total(date(2024, 1, 1), date(2025, 1, 1)) == pytest.approx(
+        rollup.total(date(2024, 1, 1), date(2025, 1, 1))
+    )
+    assert restored.hours.first == rollup.hours.first
+
+
+async def test_bucket_ending_at_midnight_is_counted(hass, stub, freezer):
+    """Test the day's rollup includes the buckets that closed after its last poll."""
+    freezer.move_to(datetime(2024, 6, 1, 23, 35, tzinfo=timezone.utc))
+    api = XoltaApi(hass, async_get_session(hass), "user", "pw")
+    for _ in range(7):
+        await api.get_data(endpoints=(ENDPOINT_ENERGY,))
+        freezer.tick(timedelta(minutes=10))
+
+    # The stub's consumption is 0.6 kW all day
+    assert api._rollups["site0"].total(date(2024, 6, 1), date(2024, 6, 2))[
+        "consumption"
+    ] == pytest.approx(14.4)
+    archived = await api.archive.async_read(
+        "site0",
+        datetime(2024, 6, 1, tzinfo=timezone.utc),
+        datetime(2024, 6, 2, tzinfo=timezone.utc),
+    )
+    assert len(archived) == 144
+    await api.async_flush()
@@ -0,0 +1,94 @@
+"""Test the polling schedule per site and endpoint."""
+from datetime import datetime, timedelta, timezone
+
+from homeassistant.util import dt as dt_util
+import pytest
+
+from custom_components.xolta_batt.const import (
+    ENERGY_PUBLISH_DELAY_SEC,
+    ENERGY_RETRY_SEC,
+    STATUS_IDLE_INTERVAL_SEC,
+    UPDATE_INTERVAL_SEC,
+)
+from custom_components.xolta_batt.models import SiteStatus
+from custom_components.xolta_batt.scheduler import (
+    ENDPOINT_ENERGY,
+    ENDPOINT_STATUS,
+    PollScheduler,
+)
+from custom_components.xolta_batt.session import async_get_session
+from custom_components.xolta_batt.xolta_api import XoltaApi
+
+
+async def _poll_every_minute(hass, freezer, start, minutes):
+    """Refresh once a minute from start on, return the requests the stub received."""
+    freezer.move_to(start)
+    api = XoltaApi(hass, async_get_session(hass), "user", "pw")
+    for _ in range(minutes):
+        await api.get_data()
+        freezer.tick(timedelta(seconds=UPDATE_INTERVAL_SEC))
+    await api.async_flush()
+
+
+@pytest.mark.parametrize(
+    ("hour", "interval"),
+    [(12, UPDATE_INTERVAL_SEC), (2, STATUS_IDLE_INTERVAL_SEC)],
+    ids=["day", "night"],
+)
+async def test_status_backs_off_while_idle(hass, stub, freezer, hour, interval):
+    """Test siteStatus is polled every interval by day, less often at night."""
+    await _poll_every_minute(
+        hass, freezer, datetime(2024, 6, 1, hour, 5, tzinfo=timezone.utc), 30
+    )
+    assert stub.requests["siteStatus"] == 30 * UPDATE_INTERVAL_SEC // interval
+
+
+async def test_energy_is_polled_when_buckets_are_published(hass, stub, freezer):
+    """Test GetDataSummary is polled once per bucket, after it is published."""
+    await _poll_every_minute(
+        hass, freezer, datetime(2024, 6, 1, 12, 5, tzinfo=timezone.utc), 30
+    )
+    # At 12:05, then 12:11, 12:21 and 12:31
+    assert stub.requests["GetDataSummary"] == 4
+
+
+def test_energy_due_after_bucket_closes():
+    """Test the next energy poll waits for the next bucket, or retries later."""
+    scheduler = PollScheduler()
+    now = datetime(2024, 6, 1, 12, 5, tzinfo=timezone.utc)
+    publish_delay = timedelta(seconds=ENERGY_PUBLISH_DELAY_SEC)
+
+    scheduler.energy_polled("site0", now - timedelta(minutes=5), now)
+    due = datetime(2024, 6, 1, 12, 10, tzinfo=timezone.utc) + publish_delay
+    assert not scheduler.is_due("site0", ENDPOINT_ENERGY, due - timedelta(seconds=1))
+    assert scheduler.is_due("site0", ENDPOINT_ENERGY, due)
+
+    # No buckets yet today
+    scheduler.energy_polled("site0", None, now)
+    assert scheduler.is_due("site0", ENDPOINT_ENERGY, due)
+
+    # The last bucket is late, ask again after ENERGY_RETRY_SEC
+    scheduler.energy_polled("site0", now - timedelta(minutes=15), now)
+    retry = now + timedelta(seconds=ENERGY_RETRY_SEC)
+    assert not scheduler.is_due("site0", ENDPOINT_ENERGY, retry - timedelta(seconds=1))
+    assert scheduler.is_due("site0", ENDPOINT_ENERGY, retry)
+
+
+def test_status_due_allows_early_refresh():
+    """Test siteStatus is due a second before the interval, as refreshes drift."""
+    scheduler = PollScheduler()
+    now = dt_util.utcnow()
+    running = SiteStatus("Running", -0.5, 3.0, 0.6, 63, -1.9)
+    idle = SiteStatus("Running", 0.0, 0.0, 0.6, 63, 0.6)
+
+    scheduler.status_polled("site0", running, now)
+    assert scheduler.is_due(
+        "site0", ENDPOINT_STATUS, now + timedelta(seconds=UPDATE_INTERVAL_SEC - 1)
+    )
+    scheduler.status_polled("site0", idle, now)
+    assert not scheduler.is_due(
+        "site0", ENDPOINT_STATUS, now + timedelta(seconds=UPDATE_INTERVAL_SEC)
+    )
+    assert scheduler.is_due(
+        "site0", ENDPOINT_STATUS, now + timedelta(seconds=STATUS_IDLE_INTERVAL_SEC - 1)
+    )
@@ -0,0 +1,80 @@
+"""Test the Xolta sensors."""
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+from homeassistant.helpers.entity import Entity
+from pytest_homeassistant_custom_component.common import async_fire_time_changed
+
+
+async def test_unchanged_sensors_are_not_written(hass, stub, setup_entry, freezer):
+    """Test a refresh only writes the sensors whose value changed."""
+    # In the morning (UTC) the stand-in server reports rising PV power, so
+    # siteStatus isn't backed off and changes every minute
+    freezer.move_to(datetime(2024, 6, 1, 10, 5, tzinfo=timezone.utc))
+    entry = await setup_entry()
+
+    written = []
+    write_ha_state = Entity.async_write_ha_state
+
+    def record_write(entity):
+        written.append(entity.entity_id)
+        write_ha_state(entity)
+
+    # The poller refreshes the entry once a minute. siteStatus is due again, no new
+    # telemetry bucket has closed.
+    freezer.tick(timedelta(minutes=1))
+    with patch.object(Entity, "async_write_ha_state", record_write):
+        async_fire_time_changed(hass)
+        await hass.async_block_till_done()
+    assert stub.requests["siteStatus"] == 2
+    assert stub.requests["GetDataSummary"] == 1
+    assert written.count("sensor.site0_pv_power") == 1
+    assert "sensor.site0_power_consumption" not in written
+    assert "sensor.site0_battery_charge_level" not in written
+    # Energy moves with the interim estimate, unused sources stay as they are
+    assert written.count("sensor.site0_energy_pv_energy") == 1
+    assert "sensor.site0_energy_grid_energy_imported" not in written
+    assert "sensor.site0_energy_battery_energy_discharged" not in written
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+
+
+async def test_energy_moves_between_buckets_and_never_decreases(
+    hass, stub, setup_entry, freezer
+):
+    """Test the energy sensors follow siteStatus each minute without going back."""
+    # The buckets come in below the estimate
+    stub.config.status_pv_bias = 0.5
+    freezer.move_to(datetime(2024, 6, 1, 10, 5, tzinfo=timezone.utc))
+    entry = await setup_entry()
+
+    values = [float(hass.states.get("sensor.site0_energy_pv_energy").state)]
+    for _ in range(30):
+        freezer.tick(timedelta(minutes=1))
+        async_fire_time_changed(hass)
+        await hass.async_block_till_done()
+        values.append(float(hass.states.get("sensor.site0_energy_pv_energy").state))
+
+    assert stub.requests["GetDataSummary"] > 1
+    assert values == sorted(values)
+    # Not only when a bucket arrives
+    assert len(set(values)) > 20
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+
+
+async def test_period_energy_includes_today(hass, setup_entry, freezer):
+    """Test the period sensors add today's energy to that of the days before."""
+    freezer.move_to(datetime(2024, 6, 1, 10, 5, tzinfo=timezone.utc))
+    entry = await setup_entry()
+
+    today = hass.states.get("sensor.site0_energy_pv_energy").state
+    # No days before today yet
+    for period in ("week", "month", "year", "30_days"):
+        assert hass.states.get(f"sensor.site0_energy_{period}_pv_energy").state == today
+    assert (
+        hass.states.get("sensor.site0_energy_month_pv_energy").attributes["friendly_name"]
+        == "PV energy this month"
+    )
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
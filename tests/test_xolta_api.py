@@ -0,0 +1,171 @@
+"""Test the Xolta API client."""
+import asyncio
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
+from pytest_homeassistant_custom_component.common import async_fire_time_changed
+
+from custom_components.xolta_batt.const import TOKEN_RENEW_MARGIN_SEC
+from custom_components.xolta_batt.scheduler import ENDPOINT_ENERGY, ENDPOINT_STATUS
+from custom_components.xolta_batt.session import async_get_session
+from custom_components.xolta_batt.xolta_api import (
+    STORAGE_ACCESS_TOKEN,
+    STORAGE_REFRESH_TOKEN,
+    STORAGE_SAVE_DELAY,
+    XoltaApi,
+    _TokenRejected,
+)
+from tests.xolta_stub import make_token
+
+TOKEN_LIFETIME = timedelta(hours=1)
+
+
+async def test_token_writes_are_coalesced(hass, freezer):
+    """Test a day of token rollovers writes each new token once, off the fetch path."""
+    api = XoltaApi(hass, None, "user", "password")
+    exchanges = 0
+
+    async def refresh_tokens():
+        nonlocal exchanges
+        exchanges += 1
+        api._prefs[STORAGE_ACCESS_TOKEN] = make_token(dt_util.utcnow() + TOKEN_LIFETIME)
+        api._prefs[STORAGE_REFRESH_TOKEN] = f"refresh-{exchanges}"
+
+    with patch.object(api, "_async_refresh_tokens", refresh_tokens), patch.object(
+        Store, "_async_write_data"
+    ) as write_data:
+        await api.async_ensure_token()
+        assert exchanges == 1
+        # The token is available right away, the write is delayed
+        assert write_data.call_count == 0
+
+        # Poll once a minute for a day
+        for _ in range(24 * 60):
+            freezer.tick(timedelta(minutes=1))
+            async_fire_time_changed(hass)
+            await api.async_ensure_token()
+            await hass.async_block_till_done()
+
+        freezer.tick(timedelta(minutes=1))
+        async_fire_time_changed(hass)
+        await hass.async_block_till_done()
+
+        # Tokens are renewed TOKEN_RENEW_MARGIN_SEC before they expire
+        renew_every = TOKEN_LIFETIME - timedelta(seconds=TOKEN_RENEW_MARGIN_SEC)
+        assert exchanges == 1 + timedelta(days=1) // renew_every
+        assert write_data.call_count == exchanges
+
+        # Nothing left to flush on unload
+        await api.async_flush()
+        assert write_data.call_count == exchanges
+
+
+async def test_concurrent_callers_share_one_exchange(hass, stub):
+    """Test callers on two clients of the same account share one login and write."""
+    apis = [XoltaApi(hass, async_get_session(hass), "user", "pw") for _ in range(2)]
+
+    with patch.object(Store, "_async_write_data") as write_data:
+        await asyncio.gather(*(api.async_ensure_token() for api in apis * 4))
+        assert stub.requests["login"] == 1
+        assert "token" not in stub.requests
+        assert (
+            apis[0]._prefs[STORAGE_ACCESS_TOKEN]
+            == apis[1]._prefs[STORAGE_ACCESS_TOKEN]
+        )
+
+        async_fire_time_changed(
+            hass, dt_util.utcnow() + timedelta(seconds=STORAGE_SAVE_DELAY)
+        )
+        await hass.async_block_till_done()
+        assert write_data.call_count == 1
+        for api in apis:
+            await api.async_flush()
+        assert write_data.call_count == 1
+
+
+async def test_rejected_gap_repair_renews_token(hass, stub, freezer):
+    """Test a 401 on the fetch of missing buckets renews the token and resumes."""
+    freezer.move_to(datetime(2024, 6, 1, 10, 5, tzinfo=timezone.utc))
+    stub.config.drop_buckets = {datetime(2024, 6, 1, 9, 0, tzinfo=timezone.utc)}
+    # Login, SiteGroup, GetDataSummary, then the repair
+    stub.config.inject_401 = {3}
+    api = XoltaApi(hass, async_get_session(hass), "user", "pw")
+
+    data = await api.get_data(endpoints=(ENDPOINT_ENERGY,))
+    assert api.metrics.token_renewals_401 == 1
+    assert stub.requests["token"] == 1
+    assert api._energy["site0"].gaps == []
+    # Local midnight (US/Pacific) until 10:00, none missing
+    assert len(api._energy["site0"]._ends) == 3 * 6
+    assert data["stale_sites"][ENDPOINT_ENERGY] == set()
+    archived = await api.archive.async_read(
+        "site0", api._energy["site0"].day_start, dt_util.utcnow()
+    )
+    assert len(archived) == 3 * 6
+    await api.async_flush()
+
+
+async def test_held_back_requests_resume_after_renewal(hass, stub):
+    """Test requests held back by a 401 elsewhere are resumed with a new token."""
+    api = XoltaApi(hass, async_get_session(hass), "user", "pw")
+    fetch = api._fetch
+    calls = []
+
+    async def fetch_once_rejected(site_id, endpoint, *args):
+        calls.append((site_id, endpoint))
+        if len(calls) == 1:
+            raise _TokenRejected
+        await fetch(site_id, endpoint, *args)
+
+    with patch.object(api, "_fetch", fetch_once_rejected):
+        data = await api.get_data(endpoints=(ENDPOINT_ENERGY,))
+    assert calls == [("site0", ENDPOINT_ENERGY)] * 2
+    assert stub.requests["token"] == 1
+    assert "site0" in data["energy"]
+    await api.async_flush()
+
+
+async def test_failing_site_is_stale_while_others_update(hass, stub):
+    """Test a site whose requests fail is marked stale, the others are updated."""
+    stub.config.site_count = 3
+    stub.config.fail_status_sites = {"site1"}
+    api = XoltaApi(hass, async_get_session(hass), "user", "pw")
+
+    data = await api.get_data()
+    assert data["stale_sites"][ENDPOINT_STATUS] == {"site1"}
+    assert data["stale_sites"][ENDPOINT_ENERGY] == set()
+    assert set(data["sensors"]) == {"site0", "site2"}
+    assert set(data["energy"]) == {"site0", "site1", "site2"}
+    assert api.metrics.last_success is not None
+    await api.async_flush()
+
+
+async def test_concurrent_requests_are_limited(hass, stub):
+    """Test the sites are fetched concurrently, up to the configured limit."""
+    stub.config.site_count = 5
+    stub.config.latency = 0.05
+    api = XoltaApi(
+        hass, async_get_session(hass), "user", "pw", max_concurrent_requests=2
+    )
+
+    await api.get_data(endpoints=(ENDPOINT_STATUS,))
+    assert stub.requests["siteStatus"] == 5
+    assert stub.max_in_flight == 2
+    await api.async_flush()
+
+
+async def test_last_success_needs_a_completed_request(hass, stub, freezer):
+    """Test a refresh with nothing due doesn't count as a success."""
+    freezer.move_to(datetime(2024, 6, 1, 12, 5, tzinfo=timezone.utc))
+    api = XoltaApi(hass, async_get_session(hass), "user", "pw")
+    await api.get_data()
+    polled = api.metrics.last_success
+    assert polled == dt_util.utcnow()
+
+    freezer.tick(timedelta(seconds=10))
+    data = await api.get_data()
+    assert data["updated_sites"] == {ENDPOINT_STATUS: set(), ENDPOINT_ENERGY: set()}
+    assert api.metrics.last_success == polled
+    await api.async_flush()
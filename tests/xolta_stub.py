@@ -0,0 +1,233 @@
+"""Local stand-in for the Xolta add-on, B2C token and cloud API endpoints."""
+from __future__ import annotations
+
+import asyncio
+import base64
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+import json
+import math
+import secrets
+from unittest.mock import patch
+
+from aiohttp import web
+
+from custom_components.xolta_batt import xolta_api
+
+RESOLUTION = timedelta(minutes=10)
+
+
+@dataclass
+class StubConfig:
+    """Behaviour of the stand-in server."""
+
+    # Seconds added to every response
+    latency: float = 0.0
+    site_count: int = 1
+    # Extra bytes of padding added to every API response
+    payload_padding: int = 0
+    # Seconds an issued access token is valid
+    token_lifetime: int = 3600
+    # Answer these API requests (1-based count of API requests) with 401
+    inject_401: set[int] = field(default_factory=set)
+    # kW added to the PV power of siteStatus, which then runs ahead of the buckets
+    status_pv_bias: float = 0.0
+    # Bucket ends left out of the first GetDataSummary response covering them
+    drop_buckets: set[datetime] = field(default_factory=set)
+    # Answer siteStatus of these sites with 500
+    fail_status_sites: set[str] = field(default_factory=set)
+
+
+def make_token(expiry: datetime) -> str:
+    """Return an unsigned JWT expiring at the given time."""
+    payload = json.dumps(
+        {"exp": int(expiry.timestamp()), "nonce": secrets.token_hex(4)}
+    ).encode()
+    return "header." + base64.urlsafe_b64encode(payload).decode().rstrip("=") + ".sig"
+
+
+def _power(hour: float) -> tuple[float, float, float, float]:
+    """Return PV, consumption, battery and grid power (kW) at an hour of the day (UTC).
+
+    The battery charges from PV during the day, and is idle at night.
+    """
+    pv = round(max(0.0, 4 * math.sin((hour - 6) / 12 * math.pi)), 3)
+    consumption = 0.6
+    battery = -0.5 if pv > 1 else 0.0
+    return pv, consumption, battery, round(consumption - pv - battery, 3)
+
+
+def _parse_utc(value: str) -> datetime:
+    """Parse a timestamp the way XoltaApi formats it."""
+    return datetime.fromisoformat(value.rstrip("Z")).replace(tzinfo=timezone.utc)
+
+
+class XoltaStub:
+    """aiohttp server answering like the Xolta services, with request statistics."""
+
+    def __init__(self, config: StubConfig | None = None, now=None):
+        self.config = config or StubConfig()
+        # Clock used for token expiry and telemetry, may be replaced by a frozen one
+        self._now = now or (lambda: datetime.now(timezone.utc))
+        self.requests: dict[str, int] = {}
+        # (siteId, from, to) of each GetDataSummary request
+        self.data_summary_windows: list[tuple[str, datetime, datetime]] = []
+        self.bytes_sent = 0
+        # Responses being delayed, and the most there were at once
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._api_requests = 0
+        self._tokens: dict[str, datetime] = {}
+        self._refresh_tokens: set[str] = set()
+        self._runner: web.AppRunner | None = None
+        self.url: str | None = None
+
+        self.app = web.Application()
+        self.app.router.add_post("/login", self._login)
+        self.app.router.add_post("/token", self._token)
+        self.app.router.add_get("/api/SiteGroup", self._site_group)
+        self.app.router.add_get("/api/siteStatus", self._site_status)
+        self.app.router.add_get("/api/GetDataSummary", self._data_summary)
+
+    @property
+    def request_count(self) -> int:
+        """Return the total number of requests received."""
+        return sum(self.requests.values())
+
+    async def start(self):
+        """Start listening on a free local port."""
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.url = f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        """Stop the server."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    @contextmanager
+    def patch_urls(self):
+        """Point XoltaApi at this server."""
+        with patch.object(xolta_api, "_LoginUrl", f"{self.url}/login"), patch.object(
+            xolta_api, "_TokenURL", f"{self.url}/token"
+        ), patch.object(xolta_api, "_ApiBaseURL", f"{self.url}/api/"):
+            yield
+
+    async def _respond(self, endpoint: str, data) -> web.Response:
+        """Count and delay a JSON response."""
+        self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+        if self.config.payload_padding and isinstance(data, dict):
+            data = {**data, "padding": "x" * self.config.payload_padding}
+        body = json.dumps(data).encode()
+        self.bytes_sent += len(body)
+        if self.config.latency:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            try:
+                await asyncio.sleep(self.config.latency)
+            finally:
+                self.in_flight -= 1
+        return web.Response(body=body, content_type="application/json")
+
+    def _issue_tokens(self):
+        access_token = make_token(
+            self._now() + timedelta(seconds=self.config.token_lifetime)
+        )
+        refresh_token = secrets.token_hex(8)
+        self._tokens[access_token] = self._now() + timedelta(
+            seconds=self.config.token_lifetime
+        )
+        self._refresh_tokens.add(refresh_token)
+        return {"access_token": access_token, "refresh_token": refresh_token}
+
+    async def _login(self, request: web.Request) -> web.Response:
+        return await self._respond("login", {"status": "200", **self._issue_tokens()})
+
+    async def _token(self, request: web.Request) -> web.Response:
+        form = await request.post()
+        refresh_token = form.get("refresh_token")
+        if refresh_token not in self._refresh_tokens:
+            self.requests["token"] = self.requests.get("token", 0) + 1
+            return web.Response(status=400, text="AADB2C90080: refresh token expired")
+        # Refresh tokens are rotated
+        self._refresh_tokens.discard(refresh_token)
+        return await self._respond("token", self._issue_tokens())
+
+    def _authorized(self, request: web.Request) -> bool:
+        self._api_requests += 1
+        if self._api_requests in self.config.inject_401:
+            return False
+        token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        expiry = self._tokens.get(token)
+        return expiry is not None and expiry > self._now()
+
+    def _unauthorized(self, endpoint: str) -> web.Response:
+        self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+        return web.Response(status=401)
+
+    async def _site_group(self, request: web.Request) -> web.Response:
+        if not self._authorized(request):
+            return self._unauthorized("SiteGroup")
+        return await self._respond(
+            "SiteGroup",
+            {"sites": [{"siteId": f"site{i}"} for i in range(self.config.site_count)]},
+        )
+
+    async def _site_status(self, request: web.Request) -> web.Response:
+        if not self._authorized(request):
+            return self._unauthorized("siteStatus")
+        if request.query["siteId"] in self.config.fail_status_sites:
+            self.requests["siteStatus"] = self.requests.get("siteStatus", 0) + 1
+            return web.Response(status=500)
+        now = self._now()
+        pv, consumption, battery, grid = _power(now.hour + now.minute / 60)
+        return await self._respond(
+            "siteStatus",
+            {
+                "data": [
+                    {
+                        "siteId": request.query["siteId"],
+                        "state": "Running",
+                        "inverterActivePowerAggAvg": battery,
+                        "meterPvActivePowerAggAvg": pv + self.config.status_pv_bias,
+                        "consumption": consumption,
+                        "bmsSocRawArrayCloudTrimmedAggAvg": 63,
+                        "meterGridActivePowerAggAvg": grid,
+                    }
+                ]
+            },
+        )
+
+    async def _data_summary(self, request: web.Request) -> web.Response:
+        if not self._authorized(request):
+            return self._unauthorized("GetDataSummary")
+
+        from_dt = _parse_utc(request.query["fromDateTime"])
+        to_dt = _parse_utc(request.query["toDateTime"])
+        self.data_summary_windows.append((request.query["siteId"], from_dt, to_dt))
+        to_dt = min(to_dt, self._now())
+        epoch = datetime(1970, 1, 1, tzinfo=timezone.utc)
+        end = epoch + ((from_dt - epoch) // RESOLUTION + 1) * RESOLUTION
+        telemetry = []
+        while end <= to_dt:
+            if end in self.config.drop_buckets:
+                self.config.drop_buckets.discard(end)
+                end += RESOLUTION
+                continue
+            pv, consumption, battery, grid = _power(end.hour + end.minute / 60)
+            telemetry.append(
+                {
+                    "utcEndTime": end.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                    "meterPvActivePowerAggAvgSiteSingle": pv,
+                    "calculatedConsumption": consumption,
+                    "inverterActivePowerAggAvgSiteSum": battery,
+                    "meterGridActivePowerAggAvgSiteSingle": grid,
+                }
+            )
+            end += RESOLUTION
+        return await self._respond("GetDataSummary", {"telemetry": telemetry})